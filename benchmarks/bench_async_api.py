@@ -0,0 +1,63 @@
+""" Throughput of `AsyncHangoutsChatAPI` compared with the synchronous `HangoutsChatAPI`.
+
+Both clients send `get_space` and `create_message` calls to a `FakeChatServer`
+that adds a fixed latency to every response, approximating a round trip to the
+Chat API.
+
+    python benchmarks/bench_async_api.py --requests 500 --latency 0.02
+"""
+import argparse
+import asyncio
+import time
+
+from google.auth.credentials import AnonymousCredentials
+
+from hangouts_helper.api import HangoutsChatAPI
+from hangouts_helper.async_api import AsyncHangoutsChatAPI
+from hangouts_helper.fake_server import FakeChatServer
+
+
+CALLS = {
+    'get_space': lambda api, space, i: api.get_space(space),
+    'create_message': lambda api, space, i: api.create_message(
+        {'text': 'message {}'.format(i)}, space),
+}
+
+
+def run_sync(root_url, call, spaces, count):
+    api = HangoutsChatAPI(credentials=AnonymousCredentials(), root_url=root_url)
+    start = time.perf_counter()
+    for i in range(count):
+        call(api, spaces[i % len(spaces)], i)
+    return time.perf_counter() - start
+
+
+async def run_async(root_url, call, spaces, count, max_connections):
+    async with AsyncHangoutsChatAPI(credentials=AnonymousCredentials(), root_url=root_url,
+                                    max_connections=max_connections) as api:
+        start = time.perf_counter()
+        await asyncio.gather(*[call(api, spaces[i % len(spaces)], i) for i in range(count)])
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--max-connections', type=int, default=100)
+    args = parser.parse_args()
+
+    with FakeChatServer(latency=args.latency) as server:
+        spaces = list(server.state.spaces)
+        for method, call in CALLS.items():
+            sync_elapsed = run_sync(server.root_url, call, spaces, args.requests)
+            async_elapsed = asyncio.run(
+                run_async(server.root_url, call, spaces, args.requests, args.max_connections))
+            for name, elapsed in (('sync', sync_elapsed), ('async', async_elapsed)):
+                print('{:<15} {:<6} {:>8.3f}s {:>10.1f} req/s'.format(
+                    method, name, elapsed, args.requests / elapsed))
+            print('{:<15} speedup {:.1f}x'.format(method, sync_elapsed / async_elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+""" Concurrent event throughput of the ASGI app versus a thread pool of sync handlers.
+
+Each handler waits `--io-ms` on simulated I/O (an API or database call). The
+ASGI app is driven by an in-process client, so no sockets are involved.
+
+    python benchmarks/bench_async_handler.py --events 5000 --concurrency 100 1000 --io-ms 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hangouts_helper.async_handler import AsyncHangoutsChatHandler, HangoutsChatASGIApp
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.message import Message
+
+
+class AsyncBenchmarkHandler(AsyncHangoutsChatHandler):
+    io_seconds = 0.0
+
+    async def handle_message(self, message, event):
+        await asyncio.sleep(self.io_seconds)
+        return Message(text=message['text'])
+
+
+class SyncBenchmarkHandler(HangoutsChatHandler):
+    io_seconds = 0.0
+
+    def handle_message(self, message, event):
+        time.sleep(self.io_seconds)
+        return Message(text=message['text'])
+
+
+def make_bodies(count):
+    return [json.dumps({
+        'type': 'MESSAGE',
+        'space': {'name': 'spaces/{}'.format(i), 'type': 'ROOM'},
+        'message': {'text': str(i)}}).encode('utf-8') for i in range(count)]
+
+
+async def asgi_request(app, body):
+    """ Minimal in-process ASGI client: POSTs `body` and returns the response body. """
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    chunks = []
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            chunks.append(message['body'])
+
+    await app({'type': 'http', 'method': 'POST', 'path': '/', 'headers': []}, receive, send)
+    return b''.join(chunks)
+
+
+def run_asgi(bodies, concurrency, io_seconds):
+    handler = AsyncBenchmarkHandler()
+    handler.io_seconds = io_seconds
+    app = HangoutsChatASGIApp(handler)
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(body):
+            async with semaphore:
+                return await asgi_request(app, body)
+
+        return await asyncio.gather(*[one(body) for body in bodies])
+
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert [json.loads(r)['text'] for r in responses] == [str(i) for i in range(len(bodies))]
+    return len(bodies) / elapsed
+
+
+def run_threads(bodies, concurrency, io_seconds):
+    handler = SyncBenchmarkHandler()
+    handler.io_seconds = io_seconds
+
+    def one(body):
+        return handler.handle_chat_event(json.loads(body)).to_json_bytes()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(one, bodies))
+    elapsed = time.perf_counter() - start
+    assert [json.loads(r)['text'] for r in responses] == [str(i) for i in range(len(bodies))]
+    return len(bodies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--io-ms', type=float, default=20.0)
+    parser.add_argument('--max-threads', type=int, default=200,
+                        help='cap on the thread pool size used for the sync handler')
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.events)
+    io_seconds = args.io_ms / 1000
+    for concurrency in args.concurrency:
+        threads = min(concurrency, args.max_threads)
+        sync = run_threads(bodies, threads, io_seconds)
+        asgi = run_asgi(bodies, concurrency, io_seconds)
+        print('concurrency {:>5}  sync ({:>3} threads) {:>8.0f} events/s  '
+              'asgi {:>8.0f} events/s  ({:.1f}x)'.format(
+                  concurrency, threads, sync, asgi, asgi / sync))
+
+
+if __name__ == '__main__':
+    main()
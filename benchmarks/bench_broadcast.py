@@ -0,0 +1,92 @@
+""" Throughput of broadcasting one announcement to every space.
+
+Sequential `HangoutsChatAPI.create_message` calls are compared with a
+`Broadcast` that sends the pre-serialized body from a thread pool, both
+against a local `FakeChatServer` with per-request latency. The sequential
+run covers a sample of the spaces, as it is slow. The broadcast is then
+interrupted halfway and resumed from its checkpoint, and the server is
+checked for spaces that received the announcement twice.
+
+    python benchmarks/bench_broadcast.py --spaces 10000 --latency 0.005 --concurrency 32
+"""
+import argparse
+import collections
+import os
+import tempfile
+import time
+
+from hangouts_helper.broadcast import Broadcast
+from hangouts_helper.fake_server import FakeChatServer
+from hangouts_helper.message import Card, CardHeader, Message, Section, TextParagraph
+
+
+def announcement():
+    return Message(
+        Card(CardHeader(title='Scheduled maintenance', subtitle='Saturday 02:00-04:00 UTC'),
+             Section(TextParagraph('The deploy pipeline will be unavailable. ' * 5)),
+             Section(TextParagraph('Contact #infra with questions.'))),
+        text='Scheduled maintenance on Saturday')
+
+
+def sequential(server, spaces):
+    api = server.client()
+    start = time.perf_counter()
+    for space in spaces:
+        api.create_message(announcement().output(), space)
+    return time.perf_counter() - start
+
+
+def duplicates(server):
+    counts = collections.Counter(
+        message['space']['name'] for message in server.state.messages.values())
+    return sum(1 for count in counts.values() if count > 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spaces', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds per request')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--sample', type=int, default=500,
+                        help='spaces sent to sequentially')
+    args = parser.parse_args()
+
+    with FakeChatServer(spaces=args.spaces, members_per_space=1,
+                        latency=args.latency) as server:
+        names = list(server.state.spaces)
+        elapsed = sequential(server, names[:args.sample])
+        sequential_rate = args.sample / elapsed
+        server.state.messages.clear()
+
+        api = server.client()
+        report = Broadcast(api, announcement(), concurrency=args.concurrency,
+                           progress=lambda report: None).run(api.iter_spaces(page_size=1000))
+        server.state.messages.clear()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'broadcast.jsonl')
+
+            def interrupt(report):
+                if report.sent >= args.spaces // 2:
+                    broadcast.stop()
+
+            broadcast = Broadcast(api, announcement(), concurrency=args.concurrency,
+                                  checkpoint=path, progress=interrupt, progress_interval=0)
+            first = broadcast.run(names)
+            resumed = Broadcast(api, announcement(), concurrency=args.concurrency,
+                                checkpoint=path, progress=lambda report: None).run(names)
+
+    print('{} spaces, {:.0f} ms latency, concurrency {}'.format(
+        args.spaces, args.latency * 1000, args.concurrency))
+    print('sequential {:>8.1f} spaces/s ({:.0f}s estimated for all)'.format(
+        sequential_rate, args.spaces / sequential_rate))
+    print('broadcast  {:>8.1f} spaces/s ({:.1f}s, {} failed)'.format(
+        report.throughput, report.seconds, report.failed))
+    print('speedup    {:>8.1f}x'.format(report.throughput / sequential_rate))
+    print('resumed: {} sent before interruption, {} skipped and {} sent after, '
+          '{} spaces with duplicates'.format(
+              first.sent, resumed.skipped, resumed.sent, duplicates(server)))
+
+
+if __name__ == '__main__':
+    main()
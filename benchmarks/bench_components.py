@@ -0,0 +1,49 @@
+""" Memory and throughput of building and rendering a card with 10k widgets.
+
+`to_json_bytes()` is timed on fresh messages, since serializing a message
+again reuses the JSON cached by its sections. The memory held by that cache
+is reported separately.
+
+    python benchmarks/bench_components.py --widgets 10000
+"""
+import argparse
+import time
+import tracemalloc
+
+from fixtures import report_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--widgets', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    report_message(widgets=100).to_json_bytes()  # Imports the JSON backend before measuring
+    tracemalloc.start()
+    message = report_message(widgets=args.widgets, sections=100)
+    size, _ = tracemalloc.get_traced_memory()
+    message.to_json_bytes()
+    cached, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('memory      {:>10.1f} KiB  ({:.0f} bytes/widget)'.format(
+        size / 1024, size / args.widgets))
+    print('cached JSON {:>10.1f} KiB  ({:.0f} bytes/widget)'.format(
+        (cached - size) / 1024, (cached - size) / args.widgets))
+
+    messages = [report_message(widgets=args.widgets, sections=100)
+                for _ in range(args.iterations)]
+    for name, func in (
+            ('build', lambda: report_message(widgets=args.widgets, sections=100)),
+            ('output()', message.output),
+            ('to_json_bytes()', lambda: messages.pop().to_json_bytes())):
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            func()
+        elapsed = (time.perf_counter() - start) / args.iterations
+        print('{:<16} {:>8.2f} ms  {:>10.0f} widgets/s'.format(
+            name, elapsed * 1000, args.widgets / elapsed))
+
+
+if __name__ == '__main__':
+    main()
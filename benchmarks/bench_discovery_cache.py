@@ -0,0 +1,65 @@
+""" Construction time of `HangoutsChatAPI` with and without the shared discovery cache.
+
+    python benchmarks/bench_discovery_cache.py --iterations 50
+"""
+import argparse
+import tempfile
+import time
+
+import google_auth_httplib2
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient import discovery
+
+from hangouts_helper import api as api_module
+from hangouts_helper.api import HangoutsChatAPI
+
+
+def time_it(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def uncached():
+    # Behaviour before the cache: build the client, then the resources for a call
+    http = google_auth_httplib2.AuthorizedHttp(AnonymousCredentials())
+    discovery.build('chat', 'v1', http=http).spaces().messages()
+
+
+def cold(cache_dir=None):
+    api_module.clear_service_cache()
+    HangoutsChatAPI(credentials=AnonymousCredentials(), discovery_cache_dir=cache_dir)
+
+
+def warm(cache_dir=None):
+    HangoutsChatAPI(credentials=AnonymousCredentials(), discovery_cache_dir=cache_dir)
+
+
+def time_warm(iterations):
+    warm()  # first construction in the process populates the shared resources
+    return time_it(warm, iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Seed the on-disk cache with the bundled document (no network access needed)
+        api_module.discovery_cache.write_cached_document(
+            cache_dir, api_module.discovery_cache.load_bundled_document())
+        results = [
+            ('discovery.build per instance', time_it(uncached, args.iterations)),
+            ('bundled document, cold', time_it(cold, args.iterations)),
+            ('on-disk cache, cold', time_it(lambda: cold(cache_dir), args.iterations)),
+            ('shared resources, warm', time_warm(args.iterations)),
+        ]
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print('{:<30} {:>9.3f} ms  {:>7.1f}x'.format(name, elapsed * 1000, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+""" Parse-and-dispatch cost of request bodies through `ChatEvent` versus plain dicts.
+
+`dict` decodes each body with `json.loads` and reads fields by indexing the
+event dict, rebuilding the action parameters on every read, as handlers did
+before `ChatEvent`. `ChatEvent` passes the raw body to `handle_chat_event` and
+reads the same fields from the event's cached properties.
+
+    python benchmarks/bench_event.py --events 20000 --reads 3
+"""
+import argparse
+import json
+import time
+from enum import Enum
+
+from hangouts_helper.handler import HangoutsChatHandler, SpaceType
+
+
+class ActionMethod(Enum):
+    ORDER = 'ORDER'
+
+
+def make_bodies(count):
+    bodies = []
+    for i in range(count):
+        event = {
+            'type': 'CARD_CLICKED' if i % 2 else 'MESSAGE',
+            'eventTime': '2018-08-04T01:36:33.832895Z',
+            'space': {'name': 'spaces/{}'.format(i), 'type': 'ROOM', 'displayName': 'Pizza'},
+            'user': {'name': 'users/{}'.format(i), 'displayName': 'Bob', 'type': 'HUMAN'},
+            'message': {'name': 'spaces/{0}/messages/{0}'.format(i), 'text': str(i),
+                        'thread': {'name': 'spaces/{0}/threads/{0}'.format(i)}},
+        }
+        if i % 2:
+            event['action'] = {'actionMethodName': 'ORDER', 'parameters': [
+                {'key': 'id', 'value': str(i)}, {'key': 'size', 'value': 'large'},
+                {'key': 'topping', 'value': 'cheese'}]}
+        bodies.append(json.dumps(event).encode('utf-8'))
+    return bodies
+
+
+class DictHandler(HangoutsChatHandler):
+    ActionMethod = ActionMethod
+    reads = 3
+
+    def handle_message(self, message, event):
+        for _ in range(self.reads):
+            space_type = SpaceType(event['space']['type'])
+            thread = event['message'].get('thread')
+        return (space_type, thread['name'])
+
+    def handle_card_clicked(self, action_method, action_parameters, event):
+        for _ in range(self.reads):
+            parameters = self._parse_action_parameters(event['action']['parameters'])
+            space_type = SpaceType(event['space']['type'])
+        return (space_type, parameters['id'])
+
+
+class ViewHandler(HangoutsChatHandler):
+    ActionMethod = ActionMethod
+    reads = 3
+
+    def handle_message(self, message, event):
+        for _ in range(self.reads):
+            space_type = event.space_type
+            thread = event.thread
+        return (space_type, thread['name'])
+
+    def handle_card_clicked(self, action_method, action_parameters, event):
+        for _ in range(self.reads):
+            parameters = event.action_parameters
+            space_type = event.space_type
+        return (space_type, parameters['id'])
+
+
+def run(handler, bodies, decode):
+    start = time.perf_counter()
+    responses = [handler.handle_chat_event(decode(body)) for body in bodies]
+    elapsed = time.perf_counter() - start
+    return elapsed, responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--reads', type=int, default=3,
+                        help='how many times each handler reads the event fields')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.events)
+    dict_handler = DictHandler()
+    view_handler = ViewHandler()
+    dict_handler.reads = view_handler.reads = args.reads
+    dict_time = min(run(dict_handler, bodies, json.loads)[0] for _ in range(args.repeat))
+    view_time = min(run(view_handler, bodies, bytes)[0] for _ in range(args.repeat))
+    assert run(dict_handler, bodies, json.loads)[1] == run(view_handler, bodies, bytes)[1]
+    for name, elapsed in (('dict', dict_time), ('ChatEvent', view_time)):
+        print('{:<10} {:>7.2f} us/event  {:>9.0f} events/s'.format(
+            name, elapsed / len(bodies) * 1e6, len(bodies) / elapsed))
+    print('speedup    {:.2f}x'.format(dict_time / view_time))
+
+
+if __name__ == '__main__':
+    main()
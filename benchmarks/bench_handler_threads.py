@@ -0,0 +1,94 @@
+""" Multi-threaded dispatch throughput of a shared `HangoutsChatHandler`.
+
+Compares one handler shared by every thread with the per-request handler
+pattern from the README, and checks that every response belongs to its event.
+
+    python benchmarks/bench_handler_threads.py --events 20000 --threads 1 4 16
+"""
+import argparse
+import threading
+import time
+from enum import Enum
+
+from hangouts_helper.handler import HangoutsChatHandler
+
+
+class ActionMethod(Enum):
+    BUTTON_CLICKED = 'BUTTON_CLICKED'
+
+
+class BenchmarkHandler(HangoutsChatHandler):
+    ActionMethod = ActionMethod
+
+    def handle_added_to_space(self, space_type, event):
+        return {'text': event['space']['name']}
+
+    def handle_message(self, message, event):
+        return {'text': message['text']}
+
+    def handle_card_clicked(self, action_method, action_parameters, event):
+        return {'text': action_parameters['id']}
+
+
+def make_events(count):
+    events = []
+    for i in range(count):
+        space = {'name': 'spaces/{}'.format(i), 'type': 'ROOM' if i % 2 else 'DM'}
+        kind = i % 3
+        if kind == 0:
+            events.append({'type': 'MESSAGE', 'space': space, 'message': {'text': str(i)}})
+        elif kind == 1:
+            events.append({'type': 'CARD_CLICKED', 'space': space, 'action': {
+                'actionMethodName': 'BUTTON_CLICKED',
+                'parameters': [{'key': 'id', 'value': str(i)}]}})
+        else:
+            events.append({'type': 'ADDED_TO_SPACE', 'space': space})
+    return events
+
+
+def expected_text(event):
+    if event['type'] == 'MESSAGE':
+        return event['message']['text']
+    if event['type'] == 'CARD_CLICKED':
+        return event['action']['parameters'][0]['value']
+    return event['space']['name']
+
+
+def run(events, thread_count, shared):
+    handler = BenchmarkHandler()
+    chunks = [events[i::thread_count] for i in range(thread_count)]
+    errors = []
+
+    def work(chunk):
+        for event in chunk:
+            h = handler if shared else BenchmarkHandler()
+            if h.handle_chat_event(event)['text'] != expected_text(event):
+                errors.append(event)
+
+    threads = [threading.Thread(target=work, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert not errors, 'responses were mixed up between events'
+    return len(events) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    for thread_count in args.threads:
+        per_request = run(events, thread_count, shared=False)
+        shared = run(events, thread_count, shared=True)
+        print('{:>3} threads  per-request {:>10.0f} events/s  shared {:>10.0f} events/s'.format(
+            thread_count, per_request, shared))
+
+
+if __name__ == '__main__':
+    main()
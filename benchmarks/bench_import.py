@@ -0,0 +1,55 @@
+""" Import time of hangouts_helper modules, with a regression threshold.
+
+Each statement runs in a fresh interpreter with `-X importtime`; the reported
+time is the cumulative import time of the top-level hangouts_helper modules
+(best of `--repeat` runs). Exits with status 1 if any statement exceeds
+`--max-ms`.
+
+    python benchmarks/bench_import.py --max-ms 50
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+STATEMENTS = [
+    'import hangouts_helper',
+    'from hangouts_helper.message import Message',
+    'from hangouts_helper.handler import HangoutsChatHandler',
+    'from hangouts_helper.api import HangoutsChatAPI',
+]
+
+IMPORT_TIME = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def import_time_us(statement):
+    """ Cumulative microseconds spent importing hangouts_helper modules for `statement`. """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            stderr=subprocess.PIPE, check=True).stderr.decode('utf-8')
+    total = 0
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        # Only count top-level entries; nested ones are included in their parent's time
+        if match and match.group(3).startswith('hangouts_helper') and len(match.group(2)) == 1:
+            total += int(match.group(1))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=50.0,
+                        help='fail if any statement takes longer than this to import')
+    args = parser.parse_args()
+
+    failed = False
+    for statement in STATEMENTS:
+        elapsed_ms = min(import_time_us(statement) for _ in range(args.repeat)) / 1000
+        over = elapsed_ms > args.max_ms
+        failed = failed or over
+        print('{:<60} {:>8.1f} ms{}'.format(statement, elapsed_ms, '  REGRESSION' if over else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+""" `Message.to_json_bytes()` compared with serializing `Message.output()`.
+
+    python benchmarks/bench_json.py --iterations 2000
+"""
+import argparse
+import json
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from fixtures import pizza_message, report_message
+
+
+def time_it(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, message, iterations in (
+            ('pizza card', pizza_message(), args.iterations),
+            ('1k-widget report', report_message(), max(1, args.iterations // 100))):
+        results = [
+            ('json.dumps(output())',
+             lambda: json.dumps(message.output(), separators=(',', ':')).encode('utf-8')),
+            ('to_json_bytes()', message.to_json_bytes),
+        ]
+        if orjson is not None:
+            results.insert(1, ('orjson.dumps(output())', lambda: orjson.dumps(message.output())))
+        baseline = None
+        for label, func in results:
+            elapsed = time_it(func, iterations)
+            baseline = baseline or elapsed
+            print('{:<18} {:<24} {:>10.1f} us  {:>5.2f}x'.format(
+                name, label, elapsed * 1e6, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
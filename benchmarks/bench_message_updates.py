@@ -0,0 +1,83 @@
+""" Bytes sent and API calls made by a bot that keeps updating progress cards.
+
+Several deployments report progress on their own card once per tick. The
+percentage changes only every few ticks, and the header text only when a
+deployment finishes. Sending every tick with `HangoutsChatAPI.update_message`
+is compared with `MessageUpdater`, which skips unchanged updates and sends
+only changed fields. Both run against a local `FakeChatServer`, and request
+body sizes are taken from the instrumentation payload histogram.
+
+    python benchmarks/bench_message_updates.py --messages 20 --ticks 200 --step 5
+"""
+import argparse
+import time
+
+from hangouts_helper import instrumentation
+from hangouts_helper.fake_server import FakeChatServer
+from hangouts_helper.message import Card, CardHeader, KeyValue, Message, Section, TextParagraph
+from hangouts_helper.updates import MessageUpdater
+
+
+def progress_card(deployment, percent):
+    done = percent >= 100
+    text = 'Deployment {} {}'.format(deployment, 'finished' if done else 'running')
+    card = Card(
+        CardHeader(title='Deployment {}'.format(deployment), subtitle='production'),
+        Section(
+            KeyValue(top_label='Progress', content='{}%'.format(percent)),
+            KeyValue(top_label='Status', content='Done' if done else 'Rolling out'),
+            TextParagraph('Steps: build, test, canary, rollout, verify')))
+    return Message(card, text=text)
+
+
+def percent_at(tick, ticks, step):
+    # The reported percentage advances in `step` sized increments
+    return min(100, (tick * 100 // ticks) // step * step)
+
+
+def run(server, messages, ticks, step, diff):
+    api = server.client()
+    updater = MessageUpdater(api) if diff else None
+    space = next(iter(server.state.spaces))
+    names = [api.create_message(progress_card(i, 0).output(), space)['name']
+             for i in range(messages)]
+    before = dict(server.request_counts)
+    instruments = instrumentation.enable()
+    start = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        for i, name in enumerate(names):
+            message = progress_card(i, percent_at(tick, ticks, step))
+            if diff:
+                updater.update_message(name, message)
+            else:
+                api.update_message(name, message.output())
+    elapsed = time.perf_counter() - start
+    instrumentation.disable()
+    calls = server.request_counts.get('PUT', 0) - before.get('PUT', 0)
+    sent = instruments.registry.payload_bytes.sum(('api_request',))
+    return calls, sent, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--step', type=int, default=5, help='percentage points per change')
+    args = parser.parse_args()
+
+    updates = args.messages * args.ticks
+    with FakeChatServer(spaces=1) as server:
+        full_calls, full_bytes, full_time = run(
+            server, args.messages, args.ticks, args.step, diff=False)
+        diff_calls, diff_bytes, diff_time = run(
+            server, args.messages, args.ticks, args.step, diff=True)
+    print('{} updates of {} messages'.format(updates, args.messages))
+    for label, calls, sent, elapsed in (('full', full_calls, full_bytes, full_time),
+                                        ('diff', diff_calls, diff_bytes, diff_time)):
+        print('{:<5} {:>7} calls {:>11,.0f} bytes {:>8.2f}s'.format(label, calls, sent, elapsed))
+    print('calls avoided {:.1%}, bytes saved {:.1%}, {:.1f}x faster'.format(
+        1 - diff_calls / full_calls, 1 - diff_bytes / full_bytes, full_time / diff_time))
+
+
+if __name__ == '__main__':
+    main()
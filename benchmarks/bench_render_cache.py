@@ -0,0 +1,72 @@
+""" Re-rendering a long-lived 50-section card after changing a single widget.
+
+A bot keeps one card and changes the content of one `KeyValue` between
+sends. With cached serialization, `to_json_bytes()` serializes only the
+changed section again and joins it with the cached bytes of the others. This
+is compared with a full serialization of the same card, timed on fresh copies
+of the card built beforehand, which is what every send cost before the JSON
+of unchanged sections was cached.
+
+    python benchmarks/bench_render_cache.py --sections 50 --widgets 10 --iterations 2000
+"""
+import argparse
+import json
+import time
+
+from hangouts_helper.message import (ButtonList, Card, CardHeader, KeyValue, Message, Section,
+    TextButton, TextParagraph)
+
+
+def status_card(sections, widgets):
+    """ Returns the message and the `KeyValue` holding the status of each section. """
+    card = Card(CardHeader(title='Fleet status', subtitle='status@example.com'))
+    statuses = []
+    for s in range(sections):
+        status = KeyValue(top_label='Status', content='OK')
+        section = Section('Service {}'.format(s), status)
+        for w in range(widgets - 2):
+            section.add_widget(KeyValue(top_label='Metric {}'.format(w), content=str(w)))
+        section.add_widget(ButtonList(TextButton('Details').add_link(
+            'https://example.com/services/{}'.format(s))))
+        card.add_section(section)
+        statuses.append(status)
+    card.add_section(Section(TextParagraph('Updated every minute')))
+    return Message(card, text='Fleet status'), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=50)
+    parser.add_argument('--widgets', type=int, default=10, help='widgets per section')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    copies = max(1, args.iterations // 10)
+    cards = [status_card(args.sections, args.widgets) for _ in range(copies)]
+    start = time.perf_counter()
+    for i, (message, statuses) in enumerate(cards):
+        statuses[i % args.sections].content = 'Degraded {}'.format(i)
+        message.to_json_bytes()
+    full = (time.perf_counter() - start) / copies
+
+    message, statuses = status_card(args.sections, args.widgets)
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        statuses[i % args.sections].content = 'Degraded {}'.format(i)
+        message.to_json_bytes()
+    cached = (time.perf_counter() - start) / args.iterations
+
+    for status in statuses:
+        status.content = 'OK'
+    # The cache never returned a stale section
+    assert json.loads(message.to_json_bytes()) == message.output()
+
+    print('{} sections of {} widgets, one widget changed per send'.format(
+        args.sections, args.widgets))
+    print('full serialization   {:>9.1f} us'.format(full * 1e6))
+    print('cached serialization {:>9.1f} us'.format(cached * 1e6))
+    print('speedup              {:>9.1f}x'.format(full / cached))
+
+
+if __name__ == '__main__':
+    main()
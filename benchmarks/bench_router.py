@@ -0,0 +1,100 @@
+""" Command dispatch cost with many registered commands.
+
+Compares `CommandRouter` with the usual hand-written `handle_message` that
+checks `startswith` for each command and then tries each regex in turn.
+Messages are spread evenly over the registered commands and patterns, plus a
+share that matches nothing.
+
+    python benchmarks/bench_router.py --commands 10 100 500 --patterns 50
+"""
+import argparse
+import random
+import re
+import time
+
+from hangouts_helper.router import CommandRouter, command_text
+
+
+def make_router(commands, patterns):
+    router = CommandRouter()
+    for name in commands:
+        router.command(name)(lambda self, event, *args, _name=name: (_name, args))
+    for pattern in patterns:
+        router.pattern(pattern)(lambda self, event, *args, _pattern=pattern: (_pattern, args))
+    return router
+
+
+def make_linear(commands, patterns):
+    compiled = [(pattern, re.compile(pattern, re.IGNORECASE)) for pattern in patterns]
+    # Longest first, so 'order pizza' is checked before 'order'
+    ordered = sorted(commands, key=len, reverse=True)
+
+    def handle_message(message):
+        text = command_text(message)
+        lowered = text.lower()
+        for name in ordered:
+            if lowered == name or lowered.startswith(name + ' '):
+                return (name, tuple(text[len(name):].split()))
+        for pattern, regex in compiled:
+            match = regex.fullmatch(text)
+            if match:
+                return (pattern, match.groups())
+        return None
+    return handle_message
+
+
+def make_messages(commands, patterns, count):
+    rng = random.Random(42)
+    messages = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.7:
+            text = '{} arg{} other'.format(rng.choice(commands), i)
+        elif kind < 0.9 and patterns:
+            index = rng.randrange(len(patterns))
+            text = 'job{} run {}'.format(index, i)
+        else:
+            text = 'nothing matches {}'.format(i)
+        messages.append({'text': '@bot ' + text, 'argumentText': ' ' + text})
+    return messages
+
+
+def measure(func, messages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            func(message)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--patterns', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for command_count in args.commands:
+        commands = ['cmd{} sub{}'.format(i, i % 7) if i % 3 == 0 else 'cmd{}'.format(i)
+                    for i in range(command_count)]
+        patterns = [r'job{} run (\d+)'.format(i) for i in range(args.patterns)]
+        messages = make_messages(commands, patterns, args.messages)
+        router = make_router(commands, patterns)
+        linear = make_linear(commands, patterns)
+
+        def routed(message):
+            match = router.match(message)
+            return match.dispatch(None, None) if match is not None else None
+
+        router_us = measure(routed, messages, args.repeat)
+        linear_us = measure(linear, messages, args.repeat)
+        print('{:>5} commands + {} patterns  linear {:>7.2f} us/msg  router {:>6.2f} us/msg  '
+              '({:.1f}x)'.format(command_count, len(patterns), linear_us, router_us,
+                                 linear_us / router_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+""" Rendering a compiled `MessageTemplate` compared with `Message.output()`.
+
+`output()` is timed on a prebuilt message and including building the message,
+as a bot does for every response.
+
+    python benchmarks/bench_template.py --iterations 2000
+"""
+import argparse
+import time
+
+from hangouts_helper.template import Placeholder
+
+from fixtures import pizza_message, report_message
+
+
+def time_it(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    pizza = pizza_message(
+        Placeholder('order'), Placeholder('status'), Placeholder('url')).compile()
+    report = report_message(value=lambda i: Placeholder('v{}'.format(i))).compile()
+    report_values = {name: 'value' for name in report.placeholders}
+
+    prebuilt_pizza = pizza_message()
+    prebuilt_report = report_message()
+    cases = [
+        ('pizza card', args.iterations,
+         lambda i: prebuilt_pizza.output(),
+         lambda i: pizza_message(str(i), 'In Delivery', 'https://example.com').output(),
+         lambda i: pizza.render(order=str(i), status='In Delivery', url='https://example.com')),
+        ('1k-widget report', max(1, args.iterations // 100),
+         lambda i: prebuilt_report.output(),
+         lambda i: report_message().output(),
+         lambda i: report.render(**report_values)),
+    ]
+    print('{:<18} {:>12} {:>16} {:>12}'.format('', 'output()', 'build+output()', 'template'))
+    for name, iterations, output, build_output, render in cases:
+        output_time = time_it(output, iterations)
+        build_time = time_it(build_output, iterations)
+        render_time = time_it(render, iterations)
+        print('{:<18} {:>9.1f} us {:>13.1f} us {:>9.1f} us  ({:.1f}x faster than output())'.format(
+            name, output_time * 1e6, build_time * 1e6, render_time * 1e6,
+            output_time / render_time))
+
+
+if __name__ == '__main__':
+    main()
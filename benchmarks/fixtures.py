@@ -0,0 +1,62 @@
+""" Message and event fixtures shared by the benchmarks. """
+import json
+from enum import Enum
+
+from hangouts_helper.message import (Message, Card, CardHeader, Section, Image, KeyValue,
+    ButtonList, TextButton, ImageButton, TextParagraph, Icon)
+from hangouts_helper.replay import synthetic_events
+
+
+class ActionMethod(Enum):
+    OPEN_ORDER = 'OPEN_ORDER'
+    SHOW_DETAILS = 'SHOW_DETAILS'
+
+
+def pizza_message(order='12345', status='In Delivery', url='https://example.com/orders/...'):
+    """ The Pizza Bot card from the README. """
+    return Message(
+        Card(
+            CardHeader(
+                title='Pizza Bot Customer Support',
+                subtitle='pizzabot@example.com',
+                image_url='https://goo.gl/aeDtrS'),
+            Section(
+                KeyValue(top_label='Order No.', content=order),
+                KeyValue(top_label='Status', content=status)),
+            Section(
+                'Location',
+                Image(image_url='https://maps.googleapis.com/...')),
+            Section(
+                ButtonList(
+                    TextButton(text='OPEN ORDER').add_link(url=url)))))
+
+
+def report_message(widgets=1000, sections=10, value=lambda i: str(i)):
+    """ A report card with `widgets` widgets spread over `sections` sections. """
+    card = Card(CardHeader(title='Daily report', subtitle='reports@example.com'))
+    per_section = max(1, widgets // sections)
+    for s in range(sections):
+        section = Section('Section {}'.format(s))
+        for w in range(per_section):
+            i = s * per_section + w
+            kind = i % 4
+            if kind == 0:
+                section.add_widget(KeyValue(top_label='Metric {}'.format(i), content=value(i),
+                                            icon=Icon.STAR))
+            elif kind == 1:
+                section.add_widget(TextParagraph('<b>Row {}</b> {}'.format(i, value(i))))
+            elif kind == 2:
+                section.add_widget(ButtonList(
+                    TextButton('Details').add_action(ActionMethod.SHOW_DETAILS, {'row': value(i)}),
+                    ImageButton(icon=Icon.DESCRIPTION).add_link(
+                        'https://example.com/' + value(i))))
+            else:
+                section.add_widget(Image('https://example.com/{}.png'.format(value(i))))
+        card.add_section(section)
+    return Message(card, text='Report')
+
+
+def mixed_events(count=1000, seed=0):
+    """ `replay.synthetic_events` as dicts, with card clicks on `ActionMethod.SHOW_DETAILS`. """
+    return [json.loads(body)
+            for body in synthetic_events(count, seed, [ActionMethod.SHOW_DETAILS.value])]
@@ -0,0 +1,269 @@
+""" Regression benchmark suite for rendering, event dispatch and API pagination.
+
+`run` times every case and writes the results as JSON; `compare` checks a run
+against a baseline and exits with status 1 if any case got slower by more
+than the threshold.
+
+    python benchmarks/suite.py run --output baseline.json
+    python benchmarks/suite.py run --output current.json --compare baseline.json
+    python benchmarks/suite.py compare baseline.json current.json --threshold 0.15
+
+Rendering cases use the README pizza card and a 1k-widget report, dispatch
+cases a mixed stream of events, and API cases page through spaces and
+memberships served by an in-process `FakeChatServer`.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from collections import OrderedDict
+
+from fixtures import ActionMethod, mixed_events, pizza_message, report_message
+from hangouts_helper.fake_server import FakeChatServer
+
+CASES = OrderedDict()
+
+
+def case(name, group):
+    """ Registers a case. The decorated function sets up and returns `(func, ops)`. """
+    def decorator(setup):
+        CASES[name] = (group, setup)
+        return setup
+    return decorator
+
+
+@case('render.pizza.output', 'render')
+def render_pizza_output():
+    return pizza_message().output, 1
+
+
+@case('render.pizza.build_to_json_bytes', 'render')
+def render_pizza_build_json():
+    # Serializing a prebuilt message reuses its cached JSON, so build a new one each time
+    return lambda: pizza_message().to_json_bytes(), 1
+
+
+@case('render.report_1k.output', 'render')
+def render_report_output():
+    return report_message(widgets=1000).output, 1
+
+
+@case('render.report_1k.build_to_json_bytes', 'render')
+def render_report_build_json():
+    return lambda: report_message(widgets=1000).to_json_bytes(), 1
+
+
+@case('render.report_1k.build', 'render')
+def render_report_build():
+    return lambda: report_message(widgets=1000), 1
+
+
+@case('render.report_1k.build_output', 'render')
+def render_report_build_output():
+    return lambda: report_message(widgets=1000).output(), 1
+
+
+def _handler():
+    from hangouts_helper.handler import HangoutsChatHandler
+    from hangouts_helper.message import Message
+
+    class BenchmarkHandler(HangoutsChatHandler):
+        def handle_added_to_space(self, space_type, event):
+            return Message(text='Thanks for adding me!')
+
+        def handle_message(self, message, event):
+            return pizza_message(order=message['argumentText'].split()[-1])
+
+        def handle_card_clicked(self, action_method, action_parameters, event):
+            return Message(text='Row {}'.format(action_parameters['row']))
+
+    BenchmarkHandler.ActionMethod = ActionMethod
+    return BenchmarkHandler()
+
+
+@case('dispatch.mixed_1k.dict', 'dispatch')
+def dispatch_dicts():
+    handler = _handler()
+    events = mixed_events(1000)
+
+    def run():
+        for event in events:
+            handler.handle_chat_event(event)
+    return run, len(events)
+
+
+@case('dispatch.mixed_1k.bytes_to_json', 'dispatch')
+def dispatch_bytes():
+    handler = _handler()
+    bodies = [json.dumps(event).encode('utf-8') for event in mixed_events(1000)]
+
+    def run():
+        for body in bodies:
+            response = handler.handle_chat_event(body)
+            if response is not None:
+                response.to_json_bytes()
+    return run, len(bodies)
+
+
+_server = None
+
+
+def _api(space_count=1000, members_per_space=500):
+    """ Returns a client for a fake server that is started on first use. """
+    global _server
+    if _server is None:
+        _server = FakeChatServer(spaces=space_count, members_per_space=members_per_space)
+        _server.start()
+    return _server.client()
+
+
+def _room():
+    return next(name for name, space in _server.state.spaces.items() if space['type'] == 'ROOM')
+
+
+@case('api.list_spaces_1k.page_100', 'api')
+def api_list_spaces():
+    api = _api()
+    return lambda: api.list_spaces(page_size=100), 1000
+
+
+@case('api.list_spaces_1k.page_100.no_prefetch', 'api')
+def api_list_spaces_sequential():
+    api = _api()
+    return lambda: list(api.iter_spaces(page_size=100, prefetch=False)), 1000
+
+
+@case('api.list_memberships_500.page_50', 'api')
+def api_list_memberships():
+    api = _api()
+    space = _room()
+    return lambda: api.list_memberships(space, page_size=50), 500
+
+
+@case('api.list_memberships_500.page_50.fields', 'api')
+def api_list_memberships_fields():
+    api = _api()
+    space = _room()
+    return lambda: api.list_memberships(space, page_size=50, fields=['name']), 500
+
+
+def measure(func, ops, repeat, min_time):
+    """ Times `func` `repeat` times (looping each sample for at least `min_time` seconds). """
+    func()  # Warm up caches and lazy imports
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops)
+    return {
+        'min': min(samples) / ops,
+        'median': statistics.median(samples) / ops,
+        'stdev': statistics.pstdev(samples) / ops,
+        'ops': ops,
+        'loops': loops,
+        'repeat': repeat,
+    }
+
+
+def run(args):
+    results = OrderedDict()
+    for name, (group, setup) in CASES.items():
+        if args.group and group not in args.group:
+            continue
+        if args.filter and args.filter not in name:
+            continue
+        func, ops = setup()
+        results[name] = measure(func, ops, args.repeat, args.min_time)
+        print('{:<44} {:>12.2f} us/op  (median {:.2f})'.format(
+            name, results[name]['min'] * 1e6, results[name]['median'] * 1e6))
+    if _server is not None:
+        _server.stop()
+    data = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'unit': 'seconds per op',
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        return report(compare(baseline, data, args.threshold, args.metric), args.threshold)
+    return 0
+
+
+def compare(baseline, current, threshold, metric='min'):
+    """ Returns `(name, baseline, current, change, regressed)` for cases in both runs. """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result[metric] / before[metric] - 1
+        rows.append((name, before[metric], result[metric], change, change > threshold))
+    return rows
+
+
+def report(rows, threshold):
+    for name, before, after, change, regressed in rows:
+        print('{:<44} {:>10.2f} -> {:>10.2f} us/op  {:>+7.1%}{}'.format(
+            name, before * 1e6, after * 1e6, change, '  REGRESSION' if regressed else ''))
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print('{} case(s) slower by more than {:.0%}'.format(len(regressions), threshold))
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--output', help='write results to this JSON file')
+    run_parser.add_argument('--compare', help='baseline JSON file to compare against')
+    run_parser.add_argument('--group', action='append', choices=['render', 'dispatch', 'api'])
+    run_parser.add_argument('--filter', help='only run cases whose name contains this')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--min-time', type=float, default=0.1,
+                            help='minimum seconds per sample')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--threshold', type=float, default=0.10,
+                         help='allowed slowdown as a fraction (default 0.10)')
+        sub.add_argument('--metric', choices=['min', 'median'], default='min')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        return run(args)
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.current) as fp:
+        current = json.load(fp)
+    return report(compare(baseline, current, args.threshold, args.metric), args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,6 +9,11 @@ INSTALL_REQUIRES = [
     'setuptools'
 ]
 
+EXTRAS_REQUIRE = {
+    'async': ['aiohttp'],
+    'json': ['orjson']
+}
+
 
 setup(
     name='hangouts-helper',
@@ -23,7 +28,9 @@ setup(
     license='MIT',
     package_dir={'': 'src'},
     packages=find_packages('src'),
+    python_requires='>=3.7',
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     zip_safe=False,
     classifiers=[
         'Environment :: Web Environment',
@@ -31,9 +38,10 @@ setup(
         'Operating System :: OS Independent',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7'
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11'
     ]
 )
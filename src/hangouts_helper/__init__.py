@@ -1,4 +1,24 @@
-from . import message, handler
-from .version import __version__
+import importlib
 
 __all__ = ['message', 'handler', '__version__']
+
+# Submodules (and the version lookup) are loaded on first attribute access so
+# that `import hangouts_helper` stays cheap.
+_LAZY_SUBMODULES = frozenset([
+    'actions', 'api', 'async_api', 'async_handler', 'broadcast', 'cache', 'dedup', 'deferred',
+    'discovery_cache', 'event', 'fake_server', 'handler', 'instrumentation', 'message',
+    'replay', 'router', 'scheduler', 'template', 'tokens', 'updates',
+    'version'])
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name == '__version__':
+        from .version import __version__
+        return __version__
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | _LAZY_SUBMODULES | {'__version__'})
@@ -0,0 +1,164 @@
+""" Card action registry with typed parameters.
+
+Actions are registered with a decorator that declares a converter for each
+parameter. The same `Action` encodes parameters for `OnClickMixin.add_action`
+when a card is built and decodes them when the card is clicked, so values
+round-trip with their types.
+
+    class PizzaHandler(HangoutsChatHandler):
+        actions = ActionRegistry()
+
+        @actions.action('ORDER', size=Size, count=int, toppings=JSON)
+        def order(self, event, size, count, toppings=()):
+            ...
+
+    order = PizzaHandler.actions['ORDER']
+    order.attach(TextButton('Order'), size=Size.LARGE, count=2, toppings=['ham'])
+"""
+import json
+from enum import Enum
+
+
+class Converter:
+    """ Encodes a parameter value to the string sent in a card and decodes it back. """
+    __slots__ = ('name', 'encode', 'decode')
+
+    def __init__(self, name, encode, decode):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self):
+        return 'Converter({!r})'.format(self.name)
+
+
+def _decode_bool(value):
+    if value == 'true':
+        return True
+    if value == 'false':
+        return False
+    raise ValueError('Invalid boolean parameter: {!r}'.format(value))
+
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+STRING = Converter('str', str, str)
+INTEGER = Converter('int', lambda value: str(int(value)), int)
+FLOAT = Converter('float', lambda value: repr(float(value)), float)
+BOOLEAN = Converter('bool', lambda value: 'true' if value else 'false', _decode_bool)
+JSON = Converter('json', _json_encoder.encode, json.loads)
+
+_CONVERTERS = {str: STRING, int: INTEGER, float: FLOAT, bool: BOOLEAN}
+
+
+def enum_converter(enum):
+    """ Returns a converter that sends an `Enum` member as its value. """
+    members = {str(member.value): member for member in enum}
+
+    def decode(value):
+        try:
+            return members[value]
+        except KeyError:
+            raise ValueError('{!r} is not a valid {}'.format(value, enum.__name__)) from None
+
+    def encode(value):
+        return str(enum(value).value)
+
+    return Converter(enum.__name__, encode, decode)
+
+
+def get_converter(spec):
+    """ Returns the `Converter` for a `Converter`, `str`, `int`, `float`, `bool` or `Enum`. """
+    if isinstance(spec, Converter):
+        return spec
+    if spec in _CONVERTERS:
+        return _CONVERTERS[spec]
+    if isinstance(spec, type) and issubclass(spec, Enum):
+        return enum_converter(spec)
+    raise TypeError('No parameter converter for {!r}'.format(spec))
+
+
+class Action:
+    """ A registered card action.
+
+    `value` is the `actionMethodName` sent with the card, so an `Action` can be
+    passed to `OnClickMixin.add_action` in place of an `ActionMethod` member.
+    Parameters without a declared converter are sent and received as strings.
+    """
+    __slots__ = ('value', 'func', 'converters')
+
+    def __init__(self, value, func, converters):
+        self.value = value
+        self.func = func
+        self.converters = converters
+
+    def __repr__(self):
+        return 'Action({!r})'.format(self.value)
+
+    def encode(self, **values):
+        """ Returns the string parameters for `values`, e.g. for `add_action`. """
+        converters = self.converters
+        parameters = {}
+        for key, value in values.items():
+            converter = converters.get(key)
+            parameters[key] = converter.encode(value) if converter is not None else str(value)
+        return parameters
+
+    def decode(self, parameters):
+        """ Decodes a dict of string parameters into typed values. """
+        converters = self.converters
+        values = {}
+        for key, value in parameters.items():
+            converter = converters.get(key)
+            values[key] = converter.decode(value) if converter is not None else value
+        return values
+
+    def attach(self, widget, **values):
+        """ Makes clicking `widget` call this action with `values`. Returns the widget. """
+        return widget.add_action(self, self.encode(**values) or None)
+
+    def dispatch(self, handler, event):
+        """ Calls the action's function for a `ChatEvent`. """
+        return self.func(handler, event, **self.decode(event.action_parameters))
+
+
+class ActionRegistry:
+    """ Maps `actionMethodName` values to functions registered with `action`. """
+
+    def __init__(self):
+        self._actions = {}
+
+    def __len__(self):
+        return len(self._actions)
+
+    def __iter__(self):
+        return iter(self._actions)
+
+    def __contains__(self, name):
+        return self._name(name) in self._actions
+
+    def __getitem__(self, name):
+        return self._actions[self._name(name)]
+
+    def get(self, name, default=None):
+        return self._actions.get(self._name(name), default)
+
+    @staticmethod
+    def _name(name):
+        return name.value if isinstance(name, Enum) else name
+
+    def action(self, name, **parameters):
+        """ Registers the decorated function for the action `name` (a string or `Enum` member).
+
+        Keyword arguments declare the type of each parameter. The function is
+        called as `func(handler, event, **parameters)`.
+        """
+        name = self._name(name)
+        converters = {key: get_converter(spec) for key, spec in parameters.items()}
+
+        def decorator(func):
+            if name in self._actions:
+                raise ValueError('Action {!r} is already registered'.format(name))
+            self._actions[name] = Action(name, func, converters)
+            return func
+        return decorator
@@ -1,75 +1,358 @@
+import copy
 import json
 import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-import google.auth
-import google_auth_httplib2
-from google.oauth2 import service_account
-from googleapiclient import discovery
+from . import discovery_cache, instrumentation
+
+# google.auth, googleapiclient and httplib2 are imported when a client is first
+# created rather than at import time, as they are slow to import.
+
+
+GOOGLE_CHAT_SCOPES = ['https://www.googleapis.com/auth/chat.bot']
+BATCH_LIMIT = 100  # Maximum number of calls in one batch request
+DEFAULT_UPDATE_MASK = 'text,cards'
+# Overrides the API root URL of clients created without one, e.g. to use a FakeChatServer
+ROOT_URL_ENVIRONMENT_VARIABLE = 'HANGOUTS_CHAT_ROOT_URL'
+
+_service_cache = {}
+_service_cache_lock = threading.Lock()
+
+
+def get_credentials(service_account_info=None, service_account_file=None, scopes=None):
+    import google.auth
+    from google.oauth2 import service_account
+
+    if scopes is None:
+        scopes = GOOGLE_CHAT_SCOPES
+    if service_account_info is not None:
+        creds = service_account.Credentials.from_service_account_info(
+            service_account_info, scopes=scopes)
+    elif service_account_file is not None:
+        creds = service_account.Credentials.from_service_account_file(
+            service_account_file, scopes=scopes)
+    else:
+        creds, _ = google.auth.default(scopes=scopes)
+    return creds
+
+
+def _stub_schema(name, schema):
+    stub = {'id': name, 'type': 'object'}
+    token = schema.get('properties', {}).get('nextPageToken')
+    if token is not None:  # Adds the list_next methods
+        stub['properties'] = {'nextPageToken': token}
+    return stub
+
+
+def _without_schemas(document):
+    # googleapiclient mostly uses the schemas to write method docstrings, and
+    # pretty-printing the large Message schema is most of the build time.
+    # Request and response bodies are plain JSON either way.
+    schemas = document.get('schemas', {})
+    return dict(document, schemas={
+        name: _stub_schema(name, schema) for name, schema in schemas.items()})
+
+
+class _ChatService:
+    """ Discovery-built resources shared by every `HangoutsChatAPI` in the process.
+
+    Building a resource from the discovery document is expensive, so this is
+    done once per document source and root URL, from a copy of the document
+    without schemas. The resources are built without credentials; requests
+    are executed with each client's own authorized http object.
+    """
+
+    def __init__(self, document):
+        import httplib2
+        from googleapiclient import discovery
+
+        self.document = document
+        self.build_document = _without_schemas(document)
+        self.api = discovery.build_from_document(self.build_document, http=httplib2.Http())
+        self.spaces = self.api.spaces()
+        self.members = self.spaces.members()
+        self.messages = self.spaces.messages()
+
+    @classmethod
+    def get(cls, root_url=None, discovery_cache_dir=None):
+        key = (root_url, discovery_cache_dir)
+        service = _service_cache.get(key)
+        if service is None:
+            with _service_cache_lock:
+                service = _service_cache.get(key)
+                if service is None:
+                    document = discovery_cache.load_document(discovery_cache_dir)
+                    if root_url is not None:
+                        document = dict(document, rootUrl=root_url)
+                        document.pop('mtlsRootUrl', None)
+                    service = _service_cache[key] = cls(document)
+        return service
+
+
+def clear_service_cache():
+    with _service_cache_lock:
+        _service_cache.clear()
+
+
+class BatchResult(namedtuple('BatchResult', ['request_id', 'response', 'exception'])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+
+class BatchError(Exception):
+    """ Raised when a batch request fails before all of a `MessageBatch` was sent.
+
+    `results` holds the `BatchResult` of each call sent before the failure,
+    and None for the calls of the failed request and those never sent.
+    """
+
+    def __init__(self, error, results):
+        super().__init__(error)
+        self.error = error
+        self.results = results
+
+
+class MessageBatch:
+    """ Collects message calls and sends them as multipart batch requests.
+
+    Each call returns a request id (its position in the batch). `execute()`
+    sends at most `batch_size` calls per HTTP request, splitting larger batches
+    automatically, and returns one `BatchResult` per call in the order added.
+    The calls are removed from the batch when `execute()` starts, so executing
+    it again after a `BatchError` never sends a call twice.
+    """
+
+    def __init__(self, api, batch_size=BATCH_LIMIT):
+        if not 0 < batch_size <= BATCH_LIMIT:
+            raise ValueError('batch_size must be between 1 and {}'.format(BATCH_LIMIT))
+        self._api = api
+        self.batch_size = batch_size
+        self._requests = []
+
+    def __len__(self):
+        return len(self._requests)
+
+    def _add(self, request):
+        self._requests.append(request)
+        return len(self._requests) - 1
+
+    def create_message(self, message, space_name, thread_id=None, thread_key=None,
+                       request_id=None):
+        if thread_id is not None:
+            message['thread'] = thread_id
+        return self._add(self._api._service.messages.create(
+            parent=space_name, body=message, threadKey=thread_key, requestId=request_id))
+
+    def update_message(self, name, message, update_mask=DEFAULT_UPDATE_MASK):
+        return self._add(self._api._service.messages.update(
+            name=name, body=message, updateMask=update_mask))
+
+    def delete_message(self, name):
+        return self._add(self._api._service.messages.delete(name=name))
+
+    def execute(self):
+        requests, self._requests = self._requests, []
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            results[index] = BatchResult(index, response, exception)
+
+        for start in range(0, len(requests), self.batch_size):
+            batch = self._api._service.api.new_batch_http_request(callback=callback)
+            for index in range(start, min(start + self.batch_size, len(requests))):
+                batch.add(requests[index], request_id=str(index))
+            try:
+                instruments = instrumentation.active
+                if instruments is None:
+                    batch.execute(http=self._api.http)
+                else:
+                    with instruments.api_call('chat.batch'):
+                        batch.execute(http=self._api.http)
+            except Exception as e:
+                raise BatchError(e, results) from e
+        return results
 
 
 class HangoutsChatAPI:
-    GOOGLE_CHAT_SCOPES = ['https://www.googleapis.com/auth/chat.bot']
-
-    def __init__(self, service_account_info=None, service_account_file=None):
-        self.api = self._initialize_api(
-            service_account_info, service_account_file)
-
-    def _initialize_api(self, service_account_info=None, service_account_file=None):
-        if service_account_info is not None:
-            creds = service_account.Credentials.from_service_account_info(
-                service_account_info, scopes=self.GOOGLE_CHAT_SCOPES)
-        elif service_account_file is not None:
-            creds = service_account.Credentials.from_service_account_file(
-                service_account_info, scopes=self.GOOGLE_CHAT_SCOPES)
-        else:
-            creds, _ = google.auth.default(scopes=self.GOOGLE_CHAT_SCOPES)
-        http = google_auth_httplib2.AuthorizedHttp(creds)
-        return discovery.build('chat', 'v1', http=http)
-
-    def list_spaces(self, page_size=100):
-        spaces_list = list()
-        spaces = self.api.spaces()
-        request = spaces.list(pageSize=page_size)
-        while request is not None:
-            response = request.execute()
-            spaces_list += response.get('spaces', [])
-            request = spaces.list_next(request, response)
-        return spaces_list
+    GOOGLE_CHAT_SCOPES = GOOGLE_CHAT_SCOPES
+
+    def __init__(self, service_account_info=None, service_account_file=None,
+                 credentials=None, root_url=None, discovery_cache_dir=None, cache=None):
+        if credentials is None:
+            credentials = get_credentials(
+                service_account_info, service_account_file, scopes=self.GOOGLE_CHAT_SCOPES)
+        if root_url is None:
+            root_url = os.environ.get(ROOT_URL_ENVIRONMENT_VARIABLE) or None
+        if root_url is not None:
+            root_url = root_url.rstrip('/') + '/'  # Request paths are joined to it
+        self.credentials = credentials
+        self.root_url = root_url
+        self.cache = cache
+        self.http = self._new_http()
+        self._service = _ChatService.get(root_url, discovery_cache_dir)
+        self._api = None
+
+    @property
+    def api(self):
+        """ The discovery-built client using this instance's http object, built on first use. """
+        if self._api is None:
+            self._api = self._initialize_api()
+        return self._api
+
+    def _new_http(self):
+        import google_auth_httplib2
+        return google_auth_httplib2.AuthorizedHttp(self.credentials)
+
+    def _initialize_api(self):
+        from googleapiclient import discovery
+        return discovery.build_from_document(self._service.build_document, http=self.http)
+
+    def _execute(self, request, http=None):
+        instruments = instrumentation.active
+        if instruments is None:
+            return request.execute(http=http or self.http)
+        with instruments.api_call(request.methodId, request.body):
+            return request.execute(http=http or self.http)
+
+    def _cached(self, key, fetch):
+        """ Returns a copy of the cached value, so callers can't change the cached one. """
+        if self.cache is None:
+            return fetch()
+        value = self.cache.get(key)
+        if value is None:
+            value = fetch()
+            self.cache.set(key, value)
+        return copy.deepcopy(value)
+
+    def invalidate_space(self, space_name):
+        """ Drops cached data (space, memberships) for `space_name`. """
+        if self.cache is not None:
+            self.cache.invalidate_where(lambda key: key[1] == space_name)
+
+    @staticmethod
+    def _list_fields(key, fields):
+        if fields is None:
+            return None
+        if not isinstance(fields, str):
+            fields = ','.join(fields)
+        return 'nextPageToken,{}({})'.format(key, fields)
+
+    def _iter_pages(self, resource, request, key, prefetch=True):
+        """ Yields the items of each page as it arrives.
+
+        With `prefetch` the next page is requested on a background thread
+        (using its own http object) while the caller consumes the current one.
+        The first page is fetched on the calling thread, so single-page results
+        never start the background thread.
+        """
+        response = self._execute(request)
+        request = resource.list_next(request, response)
+        if not prefetch or request is None:
+            yield from response.get(key, [])
+            while request is not None:
+                response = self._execute(request)
+                request = resource.list_next(request, response)
+                yield from response.get(key, [])
+            return
+        http = self._new_http()
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self._execute, request, http)
+        try:
+            yield from response.get(key, [])
+            while future is not None:
+                response = future.result()
+                request = resource.list_next(request, response)
+                future = None
+                if request is not None:
+                    future = executor.submit(self._execute, request, http)
+                yield from response.get(key, [])
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def iter_spaces(self, page_size=100, fields=None, prefetch=True):
+        """ Yields spaces page by page. `fields` limits the returned space fields. """
+        spaces = self._service.spaces
+        request = spaces.list(pageSize=page_size, fields=self._list_fields('spaces', fields))
+        return self._iter_pages(spaces, request, 'spaces', prefetch=prefetch)
+
+    def list_spaces(self, page_size=100, fields=None):
+        return list(self.iter_spaces(page_size=page_size, fields=fields))
 
     def get_space(self, name):
-        return self.api.spaces().get(name=name).execute()
-
-    def list_memberships(self, space_name, page_size=100):
-        memberships = list()
-        members = self.api.spaces().members()
-        request = members.list(parent=space_name, pageSize=page_size)
-        while request is not None:
-            response = request.execute()
-            memberships += response.get('memberships', [])
-            request = members.list_next(request, response)
-        return memberships
+        return self._cached(
+            ('space', name), lambda: self._execute(self._service.spaces.get(name=name)))
+
+    def iter_memberships(self, space_name, page_size=100, fields=None, prefetch=True):
+        """ Yields memberships page by page. `fields` limits the returned membership fields. """
+        members = self._service.members
+        request = members.list(parent=space_name, pageSize=page_size,
+                               fields=self._list_fields('memberships', fields))
+        return self._iter_pages(members, request, 'memberships', prefetch=prefetch)
+
+    def list_memberships(self, space_name, page_size=100, fields=None):
+        key = ('memberships', space_name, page_size, self._list_fields('memberships', fields))
+        return self._cached(key, lambda: list(
+            self.iter_memberships(space_name, page_size=page_size, fields=fields)))
 
     def get_membership(self, name):
-        return self.api.spaces().members().get(name=name).execute()
+        space_name = name.split('/members/')[0]
+        return self._cached(
+            ('membership', space_name, name),
+            lambda: self._execute(self._service.members.get(name=name)))
 
-    def create_message(self, message, space_name, thread_id=None, thread_key=None):
-        """ Sends an asynchronous message to Hangouts Chat. """
+    def create_message(self, message, space_name, thread_id=None, thread_key=None,
+                       request_id=None):
+        """ Sends an asynchronous message to Hangouts Chat.
+
+        Creating a message again with the same `request_id` returns the message
+        created the first time instead of posting a duplicate.
+        """
         # Update thread (will send as new message if thread_id is None)
         if thread_id is not None:
             message['thread'] = thread_id
-        return self.api.spaces().messages().create(
-            parent=space_name, body=message, threadKey=thread_key).execute()
+        return self._execute(self._service.messages.create(
+            parent=space_name, body=message, threadKey=thread_key, requestId=request_id))
+
+    def create_message_json(self, body, space_name, thread_key=None, request_id=None,
+                            http=None):
+        """ Sends a message whose body is already serialized to JSON bytes.
+
+        Lets one body be sent to many spaces without encoding it for each.
+        `http` is the http object to send with, e.g. one per thread.
+        """
+        request = self._service.messages.create(
+            parent=space_name, threadKey=thread_key, requestId=request_id)
+        request.body = body
+        request.headers['content-type'] = 'application/json'
+        request.headers['content-length'] = str(len(body))
+        return self._execute(request, http)
 
     def get_message(self, name):
-        return self.api.spaces().messages().get(name=name).execute()
+        return self._execute(self._service.messages.get(name=name))
 
     def delete_message(self, name):
-        return self.api.spaces().messages().delete(name=name).execute()
+        return self._execute(self._service.messages.delete(name=name))
+
+    def update_message(self, name, message, update_mask=DEFAULT_UPDATE_MASK):
+        """ Updates the fields of a message listed in `update_mask` (comma-separated).
 
-    def update_message(self, name, message):
+        Fields in the mask but missing from `message` are cleared.
+        """
         update_kwargs = {
             'name': name,
             'body': message,
-            'updateMask': 'text,cards'
+            'updateMask': update_mask
         }
-        return self.api.spaces().messages().update(**update_kwargs).execute()
+        return self._execute(self._service.messages.update(**update_kwargs))
+
+    def batch(self, batch_size=BATCH_LIMIT):
+        """ Returns a `MessageBatch` for sending many message calls in few requests. """
+        return MessageBatch(self, batch_size=batch_size)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+
+import aiohttp
+import google_auth_httplib2
+import httplib2
+from googleapiclient.errors import HttpError
+
+from . import instrumentation
+from .api import (
+    DEFAULT_UPDATE_MASK, GOOGLE_CHAT_SCOPES, ROOT_URL_ENVIRONMENT_VARIABLE, get_credentials)
+
+
+class AsyncHangoutsChatAPI:
+    """ Asyncio counterpart of `HangoutsChatAPI`.
+
+    Requests share a single `aiohttp` session whose connector keeps connections
+    alive between calls. `max_connections` caps the number of requests in flight
+    at any one time; additional calls wait for a free connection.
+    """
+    GOOGLE_CHAT_SCOPES = GOOGLE_CHAT_SCOPES
+    ROOT_URL = 'https://chat.googleapis.com/'
+
+    def __init__(self, service_account_info=None, service_account_file=None,
+                 credentials=None, root_url=None, max_connections=100,
+                 keepalive_timeout=60, session=None):
+        if credentials is None:
+            credentials = get_credentials(
+                service_account_info, service_account_file, scopes=self.GOOGLE_CHAT_SCOPES)
+        self.credentials = credentials
+        root_url = root_url or os.environ.get(ROOT_URL_ENVIRONMENT_VARIABLE) or self.ROOT_URL
+        self.root_url = root_url.rstrip('/') + '/'  # Request paths are appended to it
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self._session = session
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _refresh_credentials(self):
+        request = google_auth_httplib2.Request(httplib2.Http())
+        self.credentials.refresh(request)
+
+    async def _auth_headers(self):
+        if not self.credentials.valid:
+            # Token refresh is a blocking call, so only one coroutine performs
+            # it (in the default executor) while the others wait on the lock
+            if self._refresh_lock is None:
+                self._refresh_lock = asyncio.Lock()
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(None, self._refresh_credentials)
+        headers = {}
+        self.credentials.apply(headers)
+        return headers
+
+    async def _request(self, method_id, method, path, params=None, body=None):
+        """ Sends one request; `method_id` names the API method in metrics and spans. """
+        instruments = instrumentation.active
+        if instruments is None:
+            return await self._send(method, path, params, body)
+        with instruments.api_call(method_id):
+            return await self._send(method, path, params, body)
+
+    async def _send(self, method, path, params, body):
+        url = self.root_url + 'v1/' + path
+        if params is not None:
+            params = {k: str(v) for k, v in params.items() if v is not None}
+        headers = await self._auth_headers()
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['content-type'] = 'application/json; charset=utf-8'
+            instruments = instrumentation.active
+            if instruments is not None:
+                instruments.record_payload('api_request', len(data))
+        async with self.session.request(method, url, params=params, data=data,
+                                        headers=headers) as response:
+            content = await response.read()
+            if response.status >= 400:
+                resp = httplib2.Response({
+                    'status': response.status,
+                    'content-type': response.headers.get('content-type', '')})
+                resp.reason = response.reason
+                raise HttpError(resp, content, uri=str(response.url))
+        if not content:
+            return {}
+        return json.loads(content.decode('utf-8'))
+
+    async def _list_all(self, method_id, path, key, page_size, params=None):
+        items = list()
+        params = dict(params or {}, pageSize=page_size)
+        while True:
+            response = await self._request(method_id, 'GET', path, params=params)
+            items += response.get(key, [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return items
+            params['pageToken'] = page_token
+
+    async def list_spaces(self, page_size=100):
+        return await self._list_all('chat.spaces.list', 'spaces', 'spaces', page_size)
+
+    async def get_space(self, name):
+        return await self._request('chat.spaces.get', 'GET', name)
+
+    async def list_memberships(self, space_name, page_size=100):
+        return await self._list_all(
+            'chat.spaces.members.list', space_name + '/members', 'memberships', page_size)
+
+    async def get_membership(self, name):
+        return await self._request('chat.spaces.members.get', 'GET', name)
+
+    async def create_message(self, message, space_name, thread_id=None, thread_key=None,
+                             request_id=None):
+        """ Sends an asynchronous message to Hangouts Chat. """
+        # Update thread (will send as new message if thread_id is None)
+        if thread_id is not None:
+            message['thread'] = thread_id
+        return await self._request('chat.spaces.messages.create', 'POST',
+                                   space_name + '/messages',
+                                   params={'threadKey': thread_key, 'requestId': request_id},
+                                   body=message)
+
+    async def get_message(self, name):
+        return await self._request('chat.spaces.messages.get', 'GET', name)
+
+    async def delete_message(self, name):
+        return await self._request('chat.spaces.messages.delete', 'DELETE', name)
+
+    async def update_message(self, name, message, update_mask=DEFAULT_UPDATE_MASK):
+        return await self._request('chat.spaces.messages.update', 'PUT', name,
+                                   params={'updateMask': update_mask}, body=message)
@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+from contextvars import ContextVar
+from time import perf_counter
+
+from . import instrumentation
+from .deferred import DeferredResponse
+from .event import ChatEvent
+from .handler import HangoutsChatHandler
+from .message import serialize_response
+
+_sent_asynchronously = ContextVar('sent_asynchronously', default=False)
+
+
+async def _resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class AsyncHangoutsChatHandler(HangoutsChatHandler):
+    """ Dispatches Hangouts Chat events to `handle_*` methods that may be coroutines.
+
+    `handle_chat_event` is a coroutine. Each `handle_*` method (including
+    `handle_exception` and `handle_response`) may be a plain method or a
+    coroutine; plain methods run directly on the event loop, so they should not
+    block. Per-event state such as `sent_asynchronously` is kept in a context
+    variable, so each task sees its own value. Deferred work (see
+    `DeferredResponse`) may also be a coroutine function; it runs in its own
+    event loop on one of the executor's threads.
+    """
+
+    @property
+    def sent_asynchronously(self):
+        """ Whether the event currently being handled in this context was sent asynchronously. """
+        return _sent_asynchronously.get()
+
+    async def handle_chat_event(self, event, sent_asynchronously=False):
+        event = ChatEvent.coerce(event)
+        instruments = instrumentation.active
+        if instruments is None:
+            return await self._handle_chat_event(event, sent_asynchronously)
+        event_type = instrumentation.event_type_label(event)
+        start = perf_counter()
+        with instruments.span('hangouts_chat.event', {'event_type': event_type}):
+            response = await self._handle_chat_event(event, sent_asynchronously)
+        instruments.record_event(event_type, perf_counter() - start)
+        return response
+
+    async def handle_chat_event_json(self, event, sent_asynchronously=False):
+        """ Handles `event` like `handle_chat_event` and returns the response as JSON bytes. """
+        event = ChatEvent.coerce(event)
+
+        async def compute():
+            return serialize_response(await self.handle_chat_event(event, sent_asynchronously))
+
+        if self.deduplicator is None:
+            return await compute()
+        return await self.deduplicator.run_async(event, compute)
+
+    async def _handle_chat_event(self, event, sent_asynchronously):
+        token = _sent_asynchronously.set(sent_asynchronously)
+        try:
+            dispatch, space_type = self._get_dispatch(event)
+            response = await _resolve(dispatch(self, space_type, event))
+            if isinstance(response, DeferredResponse):
+                response = await _resolve(self._defer(response, event))
+        except Exception as e:
+            self.log.exception('Error handling chat event')
+            instrumentation.record_exception(event, e)
+            response = await _resolve(self.handle_exception(e, event=event))
+        finally:
+            _sent_asynchronously.reset(token)
+        return await _resolve(self.handle_response(response))
+
+    def _complete_deferred(self, deferred, event):
+        # Runs on an executor thread, which has no event loop of its own
+        return asyncio.run(self._complete_deferred_async(deferred, event))
+
+    async def _complete_deferred_async(self, deferred, event):
+        _sent_asynchronously.set(True)
+        try:
+            response = await _resolve(deferred.work())
+        except Exception as e:
+            self.log.exception('Error completing deferred chat event')
+            instrumentation.record_exception(event, e)
+            response = await _resolve(self.handle_exception(e, event=event))
+        return await _resolve(self.handle_response(response))
+
+
+class HangoutsChatASGIApp:
+    """ ASGI application that passes each POSTed event to an `AsyncHangoutsChatHandler`.
+
+    The request body is decoded as a JSON event and the handler's response is
+    returned as JSON. Bodies larger than `max_body_size` bytes are rejected. A
+    response that can't be serialized is logged and answered with a 500.
+
+        app = HangoutsChatASGIApp(MyAsyncHandler())
+    """
+
+    def __init__(self, handler, max_body_size=1024 * 1024):
+        self.handler = handler
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type: {}'.format(scope['type']))
+        if scope['method'] != 'POST':
+            await self._respond(send, 405, b'{"error":"Method not allowed"}',
+                                [(b'allow', b'POST')])
+            return
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413, b'{"error":"Request body too large"}')
+            return
+        try:
+            event = ChatEvent.from_bytes(body)
+        except ValueError:
+            await self._respond(send, 400, b'{"error":"Invalid JSON"}')
+            return
+        try:
+            body = await self.handler.handle_chat_event_json(event)
+        except Exception:
+            self.handler.log.exception('Error serializing chat event response')
+            await self._respond(send, 500, b'{"error":"Internal server error"}')
+            return
+        instruments = instrumentation.active
+        if instruments is not None:
+            instruments.record_payload('http_response', len(body))
+        await self._respond(send, 200, body)
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                return None
+            chunks.append(chunk)
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _respond(send, status, body, headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json; charset=utf-8'),
+                (b'content-length', str(len(body)).encode('ascii')),
+            ] + list(headers)
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,298 @@
+""" Sending one message to many spaces.
+
+A `Broadcast` serializes its message once, reads target spaces as they are
+listed, and sends to up to `concurrency` spaces at a time on a thread pool.
+Each space gets a request ID derived from the broadcast ID, so Chat returns
+the message it already created instead of posting it again when a send is
+retried.
+
+With a `checkpoint` file, the result for each space is appended to the file
+as it arrives. Running the broadcast again with the same file skips the
+spaces that were sent and retries those that failed or were not reached, so
+an interrupted broadcast continues where it stopped.
+
+    broadcast = Broadcast(api, announcement, checkpoint='announcement.jsonl')
+    report = broadcast.run(api.iter_spaces(fields='name'))
+    print(report.format())
+    for space_name, error in report.failures.items():
+        ...
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import message as _message
+from .scheduler import backoff_delay, is_retryable
+
+DEFAULT_CONCURRENCY = 16
+
+
+def request_id(broadcast_id, space_name):
+    """ Returns the Chat request ID used when `broadcast_id` is sent to `space_name`. """
+    return '{}-{}'.format(broadcast_id, space_name.rsplit('/', 1)[-1])
+
+
+def _error_text(error):
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        return 'HTTP {} {}'.format(status, getattr(error, 'reason', '') or '').rstrip()
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+class BroadcastCheckpoint:
+    """ The results of a broadcast, appended to a JSON lines file as they arrive.
+
+    The first line identifies the broadcast and its message. Each following
+    line holds the message name sent to a space, or the error of a failed
+    space. Lines are flushed as they are written, so a crash loses at most the
+    sends in flight, which request IDs keep from being duplicated. Not
+    thread-safe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.broadcast_id = None
+        self.sent = {}  # Space name -> message name
+        self.failed = {}  # Space name -> error text
+        self._file = None
+
+    def _load(self):
+        digest = None
+        complete = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    complete = line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  # A line cut short by a crash
+                        continue
+                    if 'broadcast' in record:
+                        self.broadcast_id = record['broadcast']
+                        digest = record.get('body')
+                    elif 'error' in record:
+                        self.failed[record['space']] = record['error']
+                    else:
+                        self.sent[record['space']] = record.get('message')
+                        self.failed.pop(record['space'], None)
+        except FileNotFoundError:
+            pass
+        return digest, complete
+
+    def open(self, broadcast_id=None, body_digest=None):
+        """ Loads earlier results and opens the file for appending. Returns the broadcast ID.
+
+        A new file is started for `broadcast_id`, or for a new random ID. An
+        existing file must belong to the same broadcast ID (if one is given)
+        and message body digest, otherwise `ValueError` is raised.
+        """
+        digest, complete = self._load()
+        if self.broadcast_id is not None:
+            if broadcast_id is not None and broadcast_id != self.broadcast_id:
+                raise ValueError('Checkpoint {} belongs to broadcast {}'.format(
+                    self.path, self.broadcast_id))
+            if body_digest is not None and digest is not None and body_digest != digest:
+                raise ValueError('Checkpoint {} was written for a different message'.format(
+                    self.path))
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if not complete:  # Start after the line cut short, rather than appending to it
+            self._file.write('\n')
+        if self.broadcast_id is None:
+            self.broadcast_id = broadcast_id or uuid.uuid4().hex
+            self._write({'broadcast': self.broadcast_id, 'body': body_digest})
+        return self.broadcast_id
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def record(self, space_name, message_name=None, error=None):
+        """ Appends the result of sending to `space_name`. """
+        if error is None:
+            self.sent[space_name] = message_name
+            self.failed.pop(space_name, None)
+            self._write({'space': space_name, 'message': message_name})
+        else:
+            self.failed[space_name] = error
+            self._write({'space': space_name, 'error': error})
+
+    def close(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+class BroadcastReport:
+    """ The progress of a broadcast run: counts, throughput and the error of each failed space.
+
+    `skipped` counts spaces that were already sent according to the
+    checkpoint, or that were listed more than once.
+    """
+
+    def __init__(self, broadcast_id):
+        self.broadcast_id = broadcast_id
+        self.sent = 0
+        self.skipped = 0
+        self.failures = {}  # Space name -> error text
+        self.started = time.monotonic()
+        self.elapsed = None
+
+    @property
+    def failed(self):
+        return len(self.failures)
+
+    @property
+    def seconds(self):
+        """ Seconds since the run started, or its duration once it finished. """
+        if self.elapsed is not None:
+            return self.elapsed
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self):
+        """ Spaces handled (sent or failed) per second. """
+        seconds = self.seconds
+        return (self.sent + self.failed) / seconds if seconds > 0 else 0.0
+
+    def format(self):
+        return 'Broadcast {}: {} sent, {} failed, {} skipped in {:.1f}s ({:.1f} spaces/s)'.format(
+            self.broadcast_id, self.sent, self.failed, self.skipped, self.seconds,
+            self.throughput)
+
+
+class Broadcast:
+    """ Sends one message to many spaces with bounded concurrency.
+
+    `api` is a `HangoutsChatAPI`; each worker thread sends with its own http
+    object. `message` is a component, a rendered dict or JSON bytes.
+    `checkpoint` is the path of a `BroadcastCheckpoint` file. Sends that fail
+    with 429 or 5xx responses are retried up to `retries` times with
+    exponential backoff. `progress` is called with the `BroadcastReport` at
+    most every `progress_interval` seconds and when the run ends; by default
+    progress is logged. If recording a result fails (for example the
+    checkpoint can't be written), the run stops and `run()` raises the error.
+    """
+
+    def __init__(self, api, message, concurrency=DEFAULT_CONCURRENCY, checkpoint=None,
+                 broadcast_id=None, thread_key=None, retries=3, backoff_base=0.5,
+                 backoff_max=30.0, progress=None, progress_interval=5.0, logger=None):
+        if isinstance(message, bytes):
+            self.body = message
+        else:
+            self.body = _message.serialize_response(message)
+        self.api = api
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint
+        self.broadcast_id = broadcast_id
+        self.thread_key = thread_key
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.progress_interval = progress_interval
+        self.log = logger or logging.getLogger(__name__)
+        self._progress = progress or (lambda report: self.log.info(report.format()))
+        self._local = threading.local()
+        self._connections = []  # The http object of each worker thread, closed after a run
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """ Stops sending to further spaces. Sends in flight finish and are recorded. """
+        self._stopped.set()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = self.api._new_http()
+            with self._lock:
+                self._connections.append(http)
+        return http
+
+    def _send(self, broadcast_id, space_name):
+        attempt = 0
+        while True:
+            try:
+                return self.api.create_message_json(
+                    self.body, space_name, thread_key=self.thread_key,
+                    request_id=request_id(broadcast_id, space_name), http=self._http())
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    raise
+                time.sleep(backoff_delay(attempt, e, self.backoff_base, self.backoff_max))
+                attempt += 1
+
+    def run(self, spaces):
+        """ Sends the message to each of `spaces` (names or space dicts). Returns the report. """
+        checkpoint = None
+        if self.checkpoint is not None:
+            checkpoint = BroadcastCheckpoint(self.checkpoint)
+            digest = hashlib.sha256(self.body).hexdigest()[:32]
+            self.broadcast_id = checkpoint.open(self.broadcast_id, digest)
+        elif self.broadcast_id is None:
+            self.broadcast_id = uuid.uuid4().hex
+        report = BroadcastReport(self.broadcast_id)
+        self._stopped.clear()
+        next_progress = [report.started + self.progress_interval]
+        # Bound the sends queued, so spaces are only listed as fast as they are sent
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+
+        errors = []  # The first error raised while recording a result, which stops the run
+
+        def done(space_name, future):
+            try:
+                response, error = future.result(), None
+            except Exception as e:
+                response, error = None, _error_text(e)
+            try:
+                with self._lock:
+                    if error is None:
+                        report.sent += 1
+                    else:
+                        report.failures[space_name] = error
+                    if checkpoint is not None:
+                        checkpoint.record(space_name, (response or {}).get('name'), error)
+                    now = time.monotonic()
+                    if now >= next_progress[0]:
+                        next_progress[0] = now + self.progress_interval
+                        self._progress(report)
+            except Exception as e:
+                with self._lock:
+                    if not errors:
+                        errors.append(e)
+                self._stopped.set()
+            finally:
+                slots.release()
+
+        seen = set()
+        try:
+            with ThreadPoolExecutor(self.concurrency, thread_name_prefix='Broadcast') as pool:
+                for space in spaces:
+                    if self._stopped.is_set():
+                        break
+                    space_name = space['name'] if isinstance(space, dict) else space
+                    if space_name in seen or (
+                            checkpoint is not None and space_name in checkpoint.sent):
+                        report.skipped += 1
+                        continue
+                    seen.add(space_name)
+                    slots.acquire()
+                    future = pool.submit(self._send, self.broadcast_id, space_name)
+                    future.add_done_callback(functools.partial(done, space_name))
+            if errors:
+                raise errors[0]
+        finally:
+            report.elapsed = time.monotonic() - report.started
+            if checkpoint is not None:
+                checkpoint.close()
+            for http in self._connections:
+                http.close()
+            del self._connections[:]
+        self._progress(report)
+        return report
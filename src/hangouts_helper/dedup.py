@@ -0,0 +1,142 @@
+""" Deduplication of redelivered Chat events.
+
+Hangouts Chat may deliver the same event more than once, for example when a
+response is slow. An `EventDeduplicator` stores the serialized response to
+each event under a key that identifies the event (see `event_key`). A
+redelivered event then gets the stored response without being handled again.
+A duplicate that arrives while the first delivery is still being handled waits
+for that result rather than running the handler a second time.
+
+    handler = MyHandler(deduplicator=EventDeduplicator(ttl=600))
+    body = handler.handle_chat_event_json(request_body)
+
+Responses are stored in a `TTLCache` by default. Any object with the methods
+`get(key, default=None)` and `set(key, value, ttl=None)` can be used instead.
+For example, a wrapper around a shared cache lets several processes serve
+each other's stored responses. Waiting for an in-progress duplicate only works
+within one process.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from .cache import TTLCache
+
+
+def event_key(event):
+    """ Returns a string identifying a chat event across redeliveries, or None if it has none.
+
+    Messages are identified by their name. Card clicks are identified by the
+    clicked message, action, user and event time. Other events are identified
+    by their type, space, user and event time.
+    """
+    event_type = event.get('type')
+    message_name = (event.get('message') or {}).get('name')
+    if event_type == 'MESSAGE' and message_name:
+        return 'MESSAGE|' + message_name
+    event_time = event.get('eventTime')
+    if not event_time:
+        return None
+    user_name = (event.get('user') or {}).get('name', '')
+    if event_type == 'CARD_CLICKED':
+        action = (event.get('action') or {}).get('actionMethodName', '')
+        return '|'.join(('CARD_CLICKED', message_name or '', action, user_name, event_time))
+    space_name = (event.get('space') or {}).get('name', '')
+    return '|'.join((event_type or '', space_name, user_name, event_time))
+
+
+class EventDeduplicator:
+    """ Handles each distinct event once and returns the stored response for redeliveries.
+
+    Responses are kept for `ttl` seconds in `store`, which defaults to a
+    `TTLCache` of at most `maxsize` entries. `key` returns the identity of an
+    event, or None for events that should not be deduplicated.
+    """
+
+    def __init__(self, store=None, ttl=600, maxsize=10000, key=event_key):
+        if store is None:
+            store = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = store
+        self.ttl = ttl
+        self.key = key
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _claim(self, key):
+        # Returns (stored response, future of the computation in progress, whether to compute)
+        response = self.store.get(key)
+        if response is not None:
+            with self._lock:  # += on an attribute is not atomic across threads
+                self.hits += 1
+            return response, None, False
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self.waits += 1
+                return None, future, False
+            # Check again in case the first delivery finished since the lookup above
+            response = self.store.get(key)
+            if response is not None:
+                self.hits += 1
+                return response, None, False
+            self.misses += 1
+            future = self._pending[key] = Future()
+            return None, future, True
+
+    def _finish(self, key, future, response=None, exception=None):
+        if exception is None:
+            self.store.set(key, response, ttl=self.ttl)
+        with self._lock:
+            del self._pending[key]
+        if exception is None:
+            future.set_result(response)
+        else:
+            future.set_exception(exception)
+
+    def run(self, event, compute):
+        """ Returns the stored response to `event`, or calls `compute()` and stores its result.
+
+        If `compute` raises, nothing is stored and the exception is raised to
+        every caller waiting on the same event.
+        """
+        key = self.key(event)
+        if key is None:
+            return compute()
+        response, future, first = self._claim(key)
+        if response is not None:
+            return response
+        if not first:
+            return future.result()
+        try:
+            response = compute()
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, response)
+        return response
+
+    async def run_async(self, event, compute):
+        """ Coroutine version of `run`, where `compute` is a coroutine function. """
+        key = self.key(event)
+        if key is None:
+            return await compute()
+        response, future, first = self._claim(key)
+        if response is not None:
+            return response
+        if not first:
+            return await asyncio.wrap_future(future)
+        try:
+            response = await compute()
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, response)
+        return response
+
+    def stats(self):
+        """ Returns the number of stored responses returned, waits on duplicates and misses. """
+        return {'hits': self.hits, 'waits': self.waits, 'misses': self.misses,
+                'pending': len(self._pending)}
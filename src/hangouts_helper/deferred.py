@@ -0,0 +1,195 @@
+""" Deferred responses: acknowledge an event at once and finish it in the background.
+
+A `handle_*` method returns a `DeferredResponse` holding the slow work and a
+placeholder. The handler responds with the placeholder straight away and
+queues the work on a `DeferredExecutor`, which posts the real response through
+the Chat API into the same space and thread.
+
+    class MyHandler(HangoutsChatHandler):
+        def handle_message(self, message, event):
+            return DeferredResponse(lambda: build_report(message),
+                                    placeholder=Message(text='Working on it...'))
+
+    handler = MyHandler(deferred_executor=DeferredExecutor(HangoutsChatAPI()))
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Full
+
+from .scheduler import summarize_latencies
+
+
+class DeferredResponse:
+    """ Returned from a `handle_*` method to complete the event in the background.
+
+    `work` is called without arguments on an executor thread, where the
+    handler's `sent_asynchronously` is True; it returns the final response (a
+    `Message`, a dict or None to post nothing). With `update`, the final
+    response replaces the message the event came from (e.g. the card that was
+    clicked) instead of being posted as a reply in its thread.
+    """
+    __slots__ = ('work', 'placeholder', 'update')
+
+    def __init__(self, work, placeholder=None, update=False):
+        self.work = work
+        self.placeholder = placeholder
+        self.update = update
+
+
+class _Job:
+    __slots__ = ('handler', 'deferred', 'event', 'future', 'enqueued')
+
+    def __init__(self, handler, deferred, event):
+        self.handler = handler
+        self.deferred = deferred
+        self.event = event
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class DeferredExecutor:
+    """ Runs deferred work on a bounded pool of threads and posts the results.
+
+    At most `max_queue` jobs wait at once; `submit` raises `queue.Full` beyond
+    that, so an overloaded bot fails fast instead of queueing without limit.
+    `api` is a `HangoutsChatAPI` or anything with the same `create_message` and
+    `update_message` methods, such as an `OutboundScheduler`.
+    """
+
+    def __init__(self, api, workers=4, max_queue=1000, logger=None):
+        self.api = api
+        self.max_queue = max_queue
+        self.log = logger or logging.getLogger(__name__)
+        self._queue = deque()
+        self._running = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._latencies = {'queued': deque(maxlen=1024), 'work': deque(maxlen=1024),
+                           'total': deque(maxlen=1024)}
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                          'cancelled': 0}
+        self._workers = [
+            threading.Thread(target=self._worker, name='DeferredExecutor-{}'.format(i),
+                             daemon=True)
+            for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, handler, deferred, event):
+        """ Queues `deferred` for `event`. Returns a `Future` for the API response. """
+        job = _Job(handler, deferred, event)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Cannot defer new work after shutdown')
+            if len(self._queue) >= self.max_queue:
+                self._counters['rejected'] += 1
+                raise Full('Deferred work queue is full')
+            self._queue.append(job)
+            self._counters['submitted'] += 1
+            self._ready.notify()
+        return job.future
+
+    def _next_job(self):
+        with self._lock:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._ready.wait()
+            self._running += 1
+            return self._queue.popleft()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                response = job.handler._complete_deferred(job.deferred, job.event)
+                worked = time.monotonic()
+                result = self._post(job, response)
+            except Exception as e:
+                self.log.exception('Error posting deferred response')
+                self._finish(job, 'failed', started, time.monotonic())
+                job.future.set_exception(e)
+            else:
+                self._finish(job, 'completed', started, worked)
+                job.future.set_result(result)
+
+    def _post(self, job, response):
+        if response is None:
+            return None
+        if hasattr(response, 'output'):
+            response = response.output()
+        event = job.event
+        message = event.get('message', {})
+        if job.deferred.update and 'name' in message:
+            return self.api.update_message(message['name'], response)
+        thread = message.get('thread')
+        thread_id = {'name': thread['name']} if thread else None
+        return self.api.create_message(response, event['space']['name'], thread_id=thread_id)
+
+    def _finish(self, job, outcome, started, worked):
+        now = time.monotonic()
+        with self._lock:
+            self._counters[outcome] += 1
+            self._latencies['queued'].append(started - job.enqueued)
+            self._latencies['work'].append(worked - started)
+            self._latencies['total'].append(now - job.enqueued)
+            self._running -= 1
+            if not self._queue and not self._running:
+                self._idle.notify_all()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def metrics(self):
+        """ Returns queue depth, outcome counters and latency (seconds) percentiles.
+
+        `queued` is the time a job waited for a worker, `work` the time spent in
+        the deferred work and `total` the time from submission until the
+        response was posted.
+        """
+        with self._lock:
+            latencies = {name: list(values) for name, values in self._latencies.items()}
+            metrics = dict(self._counters, queue_depth=len(self._queue), running=self._running)
+        for name, values in latencies.items():
+            if values:
+                metrics[name + '_latency'] = summarize_latencies(values)
+        return metrics
+
+    def drain(self, timeout=None):
+        """ Blocks until no work is queued or running. Returns False on timeout. """
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._queue and not self._running, timeout)
+
+    def shutdown(self, wait=True, timeout=None):
+        """ Stops accepting work.
+
+        With `wait`, queued work is finished first (for up to `timeout`
+        seconds); otherwise queued work is cancelled and only running jobs
+        complete.
+        """
+        with self._lock:
+            self._closed = True
+            if not wait:
+                while self._queue:
+                    self._queue.popleft().future.cancel()
+                    self._counters['cancelled'] += 1
+            self._ready.notify_all()
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for worker in self._workers:
+                worker.join(None if deadline is None else max(0, deadline - time.monotonic()))
@@ -0,0 +1,137 @@
+""" Loading of the Hangouts Chat discovery document without a runtime fetch.
+
+The discovery document is read from the copy bundled with `googleapiclient`
+or from a JSON file in a cache directory. A document is only used if its
+`name` and `version` match the requested API. Refreshed documents are written
+to a temporary file and moved into place, so concurrent readers never see a
+partially written cache.
+"""
+import json
+import os
+import tempfile
+import time
+
+API_NAME = 'chat'
+API_VERSION = 'v1'
+DISCOVERY_URL = 'https://chat.googleapis.com/$discovery/rest?version={version}'
+DEFAULT_MAX_AGE = 60 * 60 * 24  # 1 day
+
+
+class DiscoveryDocumentError(Exception):
+    pass
+
+
+def _is_valid(document, api_name, version):
+    return (isinstance(document, dict)
+            and document.get('name') == api_name
+            and document.get('version') == version
+            and 'resources' in document)
+
+
+def _revision(document):
+    return document.get('revision', '') if document else ''
+
+
+def cache_path(cache_dir, api_name=API_NAME, version=API_VERSION):
+    return os.path.join(cache_dir, '{}.{}.json'.format(api_name, version))
+
+
+def load_bundled_document(api_name=API_NAME, version=API_VERSION):
+    """ Returns the discovery document shipped with `googleapiclient`, if any. """
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:  # googleapiclient < 2.0
+        return None
+    content = get_static_doc(api_name, version)
+    if content is None:
+        return None
+    document = json.loads(content)
+    return document if _is_valid(document, api_name, version) else None
+
+
+def fetch_document(api_name=API_NAME, version=API_VERSION, http=None):
+    import httplib2
+
+    if http is None:
+        http = httplib2.Http(timeout=30)
+    url = DISCOVERY_URL.format(version=version)
+    try:
+        response, content = http.request(url)
+    except httplib2.HttpLib2Error as e:
+        raise DiscoveryDocumentError(
+            'Unable to fetch discovery document from {}: {}'.format(url, e))
+    if response.status >= 400:
+        raise DiscoveryDocumentError(
+            'Unable to fetch discovery document from {} (HTTP {})'.format(url, response.status))
+    document = json.loads(content.decode('utf-8'))
+    if not _is_valid(document, api_name, version):
+        raise DiscoveryDocumentError(
+            'Discovery document from {} is not for {} {}'.format(url, api_name, version))
+    return document
+
+
+def read_cached_document(cache_dir, api_name=API_NAME, version=API_VERSION, max_age=None):
+    """ Returns the cached discovery document, or None if it is missing, stale or invalid. """
+    path = cache_path(cache_dir, api_name, version)
+    try:
+        if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path, 'r') as f:
+            document = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return document if _is_valid(document, api_name, version) else None
+
+
+def write_cached_document(cache_dir, document, api_name=API_NAME, version=API_VERSION):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, api_name, version)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def refresh_cached_document(cache_dir, api_name=API_NAME, version=API_VERSION, http=None):
+    """ Fetches the latest discovery document and replaces the cached copy.
+
+    An older revision never replaces a newer one that is already cached.
+    """
+    document = fetch_document(api_name, version, http=http)
+    cached = read_cached_document(cache_dir, api_name, version)
+    if _revision(cached) > _revision(document):
+        return cached
+    write_cached_document(cache_dir, document, api_name, version)
+    return document
+
+
+def load_document(cache_dir=None, api_name=API_NAME, version=API_VERSION,
+                  max_age=DEFAULT_MAX_AGE, http=None):
+    """ Returns the discovery document, avoiding a network fetch where possible.
+
+    Without a `cache_dir` the bundled document is used and is only fetched if
+    no bundled copy exists. With a `cache_dir` the cached document is used
+    while it is younger than `max_age` seconds, or the bundled document if it
+    has a newer revision. A stale or missing cache is refreshed from the
+    network; if that fails, the bundled or stale cached document is used
+    instead.
+    """
+    bundled = load_bundled_document(api_name, version)
+    if cache_dir is None:
+        return bundled if bundled is not None else fetch_document(api_name, version, http=http)
+    cached = read_cached_document(cache_dir, api_name, version, max_age=max_age)
+    if cached is not None:
+        return cached if _revision(cached) >= _revision(bundled) else bundled
+    try:
+        return refresh_cached_document(cache_dir, api_name, version, http=http)
+    except (DiscoveryDocumentError, OSError, ValueError):
+        fallback = [d for d in (bundled, read_cached_document(cache_dir, api_name, version))
+                    if d is not None]
+        if not fallback:
+            raise
+        return max(fallback, key=_revision)
@@ -0,0 +1,149 @@
+""" Hangouts Chat events with typed fields.
+
+`ChatEvent` is the decoded event dict, with derived values (enum members, the
+action parameter dict, the thread) computed once on first access. As it is a
+`dict`, code written for plain event dicts (`event['space']['name']`) keeps
+working.
+"""
+from enum import Enum
+
+
+class EventType(Enum):
+    ADDED_TO_SPACE = 'ADDED_TO_SPACE'
+    MESSAGE = 'MESSAGE'
+    CARD_CLICKED = 'CARD_CLICKED'
+    REMOVED_FROM_SPACE = 'REMOVED_FROM_SPACE'
+
+
+class SpaceType(Enum):
+    ROOM = 'ROOM'
+    DIRECT_MESSAGE = 'DM'
+
+
+class UserType(Enum):
+    HUMAN = 'HUMAN'
+    BOT = 'BOT'
+
+
+# Enum lookups by value, built once rather than through Enum.__call__ per event
+_EVENT_TYPES = {member.value: member for member in EventType}
+_SPACE_TYPES = {member.value: member for member in SpaceType}
+_USER_TYPES = {member.value: member for member in UserType}
+
+_UNSET = object()
+
+
+def _loads(data):
+    # Chooses the JSON backend on first use, since orjson is slow to import
+    global _loads
+    try:
+        import orjson
+        _loads = orjson.loads
+    except ImportError:
+        import json
+        _loads = json.loads
+    return _loads(data)
+
+
+def parse_action_parameters(parameters):
+    """ Converts a card action's `[{'key': ..., 'value': ...}]` list into a dict. """
+    return {p['key']: p['value'] for p in parameters}
+
+
+class ChatEvent(dict):
+    """ A chat event dict with typed fields computed on first access.
+
+    `ChatEvent` is a `dict` subclass, so handlers written for plain event
+    dicts (`event['space']['name']`, `json.dumps(event)`) keep working. Build
+    one from the request body with `ChatEvent.from_bytes(body)`, which raises
+    `ValueError` if it is not valid JSON, or from a decoded event dict with
+    `ChatEvent(event)`. Each field is computed once, so changes made to the
+    dict after a field was read are not reflected in it.
+    """
+    __slots__ = ('_type', '_space_type', '_user_type', '_thread', '_action_parameters')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._type = _UNSET
+        self._space_type = _UNSET
+        self._user_type = _UNSET
+        self._thread = _UNSET
+        self._action_parameters = _UNSET
+
+    @classmethod
+    def from_bytes(cls, body):
+        """ Decodes a JSON request body (bytes or str) into a `ChatEvent`. """
+        data = _loads(body)
+        if not isinstance(data, dict):
+            raise ValueError('A chat event must be a JSON object')
+        return cls(data)
+
+    @classmethod
+    def coerce(cls, event):
+        """ Returns `event` as a `ChatEvent`, wrapping dicts and decoding request bodies. """
+        if isinstance(event, ChatEvent):
+            return event
+        if isinstance(event, (bytes, bytearray, memoryview, str)):
+            return cls.from_bytes(event)
+        return cls(event)
+
+    def __repr__(self):
+        return 'ChatEvent({})'.format(dict.__repr__(self))
+
+    @property
+    def type(self):
+        """ The `EventType`, or None for an unknown event type. """
+        if self._type is _UNSET:
+            self._type = _EVENT_TYPES.get(self.get('type'))
+        return self._type
+
+    @property
+    def space(self):
+        return self['space']
+
+    @property
+    def space_type(self):
+        if self._space_type is _UNSET:
+            self._space_type = _SPACE_TYPES.get(self['space'].get('type'))
+        return self._space_type
+
+    @property
+    def user(self):
+        return self.get('user')
+
+    @property
+    def user_type(self):
+        if self._user_type is _UNSET:
+            user = self.get('user')
+            self._user_type = _USER_TYPES.get(user.get('type')) if user else None
+        return self._user_type
+
+    @property
+    def message(self):
+        return self.get('message')
+
+    @property
+    def thread(self):
+        """ The thread of the event's message, or None. """
+        if self._thread is _UNSET:
+            message = self.get('message')
+            self._thread = message.get('thread') if message else None
+        return self._thread
+
+    @property
+    def action(self):
+        return self.get('action')
+
+    @property
+    def action_method_name(self):
+        action = self.get('action')
+        return action['actionMethodName'] if action else None
+
+    @property
+    def action_parameters(self):
+        """ The card action's parameters as a dict (empty if there are none). """
+        if self._action_parameters is _UNSET:
+            action = self.get('action')
+            parameters = action.get('parameters') if action else None
+            self._action_parameters = parse_action_parameters(parameters) if parameters else {}
+        return self._action_parameters
@@ -0,0 +1,458 @@
+""" A local stand-in for the Hangouts Chat REST API, for integration and load tests.
+
+`FakeChatServer` serves the spaces, members and messages endpoints (and batch
+requests) used by `HangoutsChatAPI` from an in-memory, seeded dataset. It can
+add latency and inject errors and 429 responses, so clients can be tested
+reproducibly without network access.
+
+    with FakeChatServer(spaces=5000, latency=0.02, rate_limit_rate=0.01) as server:
+        api = server.client()
+        spaces = api.list_spaces()
+
+Point an existing application at it by setting `HANGOUTS_CHAT_ROOT_URL` to
+`server.root_url`, or run one from the command line:
+
+    python -m hangouts_helper.fake_server --port 8085 --spaces 5000 --latency 0.02
+"""
+import argparse
+import collections
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_SPACE = re.compile(r'^spaces/[^/]+$')
+_MEMBERS = re.compile(r'^(spaces/[^/]+)/members$')
+_MEMBER = re.compile(r'^(spaces/[^/]+)/members/[^/]+$')
+_MESSAGES = re.compile(r'^(spaces/[^/]+)/messages$')
+_MESSAGE = re.compile(r'^(spaces/[^/]+)/messages/[^/]+$')
+
+_STATUS = {400: 'INVALID_ARGUMENT', 404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED',
+           500: 'INTERNAL', 503: 'UNAVAILABLE'}
+
+MAX_PAGE_SIZE = 1000
+REQUEST_LOG_SIZE = 10000
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+    def body(self):
+        return {'error': {'code': self.status, 'message': self.message,
+                          'status': _STATUS.get(self.status, 'UNKNOWN')}}
+
+
+class ChatState:
+    """ The spaces, memberships and messages held by a `FakeChatServer`. """
+
+    def __init__(self, spaces=100, members_per_space=10, seed=0):
+        rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.spaces = {}
+        self.memberships = {}
+        self.messages = {}
+        self.threads = {}
+        self.request_ids = {}  # (space name, requestId) -> message name
+        self._ids = itertools.count(1)
+        for i in range(spaces):
+            room = rng.random() < 0.8
+            name = 'spaces/{}'.format(_id(rng))
+            self.spaces[name] = {
+                'name': name,
+                'type': 'ROOM' if room else 'DM',
+                'displayName': 'Room {}'.format(i) if room else '',
+                'threaded': room,
+            }
+            members = {}
+            for j in range(members_per_space if room else 1):
+                user = _id(rng, digits=True)
+                member_name = '{}/members/{}'.format(name, user)
+                members[member_name] = {
+                    'name': member_name,
+                    'state': 'JOINED',
+                    'member': {'name': 'users/' + user, 'displayName': 'User {}'.format(user),
+                               'type': 'HUMAN'},
+                    'createTime': '2018-08-04T01:36:33.832895Z',
+                }
+            self.memberships[name] = members
+
+    def next_id(self):
+        return next(self._ids)
+
+
+def _id(rng, digits=False):
+    if digits:
+        return str(rng.randrange(10 ** 20, 10 ** 21))
+    return 'AAAA' + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789_-')
+                            for _ in range(7))
+
+
+def _page(items, key, query):
+    try:
+        start = int(query.get('pageToken') or 0)
+        size = min(int(query.get('pageSize') or 100), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError(400, 'Invalid page token or page size') from None
+    if start < 0 or size <= 0:
+        raise ApiError(400, 'Invalid page token or page size')
+    response = {key: items[start:start + size]}
+    if start + size < len(items):
+        response['nextPageToken'] = str(start + size)
+    return response
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, content_type='application/json; charset=UTF-8',
+              headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, body, headers=None):
+        self._send(status, json.dumps(body).encode('utf-8'), headers=headers)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _handle(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        body = self._read_body()
+        if url.path == '/token' and method == 'POST':
+            return self._token()
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        server.record(method, url.path, query, self.headers.get('Authorization'))
+        try:
+            server.before_request()
+            if url.path == '/batch' and method == 'POST':
+                return self._batch(body)
+            status, response = 200, server.dispatch(method, url.path, query, body)
+        except ApiError as e:
+            return self._send_json(e.status, e.body(), e.headers)
+        self._send_json(status, response)
+
+    def _token(self):
+        try:
+            self.server.before_request()
+        except ApiError as e:
+            # google-auth retries token requests that fail with temporarily_unavailable
+            retryable = e.status == 429 or e.status >= 500
+            error = 'temporarily_unavailable' if retryable else 'invalid_grant'
+            return self._send_json(e.status, {'error': error, 'error_description': e.message},
+                                   e.headers)
+        self._send_json(200, self.server.issue_token())
+
+    def _batch(self, body):
+        # Each part of the multipart/mixed body wraps one HTTP request
+        header = 'Content-Type: {}\r\n\r\n'.format(self.headers['Content-Type'])
+        multipart = BytesParser().parsebytes(header.encode('utf-8') + body)
+        parts = []
+        for part in multipart.get_payload():
+            request = part.get_payload(decode=True).replace(b'\r\n', b'\n')
+            request_line, _, rest = request.partition(b'\n')
+            method, url, _ = request_line.decode('utf-8').split(' ')
+            _, _, request_body = rest.partition(b'\n\n')
+            url = urlparse(url)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                status, response = 200, self.server.dispatch(method, url.path, query,
+                                                             request_body)
+            except ApiError as e:
+                status, response = e.status, e.body()
+            parts.append(
+                '--batch_boundary\r\nContent-Type: application/http\r\n'
+                'Content-ID: <response-{}>\r\n\r\n'
+                'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n\r\n{}\r\n'.format(
+                    part['Content-ID'][1:-1], status, self.responses.get(status, ('',))[0],
+                    json.dumps(response)))
+        with self.server._lock:
+            self.server.batch_sizes.append(len(parts))
+        payload = (''.join(parts) + '--batch_boundary--').encode('utf-8')
+        self._send(200, payload, 'multipart/mixed; boundary=batch_boundary')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class FakeChatServer(ThreadingHTTPServer):
+    """ An in-process fake of the Hangouts Chat API on `host`:`port` (a free port by default).
+
+    `spaces` and `members_per_space` size the dataset generated from `seed`.
+    Every request is delayed by `latency` seconds (or a uniform random delay
+    between the two values of a `(min, max)` tuple). A `error_rate` share of
+    requests fail with 503 and a `rate_limit_rate` share with 429 and a
+    `Retry-After` header; `fail_next` queues specific failures. Injected
+    failures are drawn from a generator seeded with `seed`, so runs repeat.
+
+    `requests` holds the `(method, path, query)` of the latest API requests
+    (a batch is one `/batch` request), `request_counts` counts them by method
+    and `batch_sizes` holds the number of calls in each batch request.
+
+    The server is also an OAuth token endpoint at `token_uri` that issues
+    tokens valid for `token_lifetime` seconds (see `oauth_credentials`).
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, spaces=100, members_per_space=10, seed=0, latency=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, token_lifetime=3600, host='127.0.0.1',
+                 port=0):
+        super().__init__((host, port), ChatRequestHandler)
+        self.state = ChatState(spaces, members_per_space, seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.token_lifetime = token_lifetime
+        self.request_counts = {}
+        self.requests = collections.deque(maxlen=REQUEST_LOG_SIZE)
+        self.batch_sizes = []
+        self.token_requests = 0
+        self.authorization = None  # The Authorization header of the latest API request
+        self._rng = random.Random(seed)
+        self._failures = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def root_url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    @property
+    def token_uri(self):
+        return self.root_url + 'token'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """ Serves requests on a background thread. """
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # shutdown() would wait forever for a serve_forever() that was never started
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
+
+    def client(self, **kwargs):
+        """ Returns a `HangoutsChatAPI` that talks to this server with anonymous credentials. """
+        from google.auth.credentials import AnonymousCredentials
+        from .api import HangoutsChatAPI
+        kwargs.setdefault('credentials', AnonymousCredentials())
+        return HangoutsChatAPI(root_url=self.root_url, **kwargs)
+
+    def async_client(self, **kwargs):
+        """ Returns an `AsyncHangoutsChatAPI` that talks to this server. """
+        from google.auth.credentials import AnonymousCredentials
+        from .async_api import AsyncHangoutsChatAPI
+        kwargs.setdefault('credentials', AnonymousCredentials())
+        return AsyncHangoutsChatAPI(root_url=self.root_url, **kwargs)
+
+    def oauth_credentials(self):
+        """ Returns user credentials that refresh their token from this server's `token_uri`. """
+        from google.oauth2.credentials import Credentials
+        return Credentials(None, refresh_token='fake-refresh-token', token_uri=self.token_uri,
+                           client_id='fake-client-id', client_secret='fake-client-secret')
+
+    def issue_token(self):
+        with self._lock:
+            self.token_requests += 1
+            count = self.token_requests
+        return {'access_token': 'fake-token-{}'.format(count), 'token_type': 'Bearer',
+                'expires_in': self.token_lifetime}
+
+    def fail_next(self, status=503, count=1):
+        """ Makes the next `count` requests fail with `status`. """
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def record(self, method, path, query, authorization=None):
+        with self._lock:
+            self.request_counts[method] = self.request_counts.get(method, 0) + 1
+            self.requests.append((method, path, query))
+            self.authorization = authorization
+
+    def before_request(self):
+        latency = self.latency
+        with self._lock:
+            if isinstance(latency, tuple):
+                latency = self._rng.uniform(*latency)
+            status = self._failures.pop(0) if self._failures else None
+            if status is None:
+                roll = self._rng.random()
+                if roll < self.rate_limit_rate:
+                    status = 429
+                elif roll < self.rate_limit_rate + self.error_rate:
+                    status = 503
+        if latency:
+            time.sleep(latency)
+        if status == 429:
+            raise ApiError(429, 'Resource has been exhausted (e.g. check quota).',
+                           {'Retry-After': str(self.retry_after)})
+        if status is not None:
+            raise ApiError(status, 'Injected failure')
+
+    def dispatch(self, method, path, query, body):
+        """ Handles one API call and returns the response body, or raises `ApiError`. """
+        if not path.startswith('/v1/'):
+            raise ApiError(404, 'Unknown path {}'.format(path))
+        path = path[len('/v1/'):]
+        state = self.state
+        with state.lock:
+            if path == 'spaces' and method == 'GET':
+                return _page(list(state.spaces.values()), 'spaces', query)
+            if _SPACE.match(path) and method == 'GET':
+                return self._get(state.spaces, path)
+            match = _MEMBERS.match(path)
+            if match and method == 'GET':
+                members = state.memberships.get(match.group(1))
+                if members is None:
+                    raise ApiError(404, 'Space {} not found'.format(match.group(1)))
+                return _page(list(members.values()), 'memberships', query)
+            match = _MEMBER.match(path)
+            if match and method == 'GET':
+                return self._get(state.memberships.get(match.group(1), {}), path)
+            match = _MESSAGES.match(path)
+            if match and method == 'POST':
+                return self._create_message(match.group(1), query, _json(body))
+            if _MESSAGE.match(path):
+                if method == 'GET':
+                    return self._get(state.messages, path)
+                if method in ('PUT', 'PATCH'):
+                    return self._update_message(path, query, _json(body))
+                if method == 'DELETE':
+                    self._get(state.messages, path)
+                    del state.messages[path]
+                    return {}
+        raise ApiError(404, 'No {} handler for {}'.format(method, path))
+
+    @staticmethod
+    def _get(collection, name):
+        item = collection.get(name)
+        if item is None:
+            raise ApiError(404, '{} not found'.format(name))
+        return item
+
+    def _create_message(self, space_name, query, body):
+        state = self.state
+        space = self._get(state.spaces, space_name)
+        request_id = query.get('requestId')
+        if request_id is not None:  # A repeated requestId returns the message it created
+            existing = state.request_ids.get((space_name, request_id))
+            if existing in state.messages:
+                return state.messages[existing]
+        message_id = state.next_id()
+        thread_key = query.get('threadKey')
+        thread = body.get('thread') or {}
+        if thread_key is not None:
+            thread_name = state.threads.setdefault(
+                (space_name, thread_key), '{}/threads/{}'.format(space_name, message_id))
+        elif thread.get('name', '').startswith(space_name + '/threads/'):
+            thread_name = thread['name']
+        else:
+            thread_name = '{}/threads/{}'.format(space_name, message_id)
+        message = dict(body)
+        message.update({
+            'name': '{}/messages/{}'.format(space_name, message_id),
+            'sender': {'name': 'users/app', 'type': 'BOT'},
+            'createTime': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime()),
+            'thread': {'name': thread_name},
+            'space': {'name': space_name, 'type': space['type']},
+        })
+        state.messages[message['name']] = message
+        if request_id is not None:
+            state.request_ids[(space_name, request_id)] = message['name']
+        return message
+
+    def _update_message(self, name, query, body):
+        message = self._get(self.state.messages, name)
+        mask = query.get('updateMask')
+        if not mask:
+            raise ApiError(400, 'updateMask is required')
+        for field in mask.split(','):
+            field = field.strip()
+            if field not in ('text', 'cards', 'cardsV2', 'attachment'):
+                raise ApiError(400, 'Invalid updateMask field: {}'.format(field))
+            if field in body:
+                message[field] = body[field]
+            else:
+                message.pop(field, None)
+        message['lastUpdateTime'] = time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime())
+        return message
+
+
+def _json(body):
+    try:
+        return json.loads(body or b'{}')
+    except ValueError:
+        raise ApiError(400, 'Invalid JSON payload') from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a fake Hangouts Chat API server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--spaces', type=int, default=1000)
+    parser.add_argument('--members-per-space', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server = FakeChatServer(
+        spaces=args.spaces, members_per_space=args.members_per_space, seed=args.seed,
+        latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        host=args.host, port=args.port)
+    print('Serving a fake Hangouts Chat API at {}'.format(server.root_url))
+    print('Set HANGOUTS_CHAT_ROOT_URL={} to use it'.format(server.root_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,183 @@
 import logging
+import threading
 from enum import Enum
+from time import perf_counter
 
-
-class EventType(Enum):
-    ADDED_TO_SPACE = 'ADDED_TO_SPACE'
-    MESSAGE = 'MESSAGE'
-    CARD_CLICKED = 'CARD_CLICKED'
-    REMOVED_FROM_SPACE = 'REMOVED_FROM_SPACE'
-
-
-class SpaceType(Enum):
-    ROOM = 'ROOM'
-    DIRECT_MESSAGE = 'DM'
-
-
-class UserType(Enum):
-    HUMAN = 'HUMAN'
-    BOT = 'BOT'
+from . import instrumentation
+from .deferred import DeferredResponse
+from .event import ChatEvent, EventType, SpaceType, UserType, parse_action_parameters
+from .message import serialize_response
 
 
 class HangoutsChatHandler:
+    """ Dispatches Hangouts Chat events to the `handle_*` methods.
+
+    A single instance can handle events from many threads at once: per-event
+    state such as `sent_asynchronously` is kept per thread rather than on the
+    instance. The dispatch table mapping event and space type strings to enum
+    members and dispatch methods is built once for each subclass.
+
+    A `handle_*` method can return a `DeferredResponse` to reply with a
+    placeholder and finish the work on `deferred_executor`. Without an
+    executor the work runs immediately and its result is the response.
+
+    MESSAGE events are routed to the commands registered on `router` (a
+    `CommandRouter`) when one matches, and to `handle_message` otherwise.
+    Likewise, CARD_CLICKED events go to the action registered for their
+    `actionMethodName` on `actions` (an `ActionRegistry`), if there is one, and
+    to `handle_card_clicked` otherwise.
+
+    With a `deduplicator` (an `EventDeduplicator`), `handle_chat_event_json`
+    answers redelivered events with the stored response of the first delivery.
+    """
     SpaceType = SpaceType
     EventType = EventType
     ActionMethod = Enum
+    router = None
+    actions = None
+    deduplicator = None
 
-    def __init__(self, logger=None, debug=False):
+    def __init__(self, logger=None, debug=False, api=None, deferred_executor=None,
+                 deduplicator=None):
         if logger is None:
             logger = logging.getLogger(__name__)
         self.log = logger
         self.debug = debug
+        self.api = api
+        self.deferred_executor = deferred_executor
+        self.deduplicator = deduplicator
+        self._local = threading.local()
+
+    @property
+    def sent_asynchronously(self):
+        """ Whether the event currently being handled on this thread was sent asynchronously. """
+        return getattr(self._local, 'sent_asynchronously', False)
+
+    @classmethod
+    def _get_dispatch_table(cls):
+        # Looked up in the class's own __dict__ so each subclass gets its own table
+        table = cls.__dict__.get('_dispatch_table')
+        if table is None:
+            events = {
+                event_type.value: getattr(cls, '_dispatch_' + event_type.name.lower())
+                for event_type in cls.EventType}
+            spaces = {space_type.value: space_type for space_type in cls.SpaceType}
+            table = cls._dispatch_table = (events, spaces)
+        return table
+
+    def _get_dispatch(self, event):
+        """ Returns the dispatch method and `SpaceType` member for `event`.
+
+        Raises `ValueError` for an unknown event or space type, as looking the
+        value up in the `EventType` or `SpaceType` enum would.
+        """
+        events, spaces = self._get_dispatch_table()
+        dispatch = events.get(event['type'])
+        if dispatch is None:
+            raise ValueError('{!r} is not a valid {}'.format(
+                event['type'], self.EventType.__name__))
+        space_type = spaces.get(event['space']['type'])
+        if space_type is None:
+            raise ValueError('{!r} is not a valid {}'.format(
+                event['space']['type'], self.SpaceType.__name__))
+        return dispatch, space_type
 
     def _parse_action_parameters(self, parameters):
-        parsed_parameters = {}
-        for p in parameters:
-            key = p['key']
-            value = p['value']
-            parsed_parameters[key] = value
-        return parsed_parameters
+        return parse_action_parameters(parameters)
+
+    def _invalidate_space(self, event):
+        # Membership of the space has changed, so cached API data is stale
+        if self.api is not None:
+            self.api.invalidate_space(event['space']['name'])
+
+    def _dispatch_added_to_space(self, space_type, event):
+        self._invalidate_space(event)
+        return self.handle_added_to_space(space_type, event=event)
+
+    def _dispatch_removed_from_space(self, space_type, event):
+        self._invalidate_space(event)
+        return self.handle_removed_from_space(space_type, event=event)
+
+    def _dispatch_card_clicked(self, space_type, event):
+        actions = self.actions
+        if actions is not None:
+            action = actions.get(event.action_method_name)
+            if action is not None:
+                return action.dispatch(self, event)
+        action_method = self.ActionMethod(event.action_method_name)
+        return self.handle_card_clicked(action_method, event.action_parameters, event=event)
+
+    def _dispatch_message(self, space_type, event):
+        router = self.router
+        if router is not None:
+            match = router.match(event.message)
+            if match is not None:
+                return match.dispatch(self, event)
+        return self.handle_message(event.message, event=event)
+
+    def _defer(self, deferred, event):
+        if self.deferred_executor is None:
+            return deferred.work()
+        self.deferred_executor.submit(self, deferred, event)
+        return deferred.placeholder
+
+    def _complete_deferred(self, deferred, event):
+        # Runs on an executor thread, where the response is sent asynchronously
+        local = self._local
+        local.sent_asynchronously = True
+        try:
+            response = deferred.work()
+        except Exception as e:
+            self.log.exception('Error completing deferred chat event')
+            instrumentation.record_exception(event, e)
+            response = self.handle_exception(e, event=event)
+        finally:
+            local.sent_asynchronously = False
+        return self.handle_response(response)
 
     def handle_chat_event(self, event, sent_asynchronously=False):
+        """ Dispatches `event` (a dict, the JSON request body or a `ChatEvent`).
+
+        The `handle_*` methods receive the event as a `ChatEvent`, a `dict`
+        subclass. A request body that is not valid JSON raises `ValueError`.
+        """
+        event = ChatEvent.coerce(event)
+        instruments = instrumentation.active
+        if instruments is None:
+            return self._handle_chat_event(event, sent_asynchronously)
+        event_type = instrumentation.event_type_label(event)
+        start = perf_counter()
+        with instruments.span('hangouts_chat.event', {'event_type': event_type}):
+            response = self._handle_chat_event(event, sent_asynchronously)
+        instruments.record_event(event_type, perf_counter() - start)
+        return response
+
+    def handle_chat_event_json(self, event, sent_asynchronously=False):
+        """ Handles `event` like `handle_chat_event` and returns the response as JSON bytes. """
+        event = ChatEvent.coerce(event)
+
+        def compute():
+            return serialize_response(self.handle_chat_event(event, sent_asynchronously))
+
+        if self.deduplicator is None:
+            return compute()
+        return self.deduplicator.run(event, compute)
+
+    def _handle_chat_event(self, event, sent_asynchronously):
+        local = self._local
+        outer_sent_asynchronously = getattr(local, 'sent_asynchronously', False)
+        local.sent_asynchronously = sent_asynchronously
         try:
-            self.sent_asynchronously = sent_asynchronously
-            event_type = EventType(event['type'])
-            space_type = SpaceType(event['space']['type'])
-            if event_type == EventType.ADDED_TO_SPACE:
-                response = self.handle_added_to_space(space_type, event=event)
-            elif event_type == EventType.REMOVED_FROM_SPACE:
-                response = self.handle_removed_from_space(space_type, event=event)
-            elif event_type == EventType.CARD_CLICKED:
-                action_method = self.ActionMethod(event['action']['actionMethodName'])
-                parameters = event['action'].get('parameters', {})
-                if parameters:
-                    parameters = self._parse_action_parameters(parameters)
-                response = self.handle_card_clicked(action_method, parameters, event=event)
-            elif event_type == EventType.MESSAGE:
-                message = event['message']
-                response = self.handle_message(message, event=event)
+            dispatch, space_type = self._get_dispatch(event)
+            response = dispatch(self, space_type, event)
+            if isinstance(response, DeferredResponse):
+                response = self._defer(response, event)
         except Exception as e:
-            logging.exception('Error handling chat event')
+            self.log.exception('Error handling chat event')
+            instrumentation.record_exception(event, e)
             response = self.handle_exception(e, event=event)
+        finally:
+            local.sent_asynchronously = outer_sent_asynchronously
         return self.handle_response(response)
 
     def handle_response(self, response):
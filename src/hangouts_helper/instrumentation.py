@@ -0,0 +1,260 @@
+""" Metrics and tracing for the handler, the API client and message rendering.
+
+Instrumentation is off by default and costs a single module attribute check
+per call. `enable()` installs an `Instrumentation` that records:
+
+- `hangouts_helper_event_duration_seconds{event_type}`: `handle_chat_event` latency
+- `hangouts_helper_event_exceptions_total{event_type,exception}`: exceptions passed
+  to `handle_exception`
+- `hangouts_helper_api_request_duration_seconds{method,status}`: Chat API call latency
+- `hangouts_helper_render_duration_seconds{component}`: `Message.output()` time
+- `hangouts_helper_payload_bytes{kind}`: sizes of API request bodies, serialized
+  components and HTTP responses
+
+    instruments = instrumentation.enable(tracer=my_tracer)
+    ...
+    body = instruments.registry.prometheus_text()
+
+`tracer` is an optional callable `tracer(name, attributes)` returning a
+context manager that wraps each event and API call, for example OpenTelemetry's
+`trace.get_tracer(__name__).start_as_current_span`.
+"""
+import bisect
+import threading
+from time import perf_counter
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                    2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+active = None  # The enabled `Instrumentation`, or None
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def prometheus_lines(self):
+        yield '# HELP {} {}'.format(self.name, self.help)
+        yield '# TYPE {} counter'.format(self.name)
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield '{}{} {}'.format(self.name, _format_labels(self.labelnames, labels),
+                                   _format_value(value))
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, labels=()):
+        entry = self._values.get(labels)
+        return entry[2] if entry is not None else 0
+
+    def sum(self, labels=()):
+        entry = self._values.get(labels)
+        return entry[1] if entry is not None else 0.0
+
+    def prometheus_lines(self):
+        yield '# HELP {} {}'.format(self.name, self.help)
+        yield '# TYPE {} histogram'.format(self.name)
+        with self._lock:
+            values = sorted(
+                (labels, (list(counts), total, count))
+                for labels, (counts, total, count) in self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.labelnames, labels, ('le', _format_value(bound)))
+                yield '{}_bucket{} {}'.format(self.name, label_text, cumulative)
+            label_text = _format_labels(self.labelnames, labels)
+            yield '{}_sum{} {}'.format(self.name, label_text, _format_value(total))
+            yield '{}_count{} {}'.format(self.name, label_text, count)
+
+
+class MetricsRegistry:
+    """ The metrics recorded by an `Instrumentation`, exportable as Prometheus text. """
+
+    def __init__(self):
+        self.event_duration = Histogram(
+            'hangouts_helper_event_duration_seconds',
+            'Time taken by handle_chat_event, by event type.', ['event_type'])
+        self.event_exceptions = Counter(
+            'hangouts_helper_event_exceptions_total',
+            'Exceptions raised while handling chat events.', ['event_type', 'exception'])
+        self.api_duration = Histogram(
+            'hangouts_helper_api_request_duration_seconds',
+            'Time taken by Hangouts Chat API calls, by method and HTTP status.',
+            ['method', 'status'])
+        self.render_duration = Histogram(
+            'hangouts_helper_render_duration_seconds',
+            'Time taken to render components with output().', ['component'])
+        self.payload_bytes = Histogram(
+            'hangouts_helper_payload_bytes',
+            'Sizes of API request bodies, serialized components and HTTP responses.', ['kind'],
+            buckets=SIZE_BUCKETS)
+
+    @property
+    def metrics(self):
+        return [self.event_duration, self.event_exceptions, self.api_duration,
+                self.render_duration, self.payload_bytes]
+
+    def prometheus_text(self):
+        """ Returns every metric in the Prometheus text exposition format (version 0.0.4). """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.prometheus_lines())
+        return '\n'.join(lines) + '\n'
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Instrumentation:
+    """ Records metrics into `registry` and opens spans with the optional `tracer`. """
+
+    def __init__(self, registry=None, tracer=None):
+        self.registry = registry or MetricsRegistry()
+        self.tracer = tracer
+
+    def span(self, name, attributes):
+        if self.tracer is None:
+            return _NO_SPAN
+        return self.tracer(name, attributes)
+
+    def record_event(self, event_type, seconds):
+        self.registry.event_duration.observe((event_type,), seconds)
+
+    def record_exception(self, event_type, exception):
+        self.registry.event_exceptions.inc((event_type, type(exception).__name__))
+
+    def record_api_call(self, method, status, seconds):
+        self.registry.api_duration.observe((method, str(status)), seconds)
+
+    def record_render(self, component, seconds):
+        self.registry.render_duration.observe((component,), seconds)
+
+    def record_payload(self, kind, size):
+        self.registry.payload_bytes.observe((kind,), size)
+
+    def api_call(self, method, body=None):
+        """ Returns a context manager that times one API call and records its status.
+
+        `body` is the request body as bytes or str; a str is measured in UTF-8 bytes.
+        """
+        if body is not None:
+            self.record_payload('api_request', payload_size(body))
+        return _ApiCall(self, method)
+
+
+class _ApiCall:
+    __slots__ = ('instruments', 'method', 'span', 'start')
+
+    def __init__(self, instruments, method):
+        self.instruments = instruments
+        self.method = method
+
+    def __enter__(self):
+        self.span = self.instruments.span('hangouts_chat.api', {'method': self.method})
+        self.span.__enter__()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = perf_counter() - self.start
+        try:
+            self.span.__exit__(exc_type, exc, tb)
+        finally:
+            status = 200
+            if exc is not None:
+                status = getattr(getattr(exc, 'resp', None), 'status', None) or 'error'
+            self.instruments.record_api_call(self.method, status, elapsed)
+        return False
+
+
+def payload_size(body):
+    """ Returns the size in bytes of a payload given as bytes or str. """
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return len(body)
+
+
+def event_type_label(event):
+    """ Returns the event type of a `ChatEvent` for use as a metric label. """
+    return event.get('type') or 'UNKNOWN'
+
+
+def record_exception(event, exception):
+    """ Counts an exception raised while handling `event`, if instrumentation is enabled. """
+    if active is not None:
+        active.record_exception(event_type_label(event), exception)
+
+
+def enable(registry=None, tracer=None):
+    """ Turns instrumentation on and returns the `Instrumentation` now in use. """
+    global active
+    active = Instrumentation(registry=registry, tracer=tracer)
+    return active
+
+
+def disable():
+    global active
+    active = None
@@ -1,4 +1,44 @@
+import weakref
 from enum import Enum
+from operator import attrgetter
+from time import perf_counter
+
+from . import instrumentation
+
+
+def _dumps(value):
+    # Chooses the JSON backend on first use, since orjson is slow to import
+    global _dumps
+    try:
+        import orjson
+        _dumps = orjson.dumps
+    except ImportError:
+        import json
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+        def _dumps(value):
+            return encoder.encode(value).encode('utf-8')
+    return _dumps(value)
+
+
+def serialize_response(response):
+    """ Returns the JSON bytes of a handler response (a component, a dict or None). """
+    if response is None:
+        return b'{}'
+    if hasattr(response, 'to_json_bytes'):
+        return response.to_json_bytes()
+    return _dumps(response)
+
+
+def _write_components(write, components):
+    write(b'[')
+    first = True
+    for component in components:
+        if not first:
+            write(b',')
+        component._write_json(write)
+        first = False
+    write(b']')
 
 
 class ImageStyle(Enum):
@@ -44,42 +84,250 @@ class ResponseType(Enum):
     REQUEST_CONFIG = 'REQUEST_CONFIG'
 
 
+def _attribute(name):
+    # A public attribute kept in the `_<name>` slot; setting it invalidates the cached JSON
+    private = '_' + name
+
+    def set_value(self, value):
+        setattr(self, private, value)
+        self.invalidate()
+
+    return property(attrgetter(private), set_value)
+
+
 class OnClickMixin:
+    """ On-click behaviour for widgets.
+
+    `on_click` is None, `(LINK, url)` or `(ACTION, action_method, parameters)`.
+    Widgets declare an `_on_click` slot and set it to None in `__init__`.
+    """
+    __slots__ = ()
+
+    LINK = 'link'
+    ACTION = 'action'
+
+    on_click = _attribute('on_click')
+
+    @property
+    def link(self):
+        return self._on_click is not None and self._on_click[0] == OnClickMixin.LINK
+
+    @property
+    def link_url(self):
+        return self._on_click[1] if self.link else None
+
+    @property
+    def action(self):
+        return self._on_click is not None and self._on_click[0] == OnClickMixin.ACTION
+
+    @property
+    def action_method(self):
+        return self._on_click[1] if self.action else None
+
+    @property
+    def action_parameters(self):
+        return self._on_click[2] if self.action else None
+
     def add_link(self, url):
-        self.link = True
-        self.link_url = url
+        self.on_click = (OnClickMixin.LINK, url)
         return self
 
     def add_action(self, action_method, parameters=None):
-        self.action = True
-        self.action_method = action_method
-        self.action_parameters = parameters
+        self.on_click = (OnClickMixin.ACTION, action_method, parameters)
         return self
 
     def _update_on_click(self, widget):
-        link = getattr(self, 'link', False)
-        action = getattr(self, 'action', False)
-        if link:
+        on_click = self._on_click
+        if on_click is None:
+            return
+        if on_click[0] == OnClickMixin.LINK:
             data = {
                 'openLink': {
-                    'url': self.link_url
+                    'url': on_click[1]
                 }}
-        elif action:
-            action_data = {'actionMethodName': self.action_method.value}
-            if self.action_parameters:
-                action_data.update({
-                    'parameters': [{'key': k, 'value': v} for k, v in self.action_parameters.items()]
-                })
+        else:
+            _, action_method, parameters = on_click
+            action_data = {'actionMethodName': action_method.value}
+            if parameters:
+                action_data['parameters'] = [
+                    {'key': k, 'value': v} for k, v in parameters.items()]
             data = {'action': action_data}
-        if link or action:
-            on_click = {'onClick': data}
-            widget.update(on_click)
-
-
-class Message:
+        widget['onClick'] = data
+
+    def _write_on_click(self, write, separator=b','):
+        on_click = self._on_click
+        if on_click is None:
+            return False
+        if on_click[0] == OnClickMixin.LINK:
+            write(separator + b'"onClick":{"openLink":{"url":' + _dumps(on_click[1]) + b'}}')
+        else:
+            _, action_method, parameters = on_click
+            write(separator + b'"onClick":{"action":{"actionMethodName":' +
+                  _dumps(action_method.value))
+            if parameters:
+                write(b',"parameters":[')
+                first = True
+                for k, v in parameters.items():
+                    write((b'{"key":' if first else b',{"key":') + _dumps(k) +
+                          b',"value":' + _dumps(v) + b'}')
+                    first = False
+                write(b']')
+            write(b'}}')
+        return True
+
+
+# Slots that hold cached state rather than the content of a component
+_CACHE_SLOTS = ('_parents', '_json', '__weakref__')
+
+
+class JSONMixin:
+    """ Serialization shared by all components.
+
+    A `Section` keeps the JSON bytes it serializes to until it changes.
+    Setting an attribute of a widget, or changing a list of children, drops
+    the cached bytes of every section the changed component was serialized
+    into, so `to_json_bytes()` reuses unchanged sections. `output()` builds a
+    new dict tree on every call.
+    """
+    __slots__ = ('_parents',)
+
+    def invalidate(self):
+        """ Drops the cached JSON of every section this component was serialized into. """
+        parents = self._parents
+        if parents is None:
+            return
+        for parent in parents if type(parents) is list else (parents,):
+            parent = parent()
+            if parent is not None:
+                parent.invalidate()
+
+    def _add_parent(self, parent):
+        # Components can be serialized into several parents; dead ones are dropped here
+        parents = self._parents
+        if parents is None:
+            self._parents = parent
+            return
+        parents = [p for p in (parents if type(parents) is list else (parents,))
+                   if p() is not None]
+        if parent not in parents:
+            parents.append(parent)
+        self._parents = parents[0] if len(parents) == 1 else parents
+
+    def __getstate__(self):
+        # The cached JSON and the weak references to parents are left out of copies and
+        # pickles; they are rebuilt when the copy is serialized
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name not in _CACHE_SLOTS and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        self._parents = None
+        if hasattr(type(self), '_json'):
+            self._json = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def to_json_bytes(self):
+        """ Serializes the component straight to compact UTF-8 JSON.
+
+        The result is identical to compact `json.dumps(self.output())`, without
+        building the intermediate dict tree.
+        """
+        chunks = []
+        self._write_json(chunks.append)
+        data = b''.join(chunks)
+        instruments = instrumentation.active
+        if instruments is not None:
+            instruments.record_payload(type(self).__name__, len(data))
+        return data
+
+    def write_json(self, fp):
+        """ Streams the JSON serialization to the binary file-like object `fp`. """
+        self._write_json(fp.write)
+
+
+class ContainerMixin(JSONMixin):
+    """ Serialization of widgets that contain other widgets, which invalidate it when changed. """
+    __slots__ = ('__weakref__',)
+
+    def _write_children(self, write, children):
+        # Records this component as the parent of each child (weakly, so children do not keep
+        # it alive), so changes to the children reach the sections it was serialized into
+        parent = children._owner = weakref.ref(self)
+        write(b'[')
+        first = True
+        for child in children:
+            if not first:
+                write(b',')
+            if child._parents is not parent:
+                child._add_parent(parent)
+            child._write_json(write)
+            first = False
+        write(b']')
+
+
+class _Children(list):
+    """ A list of child components that invalidates its owner when it is changed in place.
+
+    The owner is set (as a weak reference) when it is serialized, since there
+    is no cached JSON to drop before that.
+    """
+    __slots__ = ('_owner',)
+
+    def __init__(self, children=()):
+        super().__init__(children)
+        self._owner = None
+
+    def __reduce_ex__(self, protocol):
+        # Copies and pickles get their owner when the copied owner is serialized
+        return _Children, (list(self),)
+
+    def _changed(method):
+        def change(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            owner = self._owner
+            if owner is not None:
+                owner = owner()
+                if owner is not None:
+                    owner.invalidate()
+            return result
+        return change
+
+    append = _changed(list.append)
+    extend = _changed(list.extend)
+    insert = _changed(list.insert)
+    remove = _changed(list.remove)
+    pop = _changed(list.pop)
+    clear = _changed(list.clear)
+    sort = _changed(list.sort)
+    reverse = _changed(list.reverse)
+    __setitem__ = _changed(list.__setitem__)
+    __delitem__ = _changed(list.__delitem__)
+    __iadd__ = _changed(list.__iadd__)
+    __imul__ = _changed(list.__imul__)
+    del _changed
+
+
+def _children(name):
+    # A list of child components kept in the `_<name>` slot as a `_Children` list
+    private = '_' + name
+
+    def set_value(self, value):
+        setattr(self, private, _Children(value))
+        self.invalidate()
+
+    return property(attrgetter(private), set_value)
+
+
+class Message(JSONMixin):
+    __slots__ = ('cards', 'response_type', 'response_url', 'text')
     ResponseType = ResponseType
 
     def __init__(self, *cards, **kwargs):
+        self._parents = None
         self.cards = list(cards)
         self.response_type = kwargs.get('response_type')
         self.response_url = kwargs.get('response_url')
@@ -94,34 +342,77 @@ class Message:
     def add_card(self, card):
         self.cards.append(card)
 
+    def compile(self):
+        """ Compiles this message into a `MessageTemplate` (see `hangouts_helper.template`). """
+        from .template import compile_template
+        return compile_template(self)
+
     def output(self):
+        instruments = instrumentation.active
+        if instruments is None:
+            return self._output()
+        start = perf_counter()
+        message = self._output()
+        instruments.record_render(type(self).__name__, perf_counter() - start)
+        return message
+
+    def _output(self):
         message = {}
         if self.cards:
-            message.update({
-                'cards': [c.output() for c in self.cards]
-            })
+            message['cards'] = [c.output() for c in self.cards]
         if self.text is not None:
-            message.update({'text': self.text})
+            message['text'] = self.text
         if self.response_type is not None:
             response_type = {'type': self.response_type.value}
             if self.response_type == ResponseType.REQUEST_CONFIG:
-                response_type.update({'url': self.response_url})
-            message.update({'actionResponse': response_type})
+                response_type['url'] = self.response_url
+            message['actionResponse'] = response_type
         return message
 
+    def _write_json(self, write):
+        separator = b'{'
+        if self.cards:
+            write(b'{"cards":')
+            _write_components(write, self.cards)
+            separator = b','
+        if self.text is not None:
+            write(separator + b'"text":' + _dumps(self.text))
+            separator = b','
+        if self.response_type is not None:
+            write(separator + b'"actionResponse":{"type":' + _dumps(self.response_type.value))
+            if self.response_type == ResponseType.REQUEST_CONFIG:
+                write(b',"url":' + _dumps(self.response_url))
+            write(b'}')
+            separator = b','
+        write(b'{}' if separator == b'{' else b'}')
+
+
+class CardAction(OnClickMixin, JSONMixin):
+    __slots__ = ('_on_click', '_action_label')
+
+    action_label = _attribute('action_label')
 
-class CardAction(OnClickMixin):
     def __init__(self, label):
-        self.action_label = label
+        self._parents = None
+        self._on_click = None
+        self._action_label = label
 
     def output(self):
-        card_action = {'actionLabel': self.action_label}
+        card_action = {'actionLabel': self._action_label}
         self._update_on_click(card_action)
         return card_action
 
+    def _write_json(self, write):
+        write(b'{"actionLabel":' + _dumps(self._action_label))
+        self._write_on_click(write)
+        write(b'}')
+
+
+class Card(JSONMixin):
+    __slots__ = ('card_actions', 'sections', 'header')
 
-class Card:
     def __init__(self, *components):
+        self._parents = None
         self.card_actions = list()
         self.sections = list()
         self.header = None
@@ -144,144 +435,282 @@ class Card:
         card = {'sections': sections}
         if self.header:
             header = self.header.output()
-            card.update({'header': header})
+            card['header'] = header
         if self.card_actions:
             card_actions = [a.output() for a in self.card_actions]
-            card.update({'cardActions': card_actions})
+            card['cardActions'] = card_actions
         return card
 
+    def _write_json(self, write):
+        write(b'{"sections":')
+        _write_components(write, self.sections)
+        if self.header:
+            write(b',"header":')
+            self.header._write_json(write)
+        if self.card_actions:
+            write(b',"cardActions":')
+            _write_components(write, self.card_actions)
+        write(b'}')
+
+
+class Section(ContainerMixin):
+    __slots__ = ('_json', '_widgets', '_header')
+
+    widgets = _children('widgets')
+    header = _attribute('header')
 
-class Section:
     def __init__(self, *widgets):
-        self.widgets = list(widgets)
-        self.header = None
-        if self.widgets and isinstance(self.widgets[0], str):
-            self.header = self.widgets.pop(0)
+        self._json = self._parents = None
+        self._header = None
+        if widgets and isinstance(widgets[0], str):
+            self._header, widgets = widgets[0], widgets[1:]
+        self._widgets = _Children(widgets)
 
     def add_widget(self, widget):
-        self.widgets.append(widget)
+        self._widgets.append(widget)
+
+    def invalidate(self):
+        """ Drops the cached JSON of this section. """
+        self._json = None
 
     def output(self):
-        widgets = [w.output() for w in self.widgets]
+        widgets = [w.output() for w in self._widgets]
         section = {'widgets': widgets}
-        if self.header is not None:
-            section.update({'header': self.header})
+        if self._header is not None:
+            section['header'] = self._header
         return section
 
+    def _write_json(self, write):
+        data = self._json
+        if data is None:
+            chunks = []
+            self._write_children(chunks.append, self._widgets)
+            if self._header is not None:
+                chunks.append(b',"header":' + _dumps(self._header))
+            data = self._json = b'{"widgets":' + b''.join(chunks) + b'}'
+        write(data)
+
+
+class ButtonList(ContainerMixin):
+    __slots__ = ('_buttons',)
+
+    buttons = _children('buttons')
 
-class ButtonList:
     def __init__(self, *buttons):
-        self.buttons = list(buttons)
+        self._parents = None
+        self._buttons = _Children(buttons)
 
     def add_button(self, button):
-        self.buttons.append(button)
+        self._buttons.append(button)
 
     def output(self):
-        buttons = [b.output() for b in self.buttons]
+        buttons = [b.output() for b in self._buttons]
         return {'buttons': buttons}
 
+    def _write_json(self, write):
+        write(b'{"buttons":')
+        self._write_children(write, self._buttons)
+        write(b'}')
 
-class CardHeader:
+
+class CardHeader(JSONMixin):
+    __slots__ = ('_title', '_subtitle', '_image_url', '_image_style')
     ImageStyle = ImageStyle
 
+    title = _attribute('title')
+    subtitle = _attribute('subtitle')
+    image_url = _attribute('image_url')
+    image_style = _attribute('image_style')
+
     def __init__(self, title, subtitle, image_url=None, image_style=None):
-        self.title = title
-        self.subtitle = subtitle
-        self.image_url = image_url
-        self.image_style = image_style
+        self._parents = None
+        self._title = title
+        self._subtitle = subtitle
+        self._image_url = image_url
+        self._image_style = image_style
 
     def output(self):
         header = {
-            'title': self.title,
-            'subtitle': self.subtitle
+            'title': self._title,
+            'subtitle': self._subtitle
         }
-        if self.image_url is not None:
-            header.update({'imageUrl': self.image_url})
-        if self.image_style is not None:
-            header.update({'imageStyle': self.image_style.value})
+        if self._image_url is not None:
+            header['imageUrl'] = self._image_url
+        if self._image_style is not None:
+            header['imageStyle'] = self._image_style.value
         return header
 
+    def _write_json(self, write):
+        write(b'{"title":' + _dumps(self._title) + b',"subtitle":' + _dumps(self._subtitle))
+        if self._image_url is not None:
+            write(b',"imageUrl":' + _dumps(self._image_url))
+        if self._image_style is not None:
+            write(b',"imageStyle":' + _dumps(self._image_style.value))
+        write(b'}')
+
+
+class TextParagraph(JSONMixin):
+    __slots__ = ('_text',)
+
+    text = _attribute('text')
 
-class TextParagraph:
     def __init__(self, text):
-        self.text = text
+        self._parents = None
+        self._text = text
 
     def output(self):
-        text_paragraph = {'text': self.text}
+        text_paragraph = {'text': self._text}
         return {'textParagraph': text_paragraph}
 
+    def _write_json(self, write):
+        write(b'{"textParagraph":{"text":' + _dumps(self._text) + b'}}')
 
-class KeyValue(OnClickMixin):
+
+class KeyValue(OnClickMixin, JSONMixin):
+    __slots__ = ('_on_click', '_top_label', '_content', '_bottom_label', '_icon', '_icon_url',
+                 '_button')
     Icon = Icon
 
+    top_label = _attribute('top_label')
+    content = _attribute('content')
+    bottom_label = _attribute('bottom_label')
+    icon = _attribute('icon')
+    icon_url = _attribute('icon_url')
+    button = _attribute('button')
+
     def __init__(self, content, top_label=None, bottom_label=None, icon=None, icon_url=None, button=None):
-        self.top_label = top_label
-        self.content = content
-        self.bottom_label = bottom_label
-        self.icon = icon
-        self.icon_url = icon_url
-        self.button = button
+        self._parents = None
+        self._on_click = None
+        self._top_label = top_label
+        self._content = content
+        self._bottom_label = bottom_label
+        self._icon = icon
+        self._icon_url = icon_url
+        self._button = button
 
     def output(self):
-        key_value = {'content': self.content}
-        if '\n' in self.content:
-            key_value.update({'contentMultiline': True})
-        if self.top_label is not None:
-            key_value.update({'topLabel': self.top_label})
-        if self.bottom_label is not None:
-            key_value.update({'bottomLabel': self.bottom_label})
-        if self.button is not None:
-            key_value.update({'button': self.button})
-        if self.icon is not None:
-            key_value.update({'icon': self.icon.value})
-        elif self.icon_url is not None:
-            key_value.update({'iconUrl': self.icon_url})
+        key_value = {'content': self._content}
+        if '\n' in self._content:
+            key_value['contentMultiline'] = True
+        if self._top_label is not None:
+            key_value['topLabel'] = self._top_label
+        if self._bottom_label is not None:
+            key_value['bottomLabel'] = self._bottom_label
+        if self._button is not None:
+            key_value['button'] = self._button
+        if self._icon is not None:
+            key_value['icon'] = self._icon.value
+        elif self._icon_url is not None:
+            key_value['iconUrl'] = self._icon_url
         self._update_on_click(key_value)
         return {'keyValue': key_value}
 
+    def _write_json(self, write):
+        write(b'{"keyValue":{"content":' + _dumps(self._content))
+        if '\n' in self._content:
+            write(b',"contentMultiline":true')
+        if self._top_label is not None:
+            write(b',"topLabel":' + _dumps(self._top_label))
+        if self._bottom_label is not None:
+            write(b',"bottomLabel":' + _dumps(self._bottom_label))
+        if self._button is not None:
+            write(b',"button":' + _dumps(self._button))
+        if self._icon is not None:
+            write(b',"icon":' + _dumps(self._icon.value))
+        elif self._icon_url is not None:
+            write(b',"iconUrl":' + _dumps(self._icon_url))
+        self._write_on_click(write)
+        write(b'}}')
+
+
+class Image(OnClickMixin, JSONMixin):
+    __slots__ = ('_on_click', '_image_url', '_aspect_ratio')
+
+    image_url = _attribute('image_url')
+    aspect_ratio = _attribute('aspect_ratio')
 
-class Image(OnClickMixin):
     def __init__(self, image_url, aspect_ratio=None):
-        self.image_url = image_url
-        self.aspect_ratio = aspect_ratio
+        self._parents = None
+        self._on_click = None
+        self._image_url = image_url
+        self._aspect_ratio = aspect_ratio
 
     def output(self):
-        image = {'imageUrl': self.image_url}
-        if self.aspect_ratio is not None:
-            image.update({'aspectRatio': self.icon_url})
+        image = {'imageUrl': self._image_url}
+        if self._aspect_ratio is not None:
+            image['aspectRatio'] = self._aspect_ratio
         self._update_on_click(image)
         return {'image': image}
 
+    def _write_json(self, write):
+        write(b'{"image":{"imageUrl":' + _dumps(self._image_url))
+        if self._aspect_ratio is not None:
+            write(b',"aspectRatio":' + _dumps(self._aspect_ratio))
+        self._write_on_click(write)
+        write(b'}}')
 
-class ImageButton(OnClickMixin):
+
+class ImageButton(OnClickMixin, JSONMixin):
+    __slots__ = ('_on_click', '_icon_url', '_icon', '_name')
     Icon = Icon
 
+    icon_url = _attribute('icon_url')
+    icon = _attribute('icon')
+    name = _attribute('name')
+
     def __init__(self, icon=None, icon_url=None, name=None):
-        self.icon_url = icon_url
-        self.icon = icon
-        self.name = name
+        self._parents = None
+        self._on_click = None
+        self._icon_url = icon_url
+        self._icon = icon
+        self._name = name
 
     def output(self):
         button = {}
-        if self.icon is not None:
-            button = {'icon': self.icon.value}
-        elif self.icon_url is not None:
-            button = {'iconUrl': self.icon_url}
-        if self.name is not None:
-            button['name'] = self.name
+        if self._icon is not None:
+            button = {'icon': self._icon.value}
+        elif self._icon_url is not None:
+            button = {'iconUrl': self._icon_url}
+        if self._name is not None:
+            button['name'] = self._name
         self._update_on_click(button)
         return {'imageButton': button}
 
-
-class TextButton(OnClickMixin):
+    def _write_json(self, write):
+        separator = b'{'
+        if self._icon is not None:
+            write(b'{"imageButton":{"icon":' + _dumps(self._icon.value))
+            separator = b','
+        elif self._icon_url is not None:
+            write(b'{"imageButton":{"iconUrl":' + _dumps(self._icon_url))
+            separator = b','
+        else:
+            write(b'{"imageButton":')
+        if self._name is not None:
+            write(separator + b'"name":' + _dumps(self._name))
+            separator = b','
+        if not self._write_on_click(write, separator) and separator == b'{':
+            write(b'{')
+        write(b'}}')
+
+
+class TextButton(OnClickMixin, JSONMixin):
+    __slots__ = ('_on_click', '_text')
     Icon = Icon
 
+    text = _attribute('text')
+
     def __init__(self, text):
-        self.text = text
+        self._parents = None
+        self._on_click = None
+        self._text = text
 
     def output(self):
-        button = {'text': self.text}
+        button = {'text': self._text}
         self._update_on_click(button)
         return {'textButton': button}
 
-
+    def _write_json(self, write):
+        write(b'{"textButton":{"text":' + _dumps(self._text))
+        self._write_on_click(write)
+        write(b'}}')
@@ -0,0 +1,402 @@
+""" Replays recorded or synthetic Chat events through a handler and reports its performance.
+
+Events are read one line at a time from a JSONL capture (optionally gzipped)
+or generated on the fly, so inputs of any size can be replayed. Each event is
+passed to `handle_chat_event` and the response is serialized as it would be for
+an HTTP reply. The report gives throughput, p50/p95/p99 latency, error rates
+and response sizes per event type.
+
+    python -m hangouts_helper.replay myapp.bot:PizzaHandler events.jsonl.gz \\
+        --mode threads --concurrency 16 --rate 200
+    python -m hangouts_helper.replay myapp.bot:PizzaHandler --synthetic 10000 --json
+
+Handlers that call the Chat API can be pointed at a `FakeChatServer` with the
+`HANGOUTS_CHAT_ROOT_URL` environment variable.
+"""
+import argparse
+import asyncio
+import gzip
+import importlib
+import inspect
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+from time import perf_counter
+
+from . import instrumentation
+from .event import ChatEvent
+from .message import serialize_response
+from .scheduler import summarize_latencies
+
+MODES = ('threads', 'processes', 'asyncio')
+PERCENTILES = (50, 95, 99)
+
+# Names of the exceptions passed to `handle_exception` while handling the current event
+_exceptions = ContextVar('replay_exceptions', default=None)
+
+
+def read_events(path):
+    """ Yields the JSON bytes of each event in a JSONL file (`-` for stdin, `.gz` for gzip). """
+    if path == '-':
+        fp = sys.stdin.buffer
+    elif path.endswith('.gz'):
+        fp = gzip.open(path, 'rb')
+    else:
+        fp = open(path, 'rb')
+    try:
+        for line in fp:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if fp is not sys.stdin.buffer:
+            fp.close()
+
+
+def synthetic_events(count, seed=0, action_names=()):
+    """ Yields `count` generated events: mostly messages, some card clicks and membership changes.
+
+    Card clicks are only generated when `action_names` lists the handler's actions.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        space = {'name': 'spaces/AAAA{}'.format(i % 50), 'displayName': 'Room {}'.format(i % 50),
+                 'type': 'ROOM' if i % 3 else 'DM'}
+        event = {
+            'eventTime': '2018-08-04T01:36:33.832895Z',
+            'user': {'name': 'users/{}'.format(1000 + i % 200), 'displayName': 'User {}'.format(i),
+                     'type': 'HUMAN'},
+            'space': space,
+        }
+        kind = rng.random()
+        if kind < 0.7 or (kind < 0.9 and not action_names):
+            event['type'] = 'MESSAGE'
+            event['message'] = {
+                'name': '{}/messages/{}'.format(space['name'], i),
+                'text': '@bot hello {}'.format(i),
+                'argumentText': ' hello {}'.format(i),
+                'thread': {'name': '{}/threads/{}'.format(space['name'], i % 20)},
+                'annotations': [{'type': 'USER_MENTION', 'startIndex': 0, 'length': 4}]}
+        elif kind < 0.9:
+            event['type'] = 'CARD_CLICKED'
+            event['action'] = {'actionMethodName': rng.choice(action_names),
+                               'parameters': [{'key': 'row', 'value': str(i)}]}
+        elif kind < 0.97:
+            event['type'] = 'ADDED_TO_SPACE'
+        else:
+            event['type'] = 'REMOVED_FROM_SPACE'
+        yield json.dumps(event).encode('utf-8')
+
+
+def action_names(handler_class):
+    """ Returns the card action names a handler class responds to. """
+    names = []
+    if handler_class.actions is not None:
+        names.extend(handler_class.actions)
+    if handler_class.ActionMethod is not None:
+        names.extend(str(member.value) for member in handler_class.ActionMethod)
+    return names
+
+
+def load_handler(spec):
+    """ Imports a handler class given as `module:ClassName`. """
+    module_name, _, name = spec.partition(':')
+    if not name:
+        raise ValueError('Handler must be given as module:ClassName, not {!r}'.format(spec))
+    return getattr(importlib.import_module(module_name), name)
+
+
+def track_exceptions(handler):
+    """ Wraps `handler.handle_exception` to count exceptions the handler recovers from. """
+    handle_exception = handler.handle_exception
+
+    def wrapper(e, **kwargs):
+        exceptions = _exceptions.get()
+        if exceptions is not None:
+            exceptions.append(type(e).__name__)
+        return handle_exception(e, **kwargs)
+
+    handler.handle_exception = wrapper
+    return handler
+
+
+def handle_one(handler, body):
+    """ Handles one event and returns `(event_type, seconds, response_size, error)`.
+
+    `error` is the name of the exception raised by the handler, or None.
+    """
+    start = perf_counter()
+    try:
+        event = ChatEvent.from_bytes(body)
+    except ValueError as e:  # Not valid JSON, so it never reaches the handler
+        return 'INVALID', perf_counter() - start, 0, type(e).__name__
+    event_type = instrumentation.event_type_label(event)
+    exceptions = []
+    token = _exceptions.set(exceptions)
+    try:
+        response = handler.handle_chat_event(event)
+        if inspect.isawaitable(response):
+            response = asyncio.run(response)
+        size = len(serialize_response(response))
+    except Exception as e:
+        size = 0
+        exceptions.append(type(e).__name__)
+    finally:
+        _exceptions.reset(token)
+    return event_type, perf_counter() - start, size, exceptions[0] if exceptions else None
+
+
+async def handle_one_async(handler, body):
+    """ Version of `handle_one` for handlers whose `handle_chat_event` is a coroutine. """
+    start = perf_counter()
+    try:
+        event = ChatEvent.from_bytes(body)
+    except ValueError as e:  # Not valid JSON, so it never reaches the handler
+        return 'INVALID', perf_counter() - start, 0, type(e).__name__
+    event_type = instrumentation.event_type_label(event)
+    exceptions = []
+    token = _exceptions.set(exceptions)
+    try:
+        response = await handler.handle_chat_event(event)
+        size = len(serialize_response(response))
+    except Exception as e:
+        size = 0
+        exceptions.append(type(e).__name__)
+    finally:
+        _exceptions.reset(token)
+    return event_type, perf_counter() - start, size, exceptions[0] if exceptions else None
+
+
+class ReplayStats:
+    """ Latencies, errors and response sizes of replayed events, grouped by event type. """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.response_bytes = {}
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, event_type, seconds, size, error=None):
+        with self._lock:
+            latencies = self.latencies.get(event_type)
+            if latencies is None:
+                latencies = self.latencies[event_type] = array('d')
+                self.errors[event_type] = {}
+                self.response_bytes[event_type] = 0
+            latencies.append(seconds)
+            self.response_bytes[event_type] += size
+            if error is not None:
+                errors = self.errors[event_type]
+                errors[error] = errors.get(error, 0) + 1
+
+    @property
+    def count(self):
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    def summary(self):
+        """ Returns the report as a JSON-serializable dict. """
+        elapsed = (self.finished or time.monotonic()) - self.started
+        count = self.count
+        types = {}
+        for event_type, latencies in sorted(self.latencies.items()):
+            errors = sum(self.errors[event_type].values())
+            types[event_type] = {
+                'count': len(latencies),
+                'errors': dict(self.errors[event_type]),
+                'error_rate': errors / len(latencies),
+                'latency': summarize_latencies(latencies, PERCENTILES),
+                'response_bytes': {'total': self.response_bytes[event_type],
+                                   'mean': self.response_bytes[event_type] / len(latencies)},
+            }
+        errors = sum(sum(errors.values()) for errors in self.errors.values())
+        summary = {
+            'events': count,
+            'seconds': elapsed,
+            'throughput': count / elapsed if elapsed else 0.0,
+            'error_rate': errors / count if count else 0.0,
+            'types': types,
+        }
+        if count:
+            summary['latency'] = summarize_latencies(
+                itertools.chain.from_iterable(self.latencies.values()), PERCENTILES)
+        return summary
+
+    def format(self):
+        """ Returns the report as a text table (latencies in milliseconds). """
+        summary = self.summary()
+        lines = ['{:<20} {:>9} {:>8} {:>9} {:>9} {:>9} {:>11}'.format(
+            'event type', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'mean bytes')]
+        rows = list(summary['types'].items())
+        if 'latency' in summary:
+            total_bytes = sum(row['response_bytes']['total'] for _, row in rows)
+            rows.append(('all', {
+                'count': summary['events'],
+                'error_rate': summary['error_rate'],
+                'latency': summary['latency'],
+                'response_bytes': {'mean': total_bytes / summary['events']}}))
+        for event_type, row in rows:
+            latency = row['latency']
+            lines.append('{:<20} {:>9} {:>8.2%} {:>9.3f} {:>9.3f} {:>9.3f} {:>11.0f}'.format(
+                event_type, row['count'], row['error_rate'], latency['p50'] * 1e3,
+                latency['p95'] * 1e3, latency['p99'] * 1e3, row['response_bytes']['mean']))
+        lines.append('{} events in {:.2f}s ({:.1f} events/s)'.format(
+            summary['events'], summary['seconds'], summary['throughput']))
+        return '\n'.join(lines)
+
+
+class _Pacer:
+    """ Spaces events evenly to approach a target rate (events per second). """
+    __slots__ = ('interval', 'next')
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next = time.monotonic()
+
+    def delay(self):
+        """ Returns how long to wait before sending the next event. """
+        if not self.interval:
+            return 0.0
+        now = time.monotonic()
+        delay = self.next - now
+        # Do not try to catch up after falling behind, which would send a burst
+        self.next = max(self.next, now) + self.interval
+        return delay if delay > 0 else 0.0
+
+
+_worker_handler = None
+
+
+def _init_worker(handler_factory):
+    global _worker_handler
+    _worker_handler = track_exceptions(handler_factory())
+
+
+def _handle_in_worker(body):
+    return handle_one(_worker_handler, body)
+
+
+def _run_pool(pool, submit, events, concurrency, rate, stats):
+    # Bound the events in flight, so the input is only read as fast as it is handled
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    pacer = _Pacer(rate)
+
+    def done(future):
+        try:
+            stats.record(*future.result())
+        except Exception as e:  # e.g. a worker process died
+            stats.record('UNKNOWN', 0.0, 0, type(e).__name__)
+        finally:
+            slots.release()
+
+    with pool:
+        for body in events:
+            delay = pacer.delay()
+            if delay:
+                time.sleep(delay)
+            slots.acquire()
+            submit(pool, body).add_done_callback(done)
+
+
+async def _run_asyncio(handler, events, concurrency, rate, stats):
+    slots = asyncio.Semaphore(concurrency)
+    pacer = _Pacer(rate)
+    tasks = set()
+    coroutine_handler = inspect.iscoroutinefunction(handler.handle_chat_event)
+    loop = asyncio.get_running_loop()
+
+    async def run(body):
+        try:
+            if coroutine_handler:
+                result = await handle_one_async(handler, body)
+            else:
+                # handle_one sets up its own context, so no need to copy this one
+                result = await loop.run_in_executor(None, handle_one, handler, body)
+            stats.record(*result)
+        finally:
+            slots.release()
+
+    for body in events:
+        delay = pacer.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        await slots.acquire()
+        task = asyncio.ensure_future(run(body))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def replay(handler_factory, events, mode='threads', concurrency=8, rate=None):
+    """ Passes `events` (an iterable of JSON bytes) to a handler and returns `ReplayStats`.
+
+    `handler_factory` is a handler class or other callable returning a handler.
+    The `threads` and `asyncio` modes share one handler; the `processes` mode
+    creates one per worker process, so the factory must be picklable. At most
+    `concurrency` events are handled at a time, and `rate` caps the number of
+    events started per second. Exceptions passed to `handle_exception` count as
+    errors even when the handler recovers from them.
+    """
+    if mode not in MODES:
+        raise ValueError('mode must be one of {}'.format(', '.join(MODES)))
+    stats = ReplayStats()
+    if mode == 'threads':
+        handler = track_exceptions(handler_factory())
+        _run_pool(ThreadPoolExecutor(concurrency),
+                  lambda pool, body: pool.submit(handle_one, handler, body),
+                  events, concurrency, rate, stats)
+    elif mode == 'processes':
+        pool = ProcessPoolExecutor(
+            concurrency, initializer=_init_worker, initargs=(handler_factory,))
+        _run_pool(pool, lambda pool, body: pool.submit(_handle_in_worker, body),
+                  events, concurrency, rate, stats)
+    else:
+        handler = track_exceptions(handler_factory())
+        asyncio.run(_run_asyncio(handler, events, concurrency, rate, stats))
+    stats.finished = time.monotonic()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Replay Hangouts Chat events through a handler and report its performance.')
+    parser.add_argument('handler', help='handler class as module:ClassName')
+    parser.add_argument('events', nargs='?',
+                        help='JSONL file of events (.gz allowed, - for stdin)')
+    parser.add_argument('--synthetic', type=int, metavar='COUNT',
+                        help='generate COUNT events instead of reading a file')
+    parser.add_argument('--seed', type=int, default=0, help='seed for synthetic events')
+    parser.add_argument('--mode', choices=MODES, default='threads')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, help='target events per second (default: no limit)')
+    parser.add_argument('--limit', type=int, help='stop after this many events')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    if (args.events is None) == (args.synthetic is None):
+        parser.error('give either an events file or --synthetic COUNT')
+
+    handler_class = load_handler(args.handler)
+    if args.synthetic is not None:
+        events = synthetic_events(args.synthetic, args.seed, action_names(handler_class))
+    else:
+        events = read_events(args.events)
+    if args.limit is not None:
+        events = itertools.islice(events, args.limit)
+
+    stats = replay(handler_class, events, args.mode, args.concurrency, args.rate)
+    if args.json:
+        print(json.dumps(stats.summary(), indent=2, sort_keys=True))
+    else:
+        print(stats.format())
+
+
+if __name__ == '__main__':
+    main()
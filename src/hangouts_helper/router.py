@@ -0,0 +1,228 @@
+""" Command routing for MESSAGE events.
+
+Commands are registered with decorators on a `CommandRouter` and compiled
+into a prefix trie of command words (for fixed commands) and a combined
+regular expression (for patterns), so finding the route for a message does not
+depend on how many routes are registered.
+
+    class MyHandler(HangoutsChatHandler):
+        router = CommandRouter()
+
+        @router.command('order pizza')
+        def order_pizza(self, event, size='large'):
+            return Message(text='Ordering a {} pizza'.format(size))
+
+        @router.pattern(r'deploy (?P<service>\\w+) to (?P<env>\\w+)')
+        def deploy(self, event, service, env):
+            ...
+
+A message "@bot order pizza small" calls `order_pizza(handler, event, 'small')`.
+Messages that match no route go to `handle_message`.
+"""
+import re
+import shlex
+import threading
+
+_GROUP_NAME = re.compile(r'\(\?P<(\w+)>')
+_GROUP_REFERENCE = re.compile(r'\(\?P=(\w+)\)')
+# Inline global flags, which are only allowed at the start of an expression, and numbered
+# group references and conditionals, which would refer to the wrong group once the pattern
+# is part of a combined expression. An escaped backslash or parenthesis can also match,
+# which only means the pattern is matched on its own.
+_UNCOMBINABLE = re.compile(r'\(\?[aiLmsux]+\)|\\[1-9]|\(\?\(')
+_TOKEN = re.compile(r'\S+')
+
+
+def command_text(message):
+    """ Returns the text of `message` without the leading bot mention. """
+    text = message.get('argumentText')
+    if text is None:
+        text = message.get('text') or ''
+        for annotation in message.get('annotations', ()):
+            if annotation.get('type') == 'USER_MENTION' and annotation.get('startIndex') == 0:
+                text = text[annotation['length']:]
+                break
+    return text.strip()
+
+
+def split_arguments(text):
+    """ Splits command arguments like a shell, keeping quoted strings together. """
+    if '"' not in text and "'" not in text and '\\' not in text:
+        return text.split()
+    try:
+        return shlex.split(text)
+    except ValueError:  # e.g. an unbalanced quote
+        return text.split()
+
+
+class Route:
+    __slots__ = ('func', 'command', 'pattern', 'combinable', 'positional_groups',
+                 'named_groups')
+
+    def __init__(self, func, command=None, pattern=None):
+        self.func = func
+        self.command = command
+        self.pattern = pattern
+        self.combinable = True
+        # Indices of the pattern's groups in the router's combined expression
+        self.positional_groups = ()
+        self.named_groups = {}
+
+    def __repr__(self):
+        return 'Route({!r})'.format(self.command or self.pattern)
+
+
+class RouteMatch:
+    """ A matched route with the positional and keyword arguments for its function. """
+    __slots__ = ('route', 'args', 'kwargs')
+
+    def __init__(self, route, args, kwargs):
+        self.route = route
+        self.args = args
+        self.kwargs = kwargs
+
+    def dispatch(self, handler, event):
+        return self.route.func(handler, event, *self.args, **self.kwargs)
+
+
+class CommandRouter:
+    """ Routes message text to functions registered with `command` or `pattern`.
+
+    Fixed commands are matched word by word (the longest registered command
+    wins) and the remaining words are passed as positional arguments. Patterns
+    must match the whole text; their groups are passed as arguments, named
+    groups as keyword arguments. Commands are tried before patterns, and
+    patterns in the order they were registered. Matching ignores case unless
+    `case_sensitive` is set.
+    """
+
+    def __init__(self, case_sensitive=False):
+        self.case_sensitive = case_sensitive
+        self._commands = {}
+        self._patterns = []
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._commands) + len(self._patterns)
+
+    def _normalize(self, word):
+        return word if self.case_sensitive else word.lower()
+
+    def command(self, *names):
+        """ Registers the decorated function for one or more command names. """
+        def decorator(func):
+            for name in names:
+                words = tuple(self._normalize(word) for word in name.split())
+                if not words:
+                    raise ValueError('Command names cannot be empty')
+                if words in self._commands:
+                    raise ValueError('Command {!r} is already registered'.format(name))
+                self._commands[words] = Route(func, command=name)
+            self._compiled = None
+            return func
+        return decorator
+
+    def _flags(self):
+        return (0 if self.case_sensitive else re.IGNORECASE) | re.DOTALL
+
+    def pattern(self, *patterns):
+        """ Registers the decorated function for one or more regular expressions.
+
+        Patterns with inline global flags such as `(?x)`, numbered group
+        references or conditionals can't be part of the combined expression,
+        so each of them is matched on its own, still in registration order.
+        """
+        def decorator(func):
+            for pattern in patterns:
+                if isinstance(pattern, re.Pattern):
+                    pattern = pattern.pattern
+                re.compile(pattern, self._flags())  # Fail at registration for invalid patterns
+                route = Route(func, pattern=pattern)
+                route.combinable = _UNCOMBINABLE.search(pattern) is None
+                self._patterns.append(route)
+            self._compiled = None
+            return func
+        return decorator
+
+    def _compile_patterns(self, routes):
+        """ Compiles a run of pattern routes into one expression that matches any of them. """
+        flags = self._flags()
+        if len(routes) == 1:
+            expression = re.compile(routes[0].pattern, flags)
+            starts = [0]
+        else:
+            alternatives = []
+            for index, route in enumerate(routes):
+                # Prefix group names so the same name can be used by several patterns
+                prefix = '_{}_'.format(index)
+                pattern = _GROUP_NAME.sub(r'(?P<{}\1>'.format(prefix), route.pattern)
+                pattern = _GROUP_REFERENCE.sub(r'(?P={}\1)'.format(prefix), pattern)
+                alternatives.append('(?P<_r{}>{})'.format(index, pattern))
+            expression = re.compile('|'.join(alternatives), flags)
+            starts = [expression.groupindex['_r{}'.format(index)]
+                      for index in range(len(routes))]
+        for route, start in zip(routes, starts):
+            single = re.compile(route.pattern, flags)
+            route.named_groups = {
+                name: start + group for name, group in single.groupindex.items()}
+            named = set(single.groupindex.values())
+            route.positional_groups = tuple(
+                start + group for group in range(1, single.groups + 1) if group not in named)
+        return expression, routes
+
+    def _compile(self):
+        with self._lock:
+            compiled = self._compiled
+            if compiled is not None:
+                return compiled
+            trie = {}
+            for words, route in self._commands.items():
+                node = trie
+                for word in words:
+                    node = node.setdefault(word, {})
+                node[None] = route  # Words are never None, so this marks a complete command
+            # Consecutive combinable patterns share one expression; the others get their own
+            expressions = []
+            run = []
+            for route in self._patterns:
+                if route.combinable:
+                    run.append(route)
+                    continue
+                if run:
+                    expressions.append(self._compile_patterns(run))
+                    run = []
+                expressions.append(self._compile_patterns([route]))
+            if run:
+                expressions.append(self._compile_patterns(run))
+            compiled = self._compiled = (trie, expressions)
+            return compiled
+
+    def match_text(self, text):
+        """ Returns a `RouteMatch` for `text`, or None if no route matches. """
+        trie, expressions = self._compiled or self._compile()
+        if trie:
+            node = trie
+            route = None
+            end = 0
+            for token in _TOKEN.finditer(text):
+                node = node.get(self._normalize(token.group()))
+                if node is None:
+                    break
+                found = node.get(None)
+                if found is not None:
+                    route, end = found, token.end()
+            if route is not None:
+                return RouteMatch(route, split_arguments(text[end:]), {})
+        for expression, routes in expressions:
+            match = expression.fullmatch(text)
+            if match is not None:
+                route = routes[int(match.lastgroup[2:])] if len(routes) > 1 else routes[0]
+                args = [match.group(index) for index in route.positional_groups]
+                kwargs = {name: match.group(index) for name, index in route.named_groups.items()}
+                return RouteMatch(route, args, kwargs)
+        return None
+
+    def match(self, message):
+        """ Returns a `RouteMatch` for a Chat `message` dict, ignoring a leading bot mention. """
+        return self.match_text(command_text(message))
@@ -0,0 +1,301 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Full
+
+from .api import DEFAULT_UPDATE_MASK
+
+RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def is_retryable(error):
+    """ Whether an API call that raised `error` may succeed if it is sent again. """
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt, error, base, maximum):
+    """ Returns the seconds to wait before retry number `attempt` (from 0) after `error`.
+
+    The delay is drawn with full jitter from an exponential backoff of `base`
+    seconds, capped at `maximum`, and is at least the `Retry-After` of the
+    response, if it has one.
+    """
+    delay = random.uniform(0, min(maximum, base * 2 ** attempt))
+    retry_after = getattr(error, 'resp', {}).get('retry-after')
+    if retry_after is not None and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def summarize_latencies(latencies, percentiles=(50, 95)):
+    """ Returns the given percentiles, max and mean of a non-empty sequence of latencies. """
+    latencies = sorted(latencies)
+    summary = {
+        'p{}'.format(p): latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+        for p in percentiles}
+    summary['max'] = latencies[-1]
+    summary['mean'] = sum(latencies) / len(latencies)
+    return summary
+
+
+class TokenBucket:
+    """ Allows `rate` operations per second with bursts of up to `capacity`. Not thread-safe. """
+
+    def __init__(self, rate, capacity=None, timer=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.timer = timer
+        self.tokens = self.capacity
+        self.updated = timer()
+
+    def _refill(self):
+        now = self.timer()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens=1):
+        """ Seconds until `tokens` are available (0 if they are available now). """
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def consume(self, tokens=1):
+        self._refill()
+        self.tokens -= tokens
+
+
+def _merge_updates(queued, update):
+    # Combines a queued update's (name, message[, update_mask]) arguments with a newer update's
+    if len(update) == 2:  # A full update replaces everything queued
+        return update
+    name, message, update_mask = update
+    queued_mask = queued[2] if len(queued) > 2 else DEFAULT_UPDATE_MASK
+    fields = update_mask.split(',')
+    merged = {key: value for key, value in queued[1].items() if key not in fields}
+    merged.update(message)
+    fields += [field for field in queued_mask.split(',') if field not in fields]
+    return name, merged, ','.join(fields)
+
+
+class _Job:
+    __slots__ = ('method', 'args', 'space_name', 'update_name', 'future', 'merged', 'held',
+                 'sending', 'attempts', 'enqueued')
+
+    def __init__(self, method, args, space_name, update_name=None, future=None):
+        self.method = method
+        self.args = args
+        self.space_name = space_name
+        self.update_name = update_name
+        self.future = future or Future()
+        self.merged = []  # Futures of updates merged into this job while it was being sent
+        self.held = None  # (args, future) of updates made while this job was being sent
+        self.sending = False
+        self.attempts = 0
+        self.enqueued = time.monotonic()
+
+    def futures(self):
+        return [self.future] + self.merged
+
+
+class OutboundScheduler:
+    """ Sends messages through `HangoutsChatAPI` from a bounded pool of worker threads.
+
+    Calls are rate limited by a token bucket per space and a global token
+    bucket. Calls that fail with 429 or a 5xx status are retried with
+    exponential backoff and full jitter, honouring any `Retry-After` header.
+    Updates to a message that is still queued replace the queued body, so only
+    the latest version is sent. Partial updates (with an `update_mask`) are
+    merged into the queued update instead. Updates made while an update of the
+    same message is being sent are held back until it finishes, or merged into
+    it if it is retried, so an older version never overwrites a newer one.
+    Every call returns a `Future` for the API response.
+    """
+
+    def __init__(self, api, workers=4, max_queue=10000, space_rate=1.0, space_burst=5,
+                 global_rate=50.0, global_burst=50, max_retries=5, backoff_base=0.5,
+                 backoff_max=32.0, logger=None):
+        self.api = api
+        self.max_queue = max_queue
+        self.space_rate = space_rate
+        self.space_burst = space_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.log = logger or logging.getLogger(__name__)
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._space_buckets = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._pending_updates = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._latencies = deque(maxlen=1024)
+        self._counters = {'sent': 0, 'failed': 0, 'retried': 0, 'coalesced': 0}
+        self._workers = [
+            threading.Thread(target=self._worker, name='OutboundScheduler-{}'.format(i),
+                             daemon=True)
+            for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def create_message(self, message, space_name, thread_id=None, thread_key=None,
+                       timeout=None):
+        job = _Job('create_message', (message, space_name, thread_id, thread_key), space_name)
+        return self._submit(job, timeout)
+
+    def update_message(self, name, message, update_mask=None, timeout=None):
+        args = (name, message) if update_mask is None else (name, message, update_mask)
+        with self._lock:
+            job = self._pending_updates.get(name)
+            if job is not None:
+                if not job.sending:
+                    job.args = _merge_updates(job.args, args)
+                    self._counters['coalesced'] += 1
+                    return job.future
+                if job.held is None:
+                    job.held = (args, Future())
+                    self._pending += 1
+                else:
+                    job.held = (_merge_updates(job.held[0], args), job.held[1])
+                    self._counters['coalesced'] += 1
+                return job.held[1]
+        job = _Job('update_message', args, name.split('/messages/')[0], name)
+        return self._submit(job, timeout)
+
+    def delete_message(self, name, timeout=None):
+        job = _Job('delete_message', (name,), name.split('/messages/')[0])
+        return self._submit(job, timeout)
+
+    def _submit(self, job, timeout):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Cannot schedule new messages after shutdown')
+            if not self._not_full.wait_for(lambda: self._pending < self.max_queue, timeout):
+                raise Full('Outbound queue is full')
+            self._pending += 1
+            if job.update_name is not None:
+                self._pending_updates[job.update_name] = job
+            self._schedule(job, time.monotonic())
+        return job.future
+
+    def _schedule(self, job, ready_at):
+        heapq.heappush(self._heap, (ready_at, next(self._sequence), job))
+        self._ready.notify()
+
+    def _next_job(self):
+        with self._lock:
+            while True:
+                if not self._heap:
+                    if self._closed:
+                        return None
+                    self._ready.wait()
+                    continue
+                ready_at, _, job = self._heap[0]
+                now = time.monotonic()
+                if ready_at > now:
+                    self._ready.wait(ready_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                bucket = self._space_buckets.get(job.space_name)
+                if bucket is None:
+                    bucket = TokenBucket(self.space_rate, self.space_burst)
+                    self._space_buckets[job.space_name] = bucket
+                wait = max(bucket.wait_time(), self._global_bucket.wait_time())
+                if wait > 0:
+                    self._schedule(job, now + wait)
+                    continue
+                bucket.consume()
+                self._global_bucket.consume()
+                job.sending = True
+                return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                response = getattr(self.api, job.method)(*job.args)
+            except Exception as e:
+                if is_retryable(e) and job.attempts < self.max_retries:
+                    delay = backoff_delay(job.attempts, e, self.backoff_base, self.backoff_max)
+                    job.attempts += 1
+                    self.log.warning('Retrying %s for %s in %.2fs (%s)',
+                                     job.method, job.space_name, delay, e)
+                    with self._lock:
+                        self._counters['retried'] += 1
+                        job.sending = False
+                        if job.held is not None:
+                            # Retry with the updates made meanwhile, rather than send both
+                            args, future = job.held
+                            job.args = _merge_updates(job.args, args)
+                            job.merged.append(future)
+                            job.held = None
+                            self._pending -= 1
+                            self._counters['coalesced'] += 1
+                            self._not_full.notify()
+                        self._schedule(job, time.monotonic() + delay)
+                    continue
+                for future in self._finish(job, 'failed'):
+                    future.set_exception(e)
+            else:
+                for future in self._finish(job, 'sent'):
+                    future.set_result(response)
+
+    def _finish(self, job, outcome):
+        # Returns the futures to resolve with the job's outcome
+        with self._lock:
+            self._counters[outcome] += 1
+            self._latencies.append(time.monotonic() - job.enqueued)
+            self._pending -= 1
+            self._not_full.notify()
+            if job.update_name is not None:
+                if job.held is None:
+                    del self._pending_updates[job.update_name]
+                else:
+                    # Send the updates held back while this job was being sent
+                    args, future = job.held
+                    held = _Job(job.method, args, job.space_name, job.update_name, future)
+                    self._pending_updates[job.update_name] = held
+                    self._schedule(held, time.monotonic())
+            return job.futures()
+
+    @property
+    def queue_depth(self):
+        return self._pending
+
+    def metrics(self):
+        """ Returns queue depth, outcome counters and send latency (seconds) percentiles. """
+        with self._lock:
+            latencies = list(self._latencies)
+            metrics = dict(self._counters, queue_depth=self._pending)
+        if latencies:
+            metrics['latency'] = summarize_latencies(latencies)
+        return metrics
+
+    def shutdown(self, wait=True):
+        """ Stops accepting messages. With `wait`, blocks until queued messages are sent. """
+        with self._lock:
+            self._closed = True
+            self._ready.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
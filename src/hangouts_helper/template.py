@@ -0,0 +1,88 @@
+""" Compiled message templates.
+
+A `Message` or `Card` built with `Placeholder` values in place of strings is
+compiled once into a Python function that builds the output dict directly, so
+rendering skips the component tree and only fills in the named placeholders.
+
+    template = compile_template(Message(Card(Section(
+        KeyValue(top_label='Status', content=Placeholder('status'))))))
+    template.render(status='In Delivery')
+"""
+# Values whose repr() is a literal that evaluates back to them; anything else (such as
+# float('nan') or an Enum member) is bound through the render function's namespace
+_LITERAL_TYPES = (str, int, bool, type(None))
+
+
+class Placeholder(str):
+    """ Marks a value to be filled in when a compiled template is rendered.
+
+    The placeholder is a `str` (of its `default` text) so it can be used
+    anywhere a component expects a string while the template is built. It is
+    only filled in when it is a whole value: text built from it, such as
+    `'Hello ' + Placeholder('name')`, is a plain string and stays as it is.
+    """
+
+    def __new__(cls, name, default=''):
+        placeholder = super().__new__(cls, default)
+        placeholder.name = name
+        return placeholder
+
+    def __repr__(self):
+        return 'Placeholder({!r})'.format(self.name)
+
+
+class MessageTemplate:
+    """ A compiled template; `render(**values)` returns a new output dict on every call. """
+
+    def __init__(self, render, source, placeholders):
+        self._render = render
+        self.source = source
+        self.placeholders = frozenset(placeholders)
+
+    def render(self, **values):
+        return self._render(values)
+
+
+class _Compiler:
+    def __init__(self):
+        self.placeholders = set()
+        self.constants = []
+
+    def expression(self, value):
+        if isinstance(value, Placeholder):
+            self.placeholders.add(value.name)
+            return 'v[{!r}]'.format(value.name)
+        if isinstance(value, dict):
+            if isinstance(value.get('content'), Placeholder):
+                return self._key_value(value)
+            return self._dict(value)
+        if isinstance(value, list):
+            return '[' + ', '.join(self.expression(v) for v in value) + ']'
+        if type(value) in _LITERAL_TYPES:
+            return repr(value)
+        self.constants.append(value)
+        return 'c[{}]'.format(len(self.constants) - 1)
+
+    def _dict(self, value):
+        return '{' + ', '.join(
+            '{!r}: {}'.format(k, self.expression(v)) for k, v in value.items()) + '}'
+
+    def _key_value(self, value):
+        # `KeyValue` sets contentMultiline from its content, so decide it when rendering
+        value = {k: v for k, v in value.items() if k != 'contentMultiline'}
+        return '_multiline({})'.format(self._dict(value))
+
+
+def _multiline(key_value):
+    if '\n' in key_value['content']:
+        key_value['contentMultiline'] = True
+    return key_value
+
+
+def compile_template(component):
+    """ Compiles a `Message` (or any component with `output()`) into a `MessageTemplate`. """
+    compiler = _Compiler()
+    source = 'def render(v):\n    return {}\n'.format(compiler.expression(component.output()))
+    namespace = {'_multiline': _multiline, 'c': compiler.constants}
+    exec(compile(source, '<hangouts_helper template>', 'exec'), namespace)
+    return MessageTemplate(namespace['render'], source, compiler.placeholders)
@@ -0,0 +1,261 @@
+""" Access tokens shared between threads and processes, refreshed before they expire.
+
+A `TokenManager` wraps the credentials of a bot (usually service account
+credentials) in `SharedCredentials`. Clients that are given
+`manager.credentials` share one access token. A background thread replaces
+the token `refresh_margin` seconds before it expires, so requests do not wait
+for a token exchange.
+
+With a `cache_dir`, the token is also stored in a file there. Worker processes
+on the same host take turns under a file lock. The first process to refresh
+asks the auth server for a token, and the others read it from the file.
+
+    manager = TokenManager(get_credentials(), cache_dir='/var/run/mybot')
+    manager.start()
+    api = HangoutsChatAPI(credentials=manager.credentials)
+
+Locking between processes uses `fcntl`. Where it is unavailable (Windows),
+processes do not wait for each other and may each refresh the token.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from google.auth import credentials as google_credentials
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_REFRESH_MARGIN = 5 * 60  # Seconds before expiry to replace a token
+# google-auth treats tokens this close to expiry as invalid (3 minutes 45 seconds in current
+# releases, 20 seconds in older ones), so refreshing later is too late
+MINIMUM_REFRESH_MARGIN = 225
+RETRY_INTERVAL = 10  # Seconds between attempts after a failed refresh
+
+
+def _timestamp(expiry):
+    # google-auth keeps expiry times as naive UTC datetimes
+    if expiry is None:
+        return None
+    return expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _expiry(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class TokenFileCache:
+    """ An access token stored in a JSON file that is readable only by its owner. """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+
+    def read(self):
+        """ Returns the cached `(token, expiry timestamp)`, or None if there is none. """
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            return data['token'], data.get('expiry')
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write(self, token, expiry):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'token': token, 'expiry': expiry}, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def lock(self):
+        """ Returns a context manager holding an exclusive lock shared by all processes. """
+        return _FileLock(self.lock_path)
+
+
+class _FileLock:
+    __slots__ = ('path', 'fd')
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(self.fd)
+                self.fd = None
+                raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        return False
+
+
+class SharedCredentials(google_credentials.Credentials):
+    """ Credentials whose token comes from `source` and is shared through an optional cache.
+
+    `source` is any refreshable google-auth credentials. `cache` is a
+    `TokenFileCache` or None. A token counts as due for refresh once it
+    expires within `refresh_margin` seconds. Refreshing is thread-safe: one
+    thread refreshes while the others wait and then use its token.
+    """
+
+    def __init__(self, source, cache=None, refresh_margin=DEFAULT_REFRESH_MARGIN):
+        super().__init__()
+        self.source = source
+        self.cache = cache
+        self.refresh_margin = max(refresh_margin, MINIMUM_REFRESH_MARGIN)
+        self.refreshes = 0  # Tokens this process requested from the auth server
+        self._lock = threading.Lock()
+
+    def _fresh(self, expiry_timestamp):
+        return expiry_timestamp is None or expiry_timestamp - time.time() > self.refresh_margin
+
+    @property
+    def due(self):
+        """ Whether the token is missing or expires within `refresh_margin` seconds. """
+        return self.token is None or not self._fresh(_timestamp(self.expiry))
+
+    def refresh(self, request):
+        with self._lock:
+            if not self.due:  # Another thread refreshed while this one waited
+                return
+            if self.cache is None:
+                self._refresh_source(request)
+                return
+            if self._load_cached():
+                return
+            with self.cache.lock():
+                if self._load_cached():  # Another process refreshed while this one waited
+                    return
+                self._refresh_source(request)
+                self.cache.write(self.token, _timestamp(self.expiry))
+
+    def _load_cached(self):
+        cached = self.cache.read()
+        if cached is None or not self._fresh(cached[1]):
+            return False
+        self.token, expiry = cached
+        self.expiry = _expiry(expiry)
+        return True
+
+    def _refresh_source(self, request):
+        self.source.refresh(request)
+        self.refreshes += 1
+        self.token = self.source.token
+        self.expiry = self.source.expiry
+
+
+def cache_key(source, scopes=None):
+    """ Returns a file-name-safe key for the identity of `source` credentials. """
+    identity = (getattr(source, 'service_account_email', None)
+                or getattr(source, 'client_id', None)
+                or type(source).__name__)
+    scopes = scopes or getattr(source, 'scopes', None) or ()
+    text = '{}|{}'.format(identity, ' '.join(sorted(scopes)))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+class TokenManager:
+    """ Keeps shared credentials refreshed on a background thread.
+
+    `credentials` is the `SharedCredentials` to give to API clients. With a
+    `cache_dir`, tokens are shared with other processes that use the same
+    directory and source credentials. `request` is the google-auth transport
+    request used for token exchanges; by default one backed by `httplib2`.
+    Each process wakes at a random time in the first half of the refresh
+    margin, so that one of them refreshes and the others find its token.
+    """
+
+    def __init__(self, source, cache_dir=None, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 request=None, logger=None):
+        cache = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, 'token-{}.json'.format(cache_key(source)))
+            cache = TokenFileCache(path)
+        self.credentials = SharedCredentials(source, cache, refresh_margin)
+        self.log = logger or logging.getLogger(__name__)
+        self._request = request
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def request(self):
+        if self._request is None:
+            import google_auth_httplib2
+            import httplib2
+            self._request = google_auth_httplib2.Request(httplib2.Http())
+        return self._request
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def refresh(self):
+        """ Refreshes the token now if it is due. """
+        if self.credentials.due:
+            self.credentials.refresh(self.request)
+
+    def start(self):
+        """ Fetches a token if needed and starts refreshing in the background. """
+        self.refresh()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='TokenManager', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _next_delay(self):
+        credentials = self.credentials
+        expiry = _timestamp(credentials.expiry)
+        if credentials.token is None:
+            return RETRY_INTERVAL
+        if expiry is None:  # The token never expires
+            return None
+        remaining = expiry - time.time()
+        margin = credentials.refresh_margin
+        if remaining <= margin:  # Tokens that live shorter than the margin are renewed halfway
+            return max(remaining / 2, 1.0)
+        # Jitter spreads processes sharing a cache over the first half of the margin
+        return remaining - margin + random.uniform(0, margin / 2)
+
+    def _run(self):
+        while True:
+            delay = self._next_delay()
+            if self._stopped.wait(delay):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                self.log.exception('Error refreshing access token')
+                if self._stopped.wait(RETRY_INTERVAL):
+                    return
@@ -0,0 +1,161 @@
+""" Message updates that send only what changed.
+
+A `MessageUpdater` remembers the last state sent for each message name. When a
+message is updated again, it compares each updatable field with that state.
+Unchanged updates are skipped, and other updates send only the changed fields
+with a matching `updateMask`. This suits bots that repeatedly update the same
+message, such as progress cards.
+
+    updater = MessageUpdater(api)
+    sent = updater.create_message(progress_card(0), 'spaces/AAAA')
+    for percent in progress():
+        updater.update_message(sent['name'], progress_card(percent))  # Often a no-op
+
+With an `OutboundScheduler` in place of `api`, calls return futures, so use
+`updater.create_message(...).result()['name']`.
+"""
+import functools
+import threading
+from concurrent.futures import Future
+
+from . import message as _message
+from .cache import TTLCache
+
+UPDATE_FIELDS = ('text', 'cards')  # The message fields covered by the default update mask
+
+
+def _render(message):
+    if hasattr(message, 'output'):
+        message = message.output()
+    return message
+
+
+def _field_state(message):
+    # Serialized values are compared, so later changes to the rendered dicts cannot leak in
+    dumps = _message._dumps
+    return {field: dumps(message[field]) for field in UPDATE_FIELDS if field in message}
+
+
+def _changed_fields(state, previous):
+    if previous is None:
+        return list(UPDATE_FIELDS)
+    return [field for field in UPDATE_FIELDS if state.get(field) != previous.get(field)]
+
+
+def message_diff(previous, message):
+    """ Returns the `(body, update_mask)` that turns `previous` into `message`, or None.
+
+    Both are rendered message dicts; `previous` may be None if it is unknown,
+    in which case every updatable field is sent. Returns None if no updatable
+    field changed.
+    """
+    changed = _changed_fields(
+        _field_state(message), None if previous is None else _field_state(previous))
+    if not changed:
+        return None
+    body = {field: message[field] for field in changed if field in message}
+    return body, ','.join(changed)
+
+
+class MessageUpdater:
+    """ Creates and updates messages through `api`, sending only the fields that changed.
+
+    `api` is a `HangoutsChatAPI` or anything with the same `create_message` and
+    `update_message` methods, such as an `OutboundScheduler`. The last state of
+    up to `maxsize` messages is kept for `ttl` seconds. Messages can be
+    components or rendered dicts. Updates to the same message are sent one at
+    a time, so they are compared and applied in order.
+
+    A state is only remembered once the API call succeeded. When `api` returns
+    a `Future`, that is when the future completes; until then, later updates
+    of the message send every updatable field.
+    """
+
+    def __init__(self, api, maxsize=10000, ttl=24 * 60 * 60):
+        self.api = api
+        self.sent = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self._states = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._locks = [threading.Lock() for _ in range(64)]
+        self._stats_lock = threading.Lock()
+
+    def _lock(self, name):
+        return self._locks[hash(name) % len(self._locks)]
+
+    def create_message(self, message, space_name, thread_id=None, thread_key=None):
+        """ Creates a message and remembers its state. Returns the API response. """
+        message = _render(message)
+        state = _field_state(message)
+        response = self.api.create_message(
+            message, space_name, thread_id=thread_id, thread_key=thread_key)
+        if isinstance(response, Future):
+            response.add_done_callback(functools.partial(self._created, state))
+        else:
+            self._created(state, response)
+        return response
+
+    def _created(self, state, response):
+        if isinstance(response, Future):
+            if response.cancelled() or response.exception() is not None:
+                return
+            response = response.result()
+        name = response.get('name') if isinstance(response, dict) else None
+        if name is not None:
+            self._states.set(name, (state, None))
+
+    def _updated(self, name, state, token, response):
+        # Remembers the state sent by an update once it succeeded, unless a later update
+        # of the message has been sent since. A failed update restores the previous state.
+        with self._lock(name):
+            entry = self._states.get(name)
+            if entry is None or entry[1] is not token:
+                return
+            if response.cancelled() or response.exception() is not None:
+                self._states.set(name, (entry[0], None))
+            else:
+                self._states.set(name, (state, None))
+
+    def update_message(self, name, message):
+        """ Sends the fields of `message` that differ from the last state sent for `name`.
+
+        Returns the API response, or None if nothing changed. The first update
+        of a message this updater has not seen sends every updatable field.
+        """
+        message = _render(message)
+        state = _field_state(message)
+        with self._lock(name):
+            # Entries are (last state sent successfully, token of the update in flight)
+            entry = self._states.get(name)
+            previous = None if entry is None else entry[0]
+            in_flight = entry is not None and entry[1] is not None
+            changed = _changed_fields(state, None if in_flight else previous)
+            if not changed:
+                with self._stats_lock:
+                    self.skipped += 1
+                return None
+            body = {field: message[field] for field in changed if field in message}
+            token = object()
+            self._states.set(name, (previous, token))
+            try:
+                response = self.api.update_message(name, body, update_mask=','.join(changed))
+            except BaseException:
+                self._states.set(name, (previous, None))
+                raise
+            if not isinstance(response, Future):
+                self._states.set(name, (state, None))
+        if isinstance(response, Future):
+            # Outside the lock, as the callback runs right away if the future is done
+            response.add_done_callback(functools.partial(self._updated, name, state, token))
+        with self._stats_lock:
+            self.sent += 1
+            self.bytes_sent += sum(len(state[field]) for field in changed if field in state)
+        return response
+
+    def forget(self, name):
+        """ Drops the remembered state of `name`, e.g. after the message was deleted. """
+        self._states.invalidate(name)
+
+    def stats(self):
+        return {'sent': self.sent, 'skipped': self.skipped, 'bytes_sent': self.bytes_sent,
+                'tracked': len(self._states)}
@@ -1,7 +1,25 @@
-from pkg_resources import get_distribution, DistributionNotFound
+DISTRIBUTION_NAME = 'hangouts-helper'
 
 
-try:
-    __version__ = get_distribution('hangouts-helper').version
-except DistributionNotFound:
-    __version__ = 'unknown'  # package not installed
+def get_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:  # Python < 3.8
+        from pkg_resources import get_distribution, DistributionNotFound
+        try:
+            return get_distribution(DISTRIBUTION_NAME).version
+        except DistributionNotFound:
+            return 'unknown'  # package not installed
+    try:
+        return version(DISTRIBUTION_NAME)
+    except PackageNotFoundError:
+        return 'unknown'  # package not installed
+
+
+def __getattr__(name):
+    # Resolved on first use; reading distribution metadata is not free
+    if name == '__version__':
+        global __version__
+        __version__ = get_version()
+        return __version__
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,93 @@
+import json
+from enum import Enum
+
+import pytest
+
+from hangouts_helper.actions import JSON, ActionRegistry, Converter, get_converter
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.message import TextButton
+
+
+class Size(Enum):
+    SMALL = 'S'
+    LARGE = 'L'
+
+
+class Legacy(Enum):
+    PING = 'PING'
+
+
+class PizzaHandler(HangoutsChatHandler):
+    ActionMethod = Legacy
+    actions = ActionRegistry()
+
+    @actions.action('ORDER', size=Size, count=int, toppings=JSON, express=bool)
+    def order(self, event, size, count, toppings=(), express=False, note=None):
+        return {'size': size, 'count': count, 'toppings': toppings, 'express': express,
+                'note': note}
+
+    def handle_card_clicked(self, action_method, action_parameters, event):
+        return {'legacy': action_method}
+
+
+def click_event(widget):
+    """ Builds the CARD_CLICKED event Chat sends when `widget` is clicked. """
+    action = json.loads(widget.to_json_bytes())['textButton']['onClick']['action']
+    return {'type': 'CARD_CLICKED', 'space': {'name': 'spaces/A', 'type': 'ROOM'},
+            'action': action}
+
+
+def test_parameters_round_trip_through_button():
+    order = PizzaHandler.actions['ORDER']
+    button = order.attach(TextButton('Order'), size=Size.LARGE, count=2,
+                          toppings=['ham', {'extra': 'cheese'}], express=True, note='hi')
+    assert button.action_method is order
+    assert button.action_parameters['count'] == '2'
+    assert button.output() == json.loads(button.to_json_bytes())
+    response = PizzaHandler().handle_chat_event(click_event(button))
+    assert response == {'size': Size.LARGE, 'count': 2, 'toppings': ['ham', {'extra': 'cheese'}],
+                        'express': True, 'note': 'hi'}
+
+
+def test_add_action_with_encoded_parameters():
+    order = PizzaHandler.actions['ORDER']
+    button = TextButton('Order').add_action(order, order.encode(size='S', count=1))
+    assert PizzaHandler().handle_chat_event(click_event(button))['size'] is Size.SMALL
+
+
+def test_unregistered_action_uses_handle_card_clicked():
+    button = TextButton('Ping').add_action(Legacy.PING)
+    assert PizzaHandler().handle_chat_event(click_event(button)) == {'legacy': Legacy.PING}
+
+
+def test_invalid_parameter_goes_to_handle_exception():
+    button = PizzaHandler.actions['ORDER'].attach(TextButton('Order'), size=Size.LARGE, count=1)
+    event = click_event(button)
+    event['action']['parameters'][1]['value'] = 'many'
+    response = PizzaHandler(debug=True).handle_chat_event(event)
+    assert response == {'text': "invalid literal for int() with base 10: 'many'"}
+
+
+def test_registry_lookup_by_enum_and_duplicates():
+    registry = ActionRegistry()
+    registry.action(Legacy.PING)(lambda self, event: None)
+    assert Legacy.PING in registry and 'PING' in registry
+    with pytest.raises(ValueError):
+        registry.action('PING')(lambda self, event: None)
+
+
+@pytest.mark.parametrize('spec, value', [
+    (int, -3), (float, 2.5), (bool, False), (str, 'text'), (Size, Size.SMALL),
+    (JSON, {'a': [1, 2]}),
+    (Converter('csv', ','.join, lambda value: value.split(',')), ['a', 'b']),
+])
+def test_converters_round_trip(spec, value):
+    converter = get_converter(spec)
+    encoded = converter.encode(value)
+    assert isinstance(encoded, str)
+    assert converter.decode(encoded) == value
+
+
+def test_unknown_converter_type():
+    with pytest.raises(TypeError):
+        get_converter(list)
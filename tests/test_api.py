@@ -0,0 +1,178 @@
+import threading
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from hangouts_helper import instrumentation
+from hangouts_helper.api import BatchError, HangoutsChatAPI
+from hangouts_helper.cache import TTLCache
+from hangouts_helper.fake_server import FakeChatServer
+
+
+@pytest.fixture
+def chat_server():
+    with FakeChatServer(spaces=5, members_per_space=5) as server:
+        yield server
+
+
+@pytest.fixture
+def api(chat_server):
+    return chat_server.client()
+
+
+def space_names(server):
+    return list(server.state.spaces)
+
+
+def create_messages(server, count):
+    space_name = space_names(server)[0]
+    api = server.client()
+    return space_name, [api.create_message({'text': str(i)}, space_name)['name']
+                        for i in range(count)]
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_iter_spaces_yields_all_pages(api, chat_server, prefetch):
+    spaces = list(api.iter_spaces(page_size=2, prefetch=prefetch))
+    assert [s['name'] for s in spaces] == space_names(chat_server)
+    assert [q.get('pageToken') for _, _, q in chat_server.requests] == [None, '2', '4']
+
+
+def test_iter_spaces_prefetches_next_page(api, chat_server):
+    spaces = api.iter_spaces(page_size=2)
+    assert next(spaces)['name'] == space_names(chat_server)[0]
+    # The second page is requested before the caller has consumed the first
+    for _ in range(50):
+        if len(chat_server.requests) == 2:
+            break
+        threading.Event().wait(0.01)
+    assert len(chat_server.requests) == 2
+    spaces.close()
+
+
+def test_single_page_starts_no_prefetch(api, chat_server, monkeypatch):
+    def new_http():
+        raise AssertionError('prefetch started for a single page')
+    monkeypatch.setattr(api, '_new_http', new_http)
+    assert len(api.list_spaces(page_size=10)) == 5
+    assert len(chat_server.requests) == 1
+
+
+def test_iter_memberships_with_fields(api, chat_server):
+    space_name = next(name for name, space in chat_server.state.spaces.items()
+                      if space['type'] == 'ROOM')
+    memberships = api.list_memberships(space_name, page_size=10, fields=['name', 'state'])
+    assert len(memberships) == 5
+    method, path, query = chat_server.requests[0]
+    assert (method, path) == ('GET', '/v1/{}/members'.format(space_name))
+    assert query['fields'] == 'nextPageToken,memberships(name,state)'
+
+
+def test_batch_returns_results_in_order(api, chat_server):
+    space_name, (first, second) = create_messages(chat_server, 2)
+    chat_server.requests.clear()
+    batch = api.batch()
+    batch.create_message({'text': 'hello'}, space_name)
+    batch.update_message(first, {'text': 'updated'})
+    batch.delete_message(space_name + '/messages/missing')
+    batch.delete_message(second)
+    results = batch.execute()
+    assert [r.request_id for r in results] == [0, 1, 2, 3]
+    assert results[0].response['text'] == 'hello'
+    assert results[0].response['space']['name'] == space_name
+    assert (results[1].response['name'], results[1].response['text']) == (first, 'updated')
+    assert not results[2].ok
+    assert results[2].exception.resp.status == 404
+    assert results[3].ok and second not in chat_server.state.messages
+    assert chat_server.batch_sizes == [4]
+    assert list(chat_server.requests) == [('POST', '/batch', {})]
+
+
+@pytest.mark.parametrize('from_environment', [False, True])
+def test_root_url_without_trailing_slash(chat_server, monkeypatch, from_environment):
+    from google.auth.credentials import AnonymousCredentials
+    root_url = chat_server.root_url.rstrip('/')
+    if from_environment:
+        monkeypatch.setenv('HANGOUTS_CHAT_ROOT_URL', root_url)
+        api = HangoutsChatAPI(credentials=AnonymousCredentials())
+    else:
+        api = HangoutsChatAPI(credentials=AnonymousCredentials(), root_url=root_url)
+    assert api.root_url == chat_server.root_url
+    space_name = space_names(chat_server)[0]
+    assert api.get_space(space_name)['name'] == space_name
+    batch = api.batch()
+    batch.create_message({'text': 'hello'}, space_name)
+    assert batch.execute()[0].response['text'] == 'hello'
+
+
+def test_batch_splits_oversized_batches(api, chat_server):
+    _, names = create_messages(chat_server, 250)
+    chat_server.requests.clear()
+    batch = api.batch(batch_size=100)
+    for name in names:
+        batch.update_message(name, {'text': 'updated'})
+    results = batch.execute()
+    assert len(results) == 250 and all(r.ok for r in results)
+    assert chat_server.batch_sizes == [100, 100, 50]
+    batched_round_trips = len(chat_server.requests)
+
+    chat_server.requests.clear()
+    for name in names:
+        api.delete_message(name)
+    assert batched_round_trips == 3
+    assert len(chat_server.requests) == 250
+
+
+def test_batch_failure_reports_sent_calls_and_is_not_resent(api, chat_server, mocker):
+    from googleapiclient.http import BatchHttpRequest
+    execute = BatchHttpRequest.execute
+    calls = []
+
+    def fail_second_request(self, http=None):
+        calls.append(self)
+        if len(calls) == 2:
+            raise ConnectionError('Connection reset')
+        return execute(self, http=http)
+
+    _, names = create_messages(chat_server, 5)
+    mocker.patch.object(BatchHttpRequest, 'execute', fail_second_request)
+    batch = api.batch(batch_size=2)
+    for name in names:
+        batch.delete_message(name)
+    with pytest.raises(BatchError) as info:
+        batch.execute()
+    assert isinstance(info.value.error, ConnectionError)
+    assert [r is not None and r.ok for r in info.value.results] == [True, True] + [False] * 3
+    assert len(batch) == 0 and batch.execute() == []
+    assert chat_server.batch_sizes == [2]
+
+
+def test_cached_values_are_copies(chat_server):
+    api = chat_server.client(cache=TTLCache())
+    space_name = space_names(chat_server)[0]
+    expected = api.list_memberships(space_name)[0]['name']
+    api.list_memberships(space_name)[0]['name'] = 'changed'
+    assert api.list_memberships(space_name)[0]['name'] == expected
+    assert len(chat_server.requests) == 1
+
+
+def test_batch_size_is_limited(api):
+    with pytest.raises(ValueError):
+        api.batch(batch_size=101)
+
+
+def test_api_calls_are_instrumented(api, chat_server):
+    space_name = space_names(chat_server)[0]
+    instruments = instrumentation.enable()
+    try:
+        api.list_spaces(page_size=2)
+        api.create_message({'text': 'hello'}, space_name)
+        with pytest.raises(HttpError):
+            api.delete_message(space_name + '/messages/missing')
+    finally:
+        instrumentation.disable()
+    durations = instruments.registry.api_duration
+    assert durations.count(('chat.spaces.list', '200')) == 3
+    assert durations.count(('chat.spaces.messages.create', '200')) == 1
+    assert durations.count(('chat.spaces.messages.delete', '404')) == 1
+    assert instruments.registry.payload_bytes.count(('api_request',)) == 1
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.errors import HttpError
+
+from hangouts_helper.async_api import AsyncHangoutsChatAPI
+
+
+def run_with_server(routes, test, root_path='/'):
+    async def _run():
+        app = web.Application()
+        app.add_routes(routes)
+        server = TestServer(app)
+        await server.start_server()
+        root_url = str(server.make_url(root_path))
+        try:
+            async with AsyncHangoutsChatAPI(credentials=AnonymousCredentials(),
+                                            root_url=root_url) as api:
+                return await test(api)
+        finally:
+            await server.close()
+    return asyncio.run(_run())
+
+
+def test_list_spaces_follows_page_tokens():
+    pages = {
+        None: {'spaces': [{'name': 'spaces/1'}], 'nextPageToken': 'abc'},
+        'abc': {'spaces': [{'name': 'spaces/2'}]},
+    }
+
+    async def list_spaces(request):
+        assert request.query['pageSize'] == '1'
+        return web.json_response(pages[request.query.get('pageToken')])
+
+    result = run_with_server(
+        [web.get('/v1/spaces', list_spaces)],
+        lambda api: api.list_spaces(page_size=1))
+    assert result == [{'name': 'spaces/1'}, {'name': 'spaces/2'}]
+
+
+def test_create_message_sends_thread_and_key():
+    async def create(request):
+        body = await request.json()
+        return web.json_response({
+            'parent': request.match_info['space'],
+            'threadKey': request.query['threadKey'],
+            'body': body})
+
+    result = run_with_server(
+        [web.post('/v1/spaces/{space}/messages', create)],
+        lambda api: api.create_message(
+            {'text': 'hello'}, 'spaces/AAA', thread_id={'name': 'spaces/AAA/threads/1'},
+            thread_key='key1'))
+    assert result == {
+        'parent': 'AAA',
+        'threadKey': 'key1',
+        'body': {'text': 'hello', 'thread': {'name': 'spaces/AAA/threads/1'}}}
+
+
+def test_root_url_without_trailing_slash():
+    async def get_space(request):
+        return web.json_response({'name': 'spaces/AAA'})
+
+    result = run_with_server(
+        [web.get('/chat/v1/spaces/AAA', get_space)],
+        lambda api: api.get_space('spaces/AAA'), root_path='/chat')
+    assert result == {'name': 'spaces/AAA'}
+
+
+def test_update_message_uses_update_mask():
+    async def update(request):
+        return web.json_response({'updateMask': request.query['updateMask']})
+
+    result = run_with_server(
+        [web.put('/v1/spaces/AAA/messages/1', update)],
+        lambda api: api.update_message('spaces/AAA/messages/1', {'text': 'hi'}))
+    assert result == {'updateMask': 'text,cards'}
+
+
+def test_concurrent_requests_respect_connection_limit():
+    in_flight = {'current': 0, 'max': 0}
+
+    async def get_space(request):
+        in_flight['current'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['current'])
+        await asyncio.sleep(0.01)
+        in_flight['current'] -= 1
+        return web.json_response({'name': 'spaces/' + request.match_info['space']})
+
+    async def test(api):
+        api.max_connections = 5
+        return await asyncio.gather(*[api.get_space('spaces/{}'.format(i)) for i in range(20)])
+
+    result = run_with_server([web.get('/v1/spaces/{space}', get_space)], test)
+    assert [r['name'] for r in result] == ['spaces/{}'.format(i) for i in range(20)]
+    assert in_flight['max'] <= 5
+
+
+def test_error_response_raises_http_error():
+    async def get_message(request):
+        return web.json_response({'error': {'code': 404}}, status=404)
+
+    with pytest.raises(HttpError) as excinfo:
+        run_with_server(
+            [web.get('/v1/spaces/AAA/messages/1', get_message)],
+            lambda api: api.get_message('spaces/AAA/messages/1'))
+    assert excinfo.value.resp.status == 404
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from enum import Enum
+
+import pytest
+
+from hangouts_helper.async_handler import AsyncHangoutsChatHandler, HangoutsChatASGIApp
+from hangouts_helper.handler import SpaceType
+from hangouts_helper.message import Message
+
+
+class ActionMethod(Enum):
+    TEST_ACTION = 'TEST_ACTION'
+
+
+class EchoHandler(AsyncHangoutsChatHandler):
+    ActionMethod = ActionMethod
+
+    async def handle_message(self, message, event):
+        await asyncio.sleep(0)
+        return Message(text=message['text'])
+
+    async def handle_card_clicked(self, action_method, action_parameters, event):
+        return {'text': '{}:{}'.format(action_method.name, action_parameters['id'])}
+
+    def handle_added_to_space(self, space_type, event):
+        return Message(text=space_type.name)
+
+
+def event(event_type='MESSAGE', space_type='DM', **extra):
+    return dict({'type': event_type, 'space': {'name': 'spaces/AAAA', 'type': space_type}},
+                **extra)
+
+
+def call_app(app, body, method='POST'):
+    """ Sends one request to an ASGI app and returns (status, headers, body). """
+    async def _call():
+        sent = []
+        requests = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            return requests.pop(0) if requests else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await app({'type': 'http', 'method': method, 'path': '/', 'headers': []}, receive, send)
+        start, response = sent
+        return start['status'], dict(start['headers']), response['body']
+    return asyncio.run(_call())
+
+
+def test_coroutine_handlers_are_awaited():
+    handler = EchoHandler()
+    response = asyncio.run(handler.handle_chat_event(event(message={'text': 'Hello'})))
+    assert response.output() == {'text': 'Hello'}
+    response = asyncio.run(handler.handle_chat_event(event(
+        'CARD_CLICKED', action={'actionMethodName': 'TEST_ACTION',
+                                'parameters': [{'key': 'id', 'value': '7'}]})))
+    assert response == {'text': 'TEST_ACTION:7'}
+
+
+def test_plain_handlers_are_supported():
+    response = asyncio.run(EchoHandler().handle_chat_event(event('ADDED_TO_SPACE', 'ROOM')))
+    assert response.output() == {'text': SpaceType.ROOM.name}
+
+
+def test_exception_is_passed_to_handle_exception():
+    class FailingHandler(AsyncHangoutsChatHandler):
+        async def handle_message(self, message, event):
+            raise ValueError('boom')
+
+        async def handle_exception(self, e, **kwargs):
+            return {'text': 'failed: {}'.format(e)}
+
+    response = asyncio.run(FailingHandler().handle_chat_event(event(message={'text': ''})))
+    assert response == {'text': 'failed: boom'}
+
+
+def test_concurrent_events_keep_their_own_state():
+    class StateHandler(AsyncHangoutsChatHandler):
+        async def handle_message(self, message, event):
+            await asyncio.sleep(0.01)
+            return (message['text'], self.sent_asynchronously)
+
+    handler = StateHandler()
+
+    async def handle_both():
+        return await asyncio.gather(
+            handler.handle_chat_event(event(message={'text': 'sync'})),
+            handler.handle_chat_event(event(message={'text': 'async'}), sent_asynchronously=True))
+
+    assert asyncio.run(handle_both()) == [('sync', False), ('async', True)]
+    assert handler.sent_asynchronously is False
+
+
+def test_asgi_app_returns_serialized_message():
+    app = HangoutsChatASGIApp(EchoHandler())
+    body = json.dumps(event(message={'text': 'Hi'})).encode('utf-8')
+    status, headers, response = call_app(app, body)
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json; charset=utf-8'
+    assert json.loads(response) == {'text': 'Hi'}
+
+
+def test_asgi_app_returns_empty_object_for_no_response():
+    app = HangoutsChatASGIApp(AsyncHangoutsChatHandler())
+    status, _, response = call_app(app, json.dumps(event('REMOVED_FROM_SPACE')).encode('utf-8'))
+    assert (status, response) == (200, b'{}')
+
+
+def test_asgi_app_responds_with_error_when_serialization_fails():
+    class UnserializableHandler(AsyncHangoutsChatHandler):
+        def handle_message(self, message, event):
+            return {'text': object()}
+
+    app = HangoutsChatASGIApp(UnserializableHandler())
+    status, _, response = call_app(app, json.dumps(event(message={'text': 'Hi'})).encode('utf-8'))
+    assert (status, response) == (500, b'{"error":"Internal server error"}')
+
+
+@pytest.mark.parametrize('method, body, status', [
+    ('GET', b'', 405),
+    ('POST', b'not json', 400),
+    ('POST', b'x' * 2048, 413),
+])
+def test_asgi_app_rejects_bad_requests(method, body, status):
+    app = HangoutsChatASGIApp(EchoHandler(), max_body_size=1024)
+    assert call_app(app, body, method=method)[0] == status
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from hangouts_helper.broadcast import Broadcast, BroadcastCheckpoint, request_id
+from hangouts_helper.fake_server import FakeChatServer
+from hangouts_helper.message import Message
+
+
+@pytest.fixture
+def server():
+    with FakeChatServer(spaces=40, members_per_space=1) as server:
+        yield server
+
+
+def texts_by_space(server):
+    counts = {}
+    for message in server.state.messages.values():
+        counts[message['space']['name']] = counts.get(message['space']['name'], 0) + 1
+    return counts
+
+
+def sent_spaces(path):
+    checkpoint = BroadcastCheckpoint(path)
+    checkpoint.open()
+    checkpoint.close()
+    return checkpoint.sent
+
+
+def test_broadcast_sends_once_to_each_space(server):
+    api = server.client()
+    reports = []
+    broadcast = Broadcast(api, Message(text='Maintenance tonight'), concurrency=4,
+                          progress=reports.append, progress_interval=0)
+    report = broadcast.run(api.iter_spaces())
+    assert report.sent == 40 and report.failed == 0
+    assert texts_by_space(server) == {name: 1 for name in server.state.spaces}
+    assert all(m['text'] == 'Maintenance tonight' for m in server.state.messages.values())
+    assert len(reports) == 41 and reports[-1] is report
+    assert report.throughput > 0
+
+
+def test_failures_are_reported_per_space(server):
+    spaces = list(server.state.spaces)
+    broadcast = Broadcast(server.client(), {'text': 'hi'}, concurrency=1, retries=0)
+    server.fail_next(500)
+    report = broadcast.run(spaces[:3] + ['spaces/missing'])
+    assert report.sent == 2
+    assert report.failures == {spaces[0]: 'HTTP 500 Injected failure',
+                               'spaces/missing': 'HTTP 404 spaces/missing not found'}
+
+
+def test_retryable_errors_are_retried(server):
+    space = next(iter(server.state.spaces))
+    server.fail_next(503, count=2)
+    report = Broadcast(server.client(), {'text': 'hi'}, backoff_base=0.01).run([space])
+    assert report.sent == 1 and texts_by_space(server) == {space: 1}
+
+
+def test_interrupted_broadcast_resumes_without_duplicates(server, tmp_path):
+    api = server.client()
+    path = str(tmp_path / 'broadcast.jsonl')
+    spaces = list(server.state.spaces)
+    server.fail_next(400)
+
+    def stop_early(report):
+        if report.sent >= 10:
+            broadcast.stop()
+
+    broadcast = Broadcast(api, {'text': 'hi'}, concurrency=2, checkpoint=path,
+                          progress=stop_early, progress_interval=0)
+    first = broadcast.run(spaces)
+    assert first.failed == 1 and first.sent < len(spaces) - 1
+
+    # A send that reached the server just before a crash, but was never recorded
+    unrecorded = [name for name in spaces if name not in sent_spaces(path)][-1]
+    api.create_message({'text': 'hi'}, unrecorded,
+                       request_id=request_id(first.broadcast_id, unrecorded))
+
+    second = Broadcast(api, {'text': 'hi'}, concurrency=2, checkpoint=path).run(spaces)
+    assert second.broadcast_id == first.broadcast_id
+    assert second.skipped == first.sent and second.failed == 0
+    assert texts_by_space(server) == {name: 1 for name in spaces}
+    assert set(sent_spaces(path)) == set(spaces)
+
+
+def test_checkpoint_errors_stop_the_run(server, tmp_path, monkeypatch):
+    record = BroadcastCheckpoint.record
+
+    def disk_full(self, space_name, message_name=None, error=None):
+        if len(self.sent) >= 5:
+            raise OSError(28, 'No space left on device')
+        record(self, space_name, message_name, error)
+
+    monkeypatch.setattr(BroadcastCheckpoint, 'record', disk_full)
+    broadcast = Broadcast(server.client(), {'text': 'hi'}, concurrency=1,
+                          checkpoint=str(tmp_path / 'broadcast.jsonl'))
+    with pytest.raises(OSError):
+        broadcast.run(list(server.state.spaces))
+    assert len(server.state.messages) < len(server.state.spaces)
+
+
+def test_checkpoint_rejects_another_message(tmp_path):
+    path = str(tmp_path / 'broadcast.jsonl')
+    checkpoint = BroadcastCheckpoint(path)
+    broadcast_id = checkpoint.open(body_digest='a')
+    checkpoint.record('spaces/A', 'spaces/A/messages/1')
+    checkpoint.close()
+    with open(path, 'a') as f:
+        f.write('{"space": "spaces/B", "mess')  # Cut short by a crash
+    checkpoint = BroadcastCheckpoint(path)
+    assert checkpoint.open(body_digest='a') == broadcast_id
+    assert checkpoint.sent == {'spaces/A': 'spaces/A/messages/1'}
+    checkpoint.record('spaces/C', error='HTTP 500')
+    checkpoint.close()
+    checkpoint = BroadcastCheckpoint(path)
+    assert checkpoint.open() == broadcast_id
+    checkpoint.close()
+    with pytest.raises(ValueError):  # Raised before the file is opened for appending
+        BroadcastCheckpoint(path).open(body_digest='b')
+    with pytest.raises(ValueError):
+        BroadcastCheckpoint(path).open(broadcast_id='other')
+    assert sent_spaces(path) == {'spaces/A': 'spaces/A/messages/1'}
+    with open(path) as f:
+        assert json.loads(f.readlines()[-1]) == {'space': 'spaces/C', 'error': 'HTTP 500'}
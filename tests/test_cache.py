@@ -0,0 +1,76 @@
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+from hangouts_helper.api import HangoutsChatAPI
+from hangouts_helper.cache import TTLCache
+from hangouts_helper.handler import HangoutsChatHandler
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=60, timer=timer)
+    cache.set('a', 1)
+    timer.now = 59
+    assert cache.get('a') == 1
+    timer.now = 60
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.stats()['evictions'] == 1
+
+
+def test_hit_and_miss_counters():
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+
+
+@pytest.fixture
+def api(mocker):
+    api = HangoutsChatAPI(credentials=AnonymousCredentials(), cache=TTLCache())
+    mocker.patch.object(api, '_execute', side_effect=lambda request, http=None: {
+        'uri': request.uri})
+    return api
+
+
+def test_api_caches_spaces_and_memberships(api):
+    assert api.get_space('spaces/AAA') == api.get_space('spaces/AAA')
+    api.get_membership('spaces/AAA/members/1')['uri'] = 'changed'
+    assert api.get_membership('spaces/AAA/members/1')['uri'] != 'changed'
+    assert api._execute.call_count == 2
+    assert api.cache.stats()['hits'] == 2
+
+
+def test_handler_invalidates_space_on_membership_events(api):
+    api.get_space('spaces/AAA')
+    api.get_membership('spaces/AAA/members/1')
+    api.get_space('spaces/BBB')
+    handler = HangoutsChatHandler(api=api)
+    handler.handle_chat_event({
+        'type': 'REMOVED_FROM_SPACE',
+        'space': {'name': 'spaces/AAA', 'type': 'ROOM'}})
+    assert ('space', 'spaces/AAA') not in api.cache
+    assert ('membership', 'spaces/AAA', 'spaces/AAA/members/1') not in api.cache
+    assert ('space', 'spaces/BBB') in api.cache
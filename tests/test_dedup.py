@@ -0,0 +1,138 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from hangouts_helper.async_handler import AsyncHangoutsChatHandler, HangoutsChatASGIApp
+from hangouts_helper.dedup import EventDeduplicator, event_key
+from hangouts_helper.event import ChatEvent
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.message import Message
+
+
+def message_event(name='spaces/A/messages/1', text='hello'):
+    return {'type': 'MESSAGE', 'eventTime': '2018-08-04T01:36:33.832895Z',
+            'space': {'name': 'spaces/A', 'type': 'ROOM'},
+            'user': {'name': 'users/1', 'type': 'HUMAN'},
+            'message': {'name': name, 'text': text}}
+
+
+class CountingHandler(HangoutsChatHandler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def handle_message(self, message, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        return Message(text='reply {}'.format(self.calls))
+
+
+def test_event_keys():
+    assert event_key(ChatEvent(message_event())) == 'MESSAGE|spaces/A/messages/1'
+    click = {'type': 'CARD_CLICKED', 'eventTime': 't1', 'user': {'name': 'users/1'},
+             'message': {'name': 'spaces/A/messages/1'}, 'action': {'actionMethodName': 'GO'}}
+    assert event_key(ChatEvent(click)) == 'CARD_CLICKED|spaces/A/messages/1|GO|users/1|t1'
+    added = {'type': 'ADDED_TO_SPACE', 'eventTime': 't1', 'space': {'name': 'spaces/A'},
+             'user': {'name': 'users/1'}}
+    assert event_key(ChatEvent(added)) == 'ADDED_TO_SPACE|spaces/A|users/1|t1'
+    assert event_key(ChatEvent({'type': 'ADDED_TO_SPACE'})) is None
+
+
+def test_redelivered_event_gets_stored_response():
+    handler = CountingHandler(deduplicator=EventDeduplicator())
+    first = handler.handle_chat_event_json(message_event())
+    second = handler.handle_chat_event_json(message_event())
+    assert first == second == b'{"text":"reply 1"}'
+    assert handler.calls == 1
+    handler.handle_chat_event_json(message_event(name='spaces/A/messages/2'))
+    assert handler.calls == 2
+    assert handler.deduplicator.stats() == {'hits': 1, 'waits': 0, 'misses': 2, 'pending': 0}
+
+
+def test_without_deduplicator_every_event_is_handled():
+    handler = CountingHandler()
+    handler.handle_chat_event_json(message_event())
+    assert handler.handle_chat_event_json(message_event()) == b'{"text":"reply 2"}'
+
+
+def test_concurrent_duplicates_wait_for_first_delivery():
+    handler = CountingHandler(deduplicator=EventDeduplicator())
+    handler.release.clear()
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(handler.handle_chat_event_json, message_event())
+                   for _ in range(8)]
+        while handler.deduplicator.stats()['waits'] < 7:
+            time.sleep(0.001)
+        handler.release.set()
+        results = {future.result() for future in futures}
+    assert results == {b'{"text":"reply 1"}'}
+    assert handler.calls == 1
+
+
+def test_failed_computation_is_not_stored():
+    dedup = EventDeduplicator()
+    event = ChatEvent(message_event())
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        dedup.run(event, fail)
+    assert dedup.run(event, lambda: b'ok') == b'ok'
+
+
+def test_pluggable_store():
+    class DictStore:
+        def __init__(self):
+            self.data = {}
+
+        def get(self, key, default=None):
+            return self.data.get(key, default)
+
+        def set(self, key, value, ttl=None):
+            self.data[key] = value
+
+    store = DictStore()
+    first = CountingHandler(deduplicator=EventDeduplicator(store=store))
+    second = CountingHandler(deduplicator=EventDeduplicator(store=store))
+    first.handle_chat_event_json(message_event())
+    assert second.handle_chat_event_json(message_event()) == b'{"text":"reply 1"}'
+    assert second.calls == 0
+    assert list(store.data) == ['MESSAGE|spaces/A/messages/1']
+
+
+def test_async_handler_deduplicates_concurrent_deliveries():
+    class AsyncCountingHandler(AsyncHangoutsChatHandler):
+        calls = 0
+
+        async def handle_message(self, message, **kwargs):
+            AsyncCountingHandler.calls += 1
+            await asyncio.sleep(0.01)
+            return Message(text='async')
+
+    app = HangoutsChatASGIApp(AsyncCountingHandler(deduplicator=EventDeduplicator()))
+    body = message_event()
+
+    async def post():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': json.dumps(body).encode('utf-8')}
+
+        async def send(message):
+            sent.append(message)
+
+        await app({'type': 'http', 'method': 'POST'}, receive, send)
+        return sent[1]['body']
+
+    async def main():
+        return await asyncio.gather(*[post() for _ in range(5)])
+
+    assert set(asyncio.run(main())) == {b'{"text":"async"}'}
+    assert AsyncCountingHandler.calls == 1
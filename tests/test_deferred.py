@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from queue import Full
+
+import pytest
+
+from hangouts_helper.async_handler import AsyncHangoutsChatHandler
+from hangouts_helper.deferred import DeferredExecutor, DeferredResponse
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.message import Message
+
+
+class FakeAPI:
+    def __init__(self):
+        self.calls = []
+
+    def create_message(self, message, space_name, thread_id=None, thread_key=None):
+        self.calls.append(('create_message', message, space_name, thread_id))
+        return {'name': space_name + '/messages/1'}
+
+    def update_message(self, name, message):
+        self.calls.append(('update_message', name, message))
+        return {'name': name}
+
+
+def message_event(text='Hello'):
+    return {
+        'type': 'MESSAGE',
+        'space': {'name': 'spaces/AAAA', 'type': 'ROOM'},
+        'message': {'name': 'spaces/AAAA/messages/BBBB', 'text': text,
+                    'thread': {'name': 'spaces/AAAA/threads/CCCC'}}
+    }
+
+
+class SlowHandler(HangoutsChatHandler):
+    def handle_message(self, message, event):
+        def work():
+            return Message(text='Done: {} ({})'.format(message['text'], self.sent_asynchronously))
+        return DeferredResponse(work, placeholder=Message(text='Working...'))
+
+
+@pytest.fixture
+def executor():
+    executor = DeferredExecutor(FakeAPI(), workers=2)
+    yield executor
+    executor.shutdown()
+
+
+def test_placeholder_is_returned_and_result_posted_to_thread(executor):
+    handler = SlowHandler(deferred_executor=executor)
+    response = handler.handle_chat_event(message_event())
+    assert response.output() == {'text': 'Working...'}
+    assert executor.drain(timeout=5)
+    assert executor.api.calls == [(
+        'create_message', {'text': 'Done: Hello (True)'}, 'spaces/AAAA',
+        {'name': 'spaces/AAAA/threads/CCCC'})]
+    metrics = executor.metrics()
+    assert metrics['submitted'] == metrics['completed'] == 1
+    assert set(metrics['total_latency']) == {'p50', 'p95', 'max', 'mean'}
+
+
+def test_update_replaces_event_message(executor):
+    class CardHandler(HangoutsChatHandler):
+        def handle_message(self, message, event):
+            return DeferredResponse(lambda: {'text': 'Updated'}, update=True)
+
+    assert CardHandler(deferred_executor=executor).handle_chat_event(message_event()) is None
+    executor.drain(timeout=5)
+    assert executor.api.calls == [
+        ('update_message', 'spaces/AAAA/messages/BBBB', {'text': 'Updated'})]
+
+
+def test_work_runs_immediately_without_executor():
+    response = SlowHandler().handle_chat_event(message_event())
+    assert response.output() == {'text': 'Done: Hello (False)'}
+
+
+def test_failed_work_posts_handle_exception_response(executor):
+    class FailingHandler(HangoutsChatHandler):
+        def handle_message(self, message, event):
+            return DeferredResponse(lambda: 1 / 0)
+
+    FailingHandler(debug=True, deferred_executor=executor).handle_chat_event(message_event())
+    executor.drain(timeout=5)
+    assert executor.api.calls[0][1] == {'text': 'division by zero'}
+
+
+def test_full_queue_rejects_work():
+    release = threading.Event()
+    executor = DeferredExecutor(FakeAPI(), workers=1, max_queue=1)
+    handler = HangoutsChatHandler()
+    deferred = DeferredResponse(release.wait)
+    try:
+        executor.submit(handler, deferred, message_event())
+        while executor.metrics()['running'] == 0:
+            release.wait(0.001)
+        executor.submit(handler, deferred, message_event())
+        with pytest.raises(Full):
+            executor.submit(handler, deferred, message_event())
+        assert executor.metrics()['rejected'] == 1
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_shutdown_drains_queued_work():
+    executor = DeferredExecutor(FakeAPI(), workers=1)
+    handler = HangoutsChatHandler()
+    futures = [executor.submit(handler, DeferredResponse(lambda: {'text': 'x'}), message_event())
+               for _ in range(20)]
+    executor.shutdown(wait=True)
+    assert all(f.done() and not f.cancelled() for f in futures)
+    assert len(executor.api.calls) == 20
+    with pytest.raises(RuntimeError):
+        executor.submit(handler, DeferredResponse(dict), message_event())
+
+
+def test_shutdown_without_wait_cancels_queued_work():
+    release = threading.Event()
+    executor = DeferredExecutor(FakeAPI(), workers=1)
+    handler = HangoutsChatHandler()
+    first = executor.submit(handler, DeferredResponse(release.wait), message_event())
+    queued = executor.submit(handler, DeferredResponse(dict), message_event())
+    while executor.metrics()['running'] == 0:
+        release.wait(0.001)
+    executor.shutdown(wait=False)
+    release.set()
+    assert queued.cancelled()
+    first.result(timeout=5)
+    assert executor.metrics()['cancelled'] == 1
+
+
+def test_async_handler_defers_coroutine_work(executor):
+    class AsyncSlowHandler(AsyncHangoutsChatHandler):
+        async def handle_message(self, message, event):
+            async def work():
+                await asyncio.sleep(0)
+                return Message(text='Async: {}'.format(self.sent_asynchronously))
+            return DeferredResponse(work, placeholder={'text': 'Working...'})
+
+    handler = AsyncSlowHandler(deferred_executor=executor)
+    assert asyncio.run(handler.handle_chat_event(message_event())) == {'text': 'Working...'}
+    executor.drain(timeout=5)
+    assert executor.api.calls[0][1]['text'] == 'Async: True'
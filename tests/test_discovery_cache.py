@@ -0,0 +1,70 @@
+import os
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+from hangouts_helper import discovery_cache
+from hangouts_helper.api import HangoutsChatAPI, clear_service_cache
+
+
+@pytest.fixture
+def document():
+    return {'name': 'chat', 'version': 'v1', 'revision': '20200101', 'resources': {}}
+
+
+def test_write_and_read_cached_document(tmpdir, document):
+    cache_dir = str(tmpdir)
+    discovery_cache.write_cached_document(cache_dir, document)
+    assert discovery_cache.read_cached_document(cache_dir) == document
+    # No temporary files are left behind after the atomic replace
+    assert os.listdir(cache_dir) == ['chat.v1.json']
+
+
+def test_cached_document_with_wrong_version_is_ignored(tmpdir, document):
+    cache_dir = str(tmpdir)
+    discovery_cache.write_cached_document(cache_dir, dict(document, version='v2'))
+    assert discovery_cache.read_cached_document(cache_dir) is None
+
+
+def test_stale_cache_is_refreshed(mocker, tmpdir, document):
+    cache_dir = str(tmpdir)
+    path = discovery_cache.write_cached_document(cache_dir, document)
+    os.utime(path, (0, 0))
+    newer = dict(document, revision='99990101')
+    mocker.patch.object(discovery_cache, 'fetch_document', return_value=newer)
+    assert discovery_cache.load_document(cache_dir, max_age=60) == newer
+    assert discovery_cache.read_cached_document(cache_dir) == newer
+
+
+def test_fetch_failure_falls_back_to_cached_document(mocker, tmpdir, document):
+    cache_dir = str(tmpdir)
+    path = discovery_cache.write_cached_document(cache_dir, dict(document, revision='99990101'))
+    os.utime(path, (0, 0))
+    mocker.patch.object(discovery_cache, 'fetch_document',
+                        side_effect=discovery_cache.DiscoveryDocumentError)
+    assert discovery_cache.load_document(cache_dir, max_age=60)['revision'] == '99990101'
+
+
+def test_bundled_document_is_used_without_cache_dir(mocker):
+    fetch = mocker.patch.object(discovery_cache, 'fetch_document')
+    document = discovery_cache.load_document()
+    assert document['name'] == 'chat'
+    fetch.assert_not_called()
+
+
+def test_clients_share_discovery_resources():
+    clear_service_cache()
+    first = HangoutsChatAPI(credentials=AnonymousCredentials())
+    second = HangoutsChatAPI(credentials=AnonymousCredentials())
+    assert first._service is second._service
+    assert first.http is not second.http
+
+
+def test_client_api_is_built_on_first_use():
+    api = HangoutsChatAPI(credentials=AnonymousCredentials())
+    assert api._api is None
+    request = api.api.spaces().messages().create(parent='spaces/A', body={'text': 'hi'})
+    assert request.http is api.http
+    assert api.api is api.api
+    assert api._service.build_document['schemas']['Message'] == {'id': 'Message', 'type': 'object'}
+    assert 'properties' in api._service.document['schemas']['Message']
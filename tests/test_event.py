@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from hangouts_helper.event import ChatEvent, EventType, SpaceType, UserType
+from hangouts_helper.handler import HangoutsChatHandler
+
+EVENT = {
+    'type': 'CARD_CLICKED',
+    'space': {'name': 'spaces/AAAA', 'type': 'DM'},
+    'user': {'name': 'users/1', 'type': 'HUMAN'},
+    'message': {'name': 'spaces/AAAA/messages/BBBB',
+                'thread': {'name': 'spaces/AAAA/threads/CCCC'}},
+    'action': {'actionMethodName': 'ORDER',
+               'parameters': [{'key': 'size', 'value': 'large'}, {'key': 'count', 'value': '2'}]}
+}
+
+
+@pytest.mark.parametrize('event', [
+    ChatEvent(EVENT),
+    ChatEvent.from_bytes(json.dumps(EVENT).encode('utf-8')),
+    ChatEvent.coerce(json.dumps(EVENT)),
+])
+def test_fields(event):
+    assert event.type is EventType.CARD_CLICKED
+    assert event.space_type is SpaceType.DIRECT_MESSAGE
+    assert event.user_type is UserType.HUMAN
+    assert event.thread == {'name': 'spaces/AAAA/threads/CCCC'}
+    assert event.action_method_name == 'ORDER'
+    assert event.action_parameters == {'size': 'large', 'count': '2'}
+    assert event.action_parameters is event.action_parameters
+    assert event['space']['name'] == 'spaces/AAAA'
+    assert event == EVENT
+
+
+@pytest.mark.parametrize('body', [b'not json', b'[]'])
+def test_invalid_body_raises_value_error(body):
+    with pytest.raises(ValueError):
+        ChatEvent.from_bytes(body)
+
+
+def test_event_is_a_dict():
+    event = ChatEvent.from_bytes(json.dumps(EVENT).encode('utf-8'))
+    assert isinstance(event, dict)
+    assert json.loads(json.dumps(event)) == EVENT
+    event['extra'] = 1
+    assert event['extra'] == 1 and 'extra' not in EVENT
+
+
+def test_missing_fields():
+    event = ChatEvent({'type': 'ADDED_TO_SPACE', 'space': {'name': 'spaces/A', 'type': 'ROOM'}})
+    assert event.message is None
+    assert event.thread is None
+    assert event.user_type is None
+    assert event.action_parameters == {}
+    assert 'message' not in event
+    assert event.get('message', 'missing') == 'missing'
+
+
+def test_event_is_slotted():
+    with pytest.raises(AttributeError):
+        ChatEvent(EVENT).extra = 1
+
+
+def test_unknown_event_type_is_a_value_error():
+    errors = []
+
+    class Handler(HangoutsChatHandler):
+        def handle_exception(self, e, **kwargs):
+            errors.append(e)
+
+    Handler().handle_chat_event({'type': 'UNKNOWN', 'space': {'name': 'spaces/A', 'type': 'ROOM'}})
+    Handler().handle_chat_event({'type': 'MESSAGE', 'space': {'name': 'spaces/A', 'type': 'X'}})
+    assert [type(e) for e in errors] == [ValueError, ValueError]
+
+
+def test_handler_accepts_request_body():
+    class Handler(HangoutsChatHandler):
+        def handle_message(self, message, event):
+            return {'text': message['text'], 'space_type': event.space_type}
+
+    body = json.dumps({'type': 'MESSAGE', 'space': {'name': 'spaces/A', 'type': 'ROOM'},
+                       'message': {'text': 'Hi'}}).encode('utf-8')
+    assert Handler().handle_chat_event(body) == {'text': 'Hi', 'space_type': SpaceType.ROOM}
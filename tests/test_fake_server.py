@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.errors import HttpError
+
+from hangouts_helper.api import HangoutsChatAPI
+from hangouts_helper.fake_server import FakeChatServer
+
+
+@pytest.fixture
+def server():
+    with FakeChatServer(spaces=250, members_per_space=30, seed=1) as server:
+        yield server
+
+
+@pytest.fixture
+def api(server):
+    return server.client()
+
+
+def _room(server):
+    return next(name for name, space in server.state.spaces.items() if space['type'] == 'ROOM')
+
+
+def test_datasets_are_seeded():
+    first = FakeChatServer(spaces=20, seed=3)
+    second = FakeChatServer(spaces=20, seed=3)
+    try:
+        assert first.state.spaces == second.state.spaces
+        assert first.state.memberships == second.state.memberships
+    finally:
+        first.stop()  # Returns, although the server was never started
+        second.stop()
+
+
+def test_list_spaces_pages_through_all_spaces(api, server):
+    spaces = api.list_spaces(page_size=40)
+    assert [space['name'] for space in spaces] == list(server.state.spaces)
+    assert server.request_counts['GET'] == 7
+
+
+def test_list_and_get_memberships(api, server):
+    room = _room(server)
+    memberships = api.list_memberships(room, page_size=7)
+    assert len(memberships) == 30
+    assert api.get_membership(memberships[0]['name']) == memberships[0]
+
+
+def test_missing_resources_return_404(api):
+    with pytest.raises(HttpError) as info:
+        api.get_space('spaces/missing')
+    assert info.value.resp.status == 404
+
+
+def test_thread_keys_reuse_threads(api, server):
+    room = _room(server)
+    first = api.create_message({'text': 'one'}, room, thread_key='build-42')
+    second = api.create_message({'text': 'two'}, room, thread_key='build-42')
+    other = api.create_message({'text': 'three'}, room)
+    assert first['thread']['name'] == second['thread']['name']
+    assert other['thread']['name'] != first['thread']['name']
+    assert api.get_message(second['name'])['text'] == 'two'
+
+
+def test_update_honours_update_mask(api, server):
+    room = _room(server)
+    message = api.create_message({'text': 'before', 'cards': [{'sections': []}]}, room)
+    updated = api.update_message(message['name'], {'text': 'after'})
+    assert updated['text'] == 'after'
+    assert 'cards' not in updated  # Masked fields missing from the body are cleared
+
+    api.delete_message(message['name'])
+    with pytest.raises(HttpError):
+        api.get_message(message['name'])
+
+
+def test_batch_requests(api, server):
+    room = _room(server)
+    batch = api.batch()
+    for i in range(3):
+        batch.create_message({'text': str(i)}, room)
+    batch.delete_message(room + '/messages/missing')
+    results = batch.execute()
+    assert [result.response['text'] for result in results[:3]] == ['0', '1', '2']
+    assert results[3].exception.resp.status == 404
+    assert server.request_counts == {'POST': 1}
+
+
+def test_injected_failures(api, server):
+    server.fail_next(429)
+    with pytest.raises(HttpError) as info:
+        api.list_spaces()
+    assert info.value.resp.status == 429
+    assert info.value.resp['retry-after'] == '1'
+    assert len(api.list_spaces()) == 250
+
+
+def test_error_rates_are_reproducible():
+    def statuses():
+        with FakeChatServer(spaces=5, error_rate=0.3, rate_limit_rate=0.2, seed=7) as server:
+            api = server.client()
+            results = []
+            for _ in range(20):
+                try:
+                    api.get_space(next(iter(server.state.spaces)))
+                    results.append(200)
+                except HttpError as e:
+                    results.append(e.resp.status)
+            return results
+
+    first = statuses()
+    assert first == statuses()
+    assert {200, 429, 503} <= set(first)
+
+
+def test_root_url_environment_variable(server, monkeypatch):
+    monkeypatch.setenv('HANGOUTS_CHAT_ROOT_URL', server.root_url)
+    api = HangoutsChatAPI(credentials=AnonymousCredentials())
+    assert api.root_url == server.root_url
+    assert len(api.list_spaces()) == 250
+
+
+def test_async_client(server):
+    async def main():
+        async with server.async_client() as api:
+            return await api.list_memberships(_room(server), page_size=10)
+
+    assert len(asyncio.run(main())) == 30
@@ -113,3 +113,41 @@ def test_exception_during_event_handling(mocker, handler, create_event):
     handler.handle_chat_event(event)
     handler.handle_exception.call_count == 1
 
+
+def test_concurrent_events_keep_their_own_state(create_event):
+    import threading
+    barrier = threading.Barrier(2, timeout=5)
+
+    class ThreadedHandler(HangoutsChatHandler):
+        def handle_message(self, message, **kwargs):
+            # Both threads are inside the handler before either reads its state
+            barrier.wait()
+            return (message['text'], self.sent_asynchronously)
+
+    handler = ThreadedHandler()
+    results = {}
+
+    def handle(text, sent_asynchronously):
+        event = create_event(event_type='MESSAGE', message_text=text)
+        results[text] = handler.handle_chat_event(event, sent_asynchronously=sent_asynchronously)
+
+    threads = [threading.Thread(target=handle, args=('sync', False)),
+               threading.Thread(target=handle, args=('async', True))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {'sync': ('sync', False), 'async': ('async', True)}
+    assert handler.sent_asynchronously is False
+
+def test_dispatch_table_is_built_per_subclass():
+    class RoomOnly(Enum):
+        ROOM = 'ROOM'
+
+    class RoomHandler(HangoutsChatHandler):
+        SpaceType = RoomOnly
+
+    _, spaces = RoomHandler._get_dispatch_table()
+    assert spaces == {'ROOM': RoomOnly.ROOM}
+    _, spaces = HangoutsChatHandler._get_dispatch_table()
+    assert spaces['DM'] is SpaceType.DIRECT_MESSAGE
@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ['googleapiclient', 'google.auth', 'httplib2', 'pkg_resources', 'aiohttp',
+                 'orjson']
+
+
+def loaded_modules(statement):
+    code = '{}\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))'.format(statement)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return set(json.loads(output.decode('utf-8').splitlines()[-1]))
+
+
+@pytest.mark.parametrize('statement', [
+    'import hangouts_helper',
+    'from hangouts_helper.message import Message',
+    'from hangouts_helper.handler import HangoutsChatHandler',
+    'from hangouts_helper.api import HangoutsChatAPI',
+    'from hangouts_helper.scheduler import OutboundScheduler',
+])
+def test_import_does_not_load_heavy_dependencies(statement):
+    modules = loaded_modules(statement)
+    assert not [m for m in HEAVY_MODULES if m in modules]
+
+
+def test_submodules_are_loaded_lazily():
+    modules = loaded_modules('import hangouts_helper')
+    assert 'hangouts_helper.message' not in modules
+    modules = loaded_modules('import hangouts_helper\nhangouts_helper.message.Message')
+    assert 'hangouts_helper.message' in modules
+    assert 'hangouts_helper.handler' not in modules
@@ -0,0 +1,87 @@
+import contextlib
+
+import pytest
+
+from hangouts_helper import instrumentation
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.message import Message
+
+
+@pytest.fixture
+def instruments():
+    spans = []
+
+    @contextlib.contextmanager
+    def tracer(name, attributes):
+        spans.append((name, attributes))
+        yield
+
+    instruments = instrumentation.enable(tracer=tracer)
+    instruments.spans = spans
+    yield instruments
+    instrumentation.disable()
+
+
+class Handler(HangoutsChatHandler):
+    def handle_message(self, message, event):
+        if message['text'] == 'fail':
+            raise ValueError(message['text'])
+        return Message(text=message['text'])
+
+
+def message_event(text):
+    return {'type': 'MESSAGE', 'space': {'name': 'spaces/A', 'type': 'ROOM'},
+            'message': {'text': text}}
+
+
+def test_event_latency_and_exceptions(instruments):
+    handler = Handler()
+    handler.handle_chat_event(message_event('hi'))
+    handler.handle_chat_event(message_event('fail'))
+    with pytest.raises(ValueError):
+        handler.handle_chat_event(b'not json')
+    registry = instruments.registry
+    assert registry.event_duration.count(('MESSAGE',)) == 2
+    assert registry.event_exceptions.value(('MESSAGE', 'ValueError')) == 1
+    assert instruments.spans[0] == ('hangouts_chat.event', {'event_type': 'MESSAGE'})
+
+
+def test_render_time_and_payload_size(instruments):
+    message = Message(text='hello')
+    message.output()
+    data = message.to_json_bytes()
+    registry = instruments.registry
+    assert registry.render_duration.count(('Message',)) == 1
+    assert registry.payload_bytes.sum(('Message',)) == len(data)
+
+
+def test_api_request_size_is_measured_in_bytes(instruments):
+    with instruments.api_call('chat.spaces.messages.create', '{"text": "caf\u00e9 \u2615"}'):
+        pass
+    with instruments.api_call('chat.spaces.messages.create', b'{}'):
+        pass
+    assert instruments.registry.payload_bytes.sum(('api_request',)) == 21 + 2
+
+
+def test_disabled_by_default():
+    assert instrumentation.active is None
+    Handler().handle_chat_event(message_event('hi'))
+
+
+def test_prometheus_text():
+    registry = instrumentation.MetricsRegistry()
+    registry.event_duration.observe(('MESSAGE',), 0.003)
+    registry.event_duration.observe(('MESSAGE',), 2.0)
+    registry.event_exceptions.inc(('CARD_CLICKED', 'Key"Error'))
+    lines = registry.prometheus_text().splitlines()
+    assert '# TYPE hangouts_helper_event_duration_seconds histogram' in lines
+    assert 'hangouts_helper_event_duration_seconds_bucket{event_type="MESSAGE",le="0.0025"} 0' \
+        in lines
+    assert 'hangouts_helper_event_duration_seconds_bucket{event_type="MESSAGE",le="0.005"} 1' \
+        in lines
+    assert 'hangouts_helper_event_duration_seconds_bucket{event_type="MESSAGE",le="+Inf"} 2' \
+        in lines
+    assert 'hangouts_helper_event_duration_seconds_count{event_type="MESSAGE"} 2' in lines
+    assert 'hangouts_helper_event_duration_seconds_sum{event_type="MESSAGE"} 2.003' in lines
+    assert ('hangouts_helper_event_exceptions_total'
+            '{event_type="CARD_CLICKED",exception="Key\\"Error"} 1') in lines
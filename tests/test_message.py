@@ -121,6 +121,122 @@ def test_pizza_bot_full_example(pizza_bot_message):
                 Image(image_url='https://maps.googleapis.com/...')),
             Section(
                 ButtonList(
-                    TextButton(text='OPEN ORDER').add_link(url='https://example.com/orders/...')))))
+                    TextButton(text='OPEN ORDER').add_link(
+                        url='https://example.com/orders/...')))))
 
     assert message.output() == pizza_bot_message
+
+def test_pizza_bot_to_json_bytes(pizza_bot_message):
+    import json
+    message = Message(
+        Card(
+            Section(
+                KeyValue(top_label='Order No.', content='12345'),
+                KeyValue(top_label='Status', content='In Delivery'))))
+    message.cards[0].header = CardHeader(
+        title='Pizza Bot Customer Support',
+        subtitle='pizzabot@example.com',
+        image_url='https://goo.gl/aeDtrS')
+    message.cards[0].add_section(
+        Section('Location', Image(image_url='https://maps.googleapis.com/...')))
+    message.cards[0].add_section(Section(ButtonList(
+        TextButton(text='OPEN ORDER').add_link(url='https://example.com/orders/...'))))
+    assert json.loads(message.to_json_bytes().decode('utf-8')) == pizza_bot_message
+
+def test_components_have_no_instance_dict():
+    components = [Message(), Card(), Section(), ButtonList(), TextButton('a'), ImageButton(),
+                  Image('https://example.com'), KeyValue('content'),
+                  CardHeader('title', 'subtitle')]
+    for component in components:
+        assert not hasattr(component, '__dict__'), type(component).__name__
+
+def test_on_click_state():
+    from enum import Enum
+    class ActionMethod(Enum):
+        TEST_METHOD = 'TEST_METHOD'
+    button = TextButton('a')
+    assert button.on_click is None and not button.link and not button.action
+    button.add_link('https://example.com')
+    assert button.link and button.link_url == 'https://example.com'
+    button.add_action(ActionMethod.TEST_METHOD, {'k': 'v'})
+    assert button.action and not button.link
+    assert button.action_method is ActionMethod.TEST_METHOD
+    assert button.action_parameters == {'k': 'v'}
+
+def test_unchanged_subtrees_are_reused():
+    import json
+    status = KeyValue(top_label='Status', content='Queued')
+    other = Section(KeyValue(top_label='Order No.', content='12345'))
+    card = Card(Section(status), other)
+    message = Message(card)
+    first = message.to_json_bytes()
+    cached = other._json
+    status.content = 'In Delivery'
+    second = message.to_json_bytes()
+    assert other._json is cached
+    assert json.loads(second) == message.output()
+    assert json.loads(second)['cards'][0]['sections'][0]['widgets'][0]['keyValue'] == {
+        'content': 'In Delivery', 'topLabel': 'Status'}
+    other.add_widget(TextButton('OPEN'))
+    card.header = CardHeader('Pizza Bot', 'pizzabot@example.com')
+    third = json.loads(message.to_json_bytes())
+    assert third == message.output() and third != json.loads(first)
+    assert third['cards'][0]['sections'][1]['widgets'][1] == {'textButton': {'text': 'OPEN'}}
+    assert third['cards'][0]['header']['title'] == 'Pizza Bot'
+
+def test_shared_widget_invalidates_every_parent():
+    import json
+    button = TextButton('OPEN')
+    first, second = Section(button), Section(ButtonList(button))
+    card = Card(first, second)
+    card.to_json_bytes()
+    button.add_link('https://example.com')
+    sections = json.loads(card.to_json_bytes())['sections']
+    assert sections[0]['widgets'][0]['textButton']['onClick']
+    assert sections[1]['widgets'][0]['buttons'][0]['textButton']['onClick']
+
+def test_output_is_new_on_each_call():
+    message = Message(Card(Section(TextButton('OPEN'))), text='hi')
+    output = message.output()
+    output['thread'] = {'name': 'spaces/A/threads/B'}
+    output['cards'][0]['sections'][0]['widgets'].clear()
+    message.to_json_bytes()
+    output = message.output()
+    assert 'thread' not in output
+    assert output['cards'][0]['sections'][0]['widgets'] == [{'textButton': {'text': 'OPEN'}}]
+
+def test_changing_children_in_place_invalidates():
+    import json
+    section = Section(TextButton('a'))
+    buttons = ButtonList()
+    card = Card(section, Section(buttons))
+    for change in (lambda: section.widgets.append(TextButton('b')),
+                   lambda: section.widgets.__setitem__(0, TextButton('c')),
+                   lambda: section.widgets.sort(key=lambda w: w.text),
+                   lambda: section.widgets.pop(),
+                   lambda: buttons.buttons.extend([TextButton('d')]),
+                   lambda: card.sections.reverse()):
+        card.to_json_bytes()
+        change()
+        assert json.loads(card.to_json_bytes()) == card.output()
+    section.widgets = [TextButton('e')]
+    section.widgets.append(TextButton('f'))
+    del card.sections[0]
+    assert json.loads(card.to_json_bytes()) == card.output() == {'sections': [
+        {'widgets': [{'textButton': {'text': 'e'}}, {'textButton': {'text': 'f'}}]}]}
+
+def test_copies_and_pickles_rebuild_the_cache():
+    import copy
+    import pickle
+    text = TextButton('a')
+    message = Message(Card(Section(text, ButtonList(TextButton('b')))))
+    expected = message.to_json_bytes()
+    for clone in (copy.deepcopy(message), pickle.loads(pickle.dumps(message))):
+        assert clone.to_json_bytes() == expected
+        section = clone.cards[0].sections[0]
+        section.widgets[0].text = 'zz'
+        section.widgets[1].buttons.append(TextButton('c'))
+        assert b'"zz"' in clone.to_json_bytes() and b'"c"' in clone.to_json_bytes()
+        assert message.to_json_bytes() == expected
+    text.text = 'y'
+    assert b'"y"' in message.to_json_bytes()
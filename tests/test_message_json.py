@@ -0,0 +1,81 @@
+import io
+import json
+from enum import Enum
+
+import pytest
+
+from hangouts_helper import message as message_module
+from hangouts_helper.message import (Message, Card, CardAction, CardHeader, Section, Image,
+    KeyValue, ButtonList, TextButton, ImageButton, TextParagraph, Icon, ImageStyle)
+
+
+class ActionMethod(Enum):
+    TEST_ACTION = 'TEST_ACTION'
+
+
+TRICKY_TEXT = 'Quote " backslash \\ tab \t newline \n control \x01 unicode é 😀 </script>'
+
+
+def components():
+    return [
+        Message(),
+        Message(text='hello'),
+        Message(text=TRICKY_TEXT),
+        Message.request_config('https://example.com/config'),
+        Message(text='updated', response_type=Message.ResponseType.UPDATE_MESSAGE),
+        Message(Card(Section(TextParagraph('card'))), text='both'),
+        CardAction('Open'),
+        CardAction('Open').add_link('https://example.com'),
+        CardAction('Run').add_action(ActionMethod.TEST_ACTION, {'id': '1', 'count': 2}),
+        Card(),
+        Card(CardHeader('Title', 'Subtitle'), Section(), CardAction('Open')),
+        CardHeader('Title', 'Subtitle'),
+        CardHeader(TRICKY_TEXT, 'Subtitle', image_url='https://example.com/a.png',
+                   image_style=ImageStyle.AVATAR),
+        Section(),
+        Section('Header', TextParagraph('a'), TextParagraph('b')),
+        ButtonList(),
+        ButtonList(TextButton('A'), ImageButton(icon=Icon.STAR)),
+        TextParagraph(TRICKY_TEXT),
+        KeyValue('content'),
+        KeyValue('multi\nline', top_label='Top', bottom_label='Bottom', icon=Icon.EMAIL),
+        KeyValue('content', icon_url='https://example.com/icon.png',
+                 button={'textButton': {'text': 'Raw'}}),
+        KeyValue('content').add_action(ActionMethod.TEST_ACTION),
+        Image('https://example.com/a.png'),
+        Image('https://example.com/a.png', aspect_ratio=1.5).add_link('https://example.com'),
+        ImageButton(),
+        ImageButton(name='Only name'),
+        ImageButton().add_link('https://example.com'),
+        ImageButton(icon_url='https://example.com/icon.png', name='Tooltip').add_action(
+            ActionMethod.TEST_ACTION, {'key': TRICKY_TEXT}),
+        TextButton('Text'),
+        TextButton('Text').add_link('https://example.com'),
+    ]
+
+
+def expected_bytes(component):
+    return json.dumps(component.output(), ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+@pytest.fixture(params=['default', 'stdlib'])
+def backend(request, monkeypatch):
+    if request.param == 'stdlib':
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        monkeypatch.setattr(message_module, '_dumps',
+                            lambda value: encoder.encode(value).encode('utf-8'))
+    return request.param
+
+
+@pytest.mark.parametrize('component', components(), ids=lambda c: type(c).__name__)
+def test_to_json_bytes_matches_output(backend, component):
+    assert component.to_json_bytes() == expected_bytes(component)
+
+
+@pytest.mark.parametrize('component', components(), ids=lambda c: type(c).__name__)
+def test_write_json_streams_same_bytes(backend, component):
+    fp = io.BytesIO()
+    component.write_json(fp)
+    assert fp.getvalue() == expected_bytes(component)
+
@@ -0,0 +1,104 @@
+import gzip
+import json
+import time
+
+import pytest
+
+from hangouts_helper.actions import ActionRegistry
+from hangouts_helper.async_handler import AsyncHangoutsChatHandler
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.message import Message
+from hangouts_helper.replay import (
+    ReplayStats, action_names, load_handler, main, read_events, replay, synthetic_events)
+
+
+class EchoHandler(HangoutsChatHandler):
+    actions = ActionRegistry()
+
+    def handle_message(self, message, **kwargs):
+        if 'fail' in message['text']:
+            raise RuntimeError('failed')
+        return Message(text=message['text'])
+
+    @actions.action('SHOW', row=int)
+    def show(self, event, row):
+        return {'text': str(row)}
+
+
+class AsyncEchoHandler(AsyncHangoutsChatHandler):
+    async def handle_message(self, message, **kwargs):
+        return Message(text=message['text'])
+
+
+def _events(*texts):
+    return [json.dumps({'type': 'MESSAGE', 'space': {'name': 'spaces/A', 'type': 'ROOM'},
+                        'user': {'type': 'HUMAN'}, 'message': {'text': text}}).encode('utf-8')
+            for text in texts]
+
+
+@pytest.mark.parametrize('mode', ['threads', 'processes', 'asyncio'])
+def test_replay_modes(mode):
+    stats = replay(EchoHandler, _events('a', 'fail', 'b', 'c'), mode=mode, concurrency=2)
+    summary = stats.summary()
+    assert summary['events'] == 4
+    assert summary['error_rate'] == 0.25
+    message = summary['types']['MESSAGE']
+    assert message['errors'] == {'RuntimeError': 1}
+    assert set(message['latency']) == {'p50', 'p95', 'p99', 'max', 'mean'}
+    assert message['response_bytes']['total'] == 3 * len(b'{"text":"a"}') + 2
+
+
+def test_replay_async_handler():
+    stats = replay(AsyncEchoHandler, _events('a', 'b'), mode='asyncio', concurrency=4)
+    assert stats.summary()['types']['MESSAGE']['count'] == 2
+    assert replay(AsyncEchoHandler, _events('a'), mode='threads').count == 1
+
+
+def test_invalid_events_are_errors():
+    stats = replay(EchoHandler, [b'not json'])
+    assert stats.summary()['types']['INVALID']['error_rate'] == 1.0
+
+
+def test_rate_limits_events():
+    start = time.monotonic()
+    replay(EchoHandler, _events(*'abcdef'), rate=50)
+    assert time.monotonic() - start >= 0.1
+
+
+def test_synthetic_events_cover_actions():
+    events = [json.loads(body) for body in synthetic_events(500, action_names=['SHOW'])]
+    types = {event['type'] for event in events}
+    assert types == {'MESSAGE', 'CARD_CLICKED', 'ADDED_TO_SPACE', 'REMOVED_FROM_SPACE'}
+    stats = replay(EchoHandler, synthetic_events(500, action_names=action_names(EchoHandler)))
+    assert stats.summary()['error_rate'] == 0
+    assert 'CARD_CLICKED' not in {
+        json.loads(body)['type'] for body in synthetic_events(100)}
+
+
+def test_read_events_streams_gzip(tmp_path):
+    path = tmp_path / 'events.jsonl.gz'
+    with gzip.open(str(path), 'wb') as fp:
+        fp.write(b'\n'.join(_events('a', 'b')) + b'\n\n')
+    assert list(read_events(str(path))) == _events('a', 'b')
+
+
+def test_report_format():
+    stats = ReplayStats()
+    stats.record('MESSAGE', 0.002, 100)
+    stats.record('MESSAGE', 0.004, 120, 'ValueError')
+    text = stats.format()
+    assert 'MESSAGE' in text and '50.00%' in text
+    assert text.splitlines()[-2].startswith('all')
+
+
+def test_load_handler():
+    assert load_handler('test_replay:EchoHandler') is EchoHandler
+    with pytest.raises(ValueError):
+        load_handler('test_replay.EchoHandler')
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / 'events.jsonl'
+    path.write_bytes(b'\n'.join(_events('a', 'b', 'c')))
+    main(['test_replay:EchoHandler', str(path), '--limit', '2', '--json'])
+    assert json.loads(capsys.readouterr().out)['events'] == 2
@@ -0,0 +1,119 @@
+import pytest
+
+from hangouts_helper.handler import HangoutsChatHandler
+from hangouts_helper.router import CommandRouter, command_text
+
+
+class RoutedHandler(HangoutsChatHandler):
+    router = CommandRouter()
+
+    @router.command('help', '?')
+    def help(self, event, *topics):
+        return ('help', topics)
+
+    @router.command('order pizza')
+    def order_pizza(self, event, size='large', *toppings):
+        return ('pizza', size, toppings)
+
+    @router.command('order')
+    def order(self, event, *items):
+        return ('order', items)
+
+    @router.pattern(r'deploy (?P<service>\w+) to (?P<env>\w+)')
+    def deploy(self, event, service, env):
+        return ('deploy', service, env)
+
+    @router.pattern(r'rollback (\w+) (?P<env>\w+)', r'undo (\w+) (?P<env>\w+)')
+    def rollback(self, event, service, env):
+        return ('rollback', service, env)
+
+    def handle_message(self, message, event):
+        return ('fallback', message['text'])
+
+
+def message_event(text, **message):
+    message.setdefault('text', text)
+    return {'type': 'MESSAGE', 'space': {'name': 'spaces/A', 'type': 'ROOM'},
+            'message': message}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('help', ('help', ())),
+    ('HELP me now', ('help', ('me', 'now'))),
+    ('? billing', ('help', ('billing',))),
+    ('order pizza', ('pizza', 'large', ())),
+    ('order pizza small ham "extra cheese"', ('pizza', 'small', ('ham', 'extra cheese'))),
+    ('order pasta', ('order', ('pasta',))),
+    ('deploy api to prod', ('deploy', 'api', 'prod')),
+    ('undo web staging', ('rollback', 'web', 'staging')),
+    ('deploy api', ('fallback', 'deploy api')),
+    ('hello', ('fallback', 'hello')),
+])
+def test_routes(text, expected):
+    assert RoutedHandler().handle_chat_event(message_event(text)) == expected
+
+
+def test_bot_mention_is_stripped():
+    handler = RoutedHandler()
+    event = message_event('@Pizza Bot order pizza small', argumentText=' order pizza small')
+    assert handler.handle_chat_event(event) == ('pizza', 'small', ())
+    event = message_event('@Pizza Bot help', annotations=[
+        {'type': 'USER_MENTION', 'startIndex': 0, 'length': 10}])
+    assert handler.handle_chat_event(event) == ('help', ())
+
+
+def test_command_text_without_mention():
+    assert command_text({'text': '  status  '}) == 'status'
+
+
+def test_duplicate_command_is_rejected():
+    router = CommandRouter()
+    router.command('status')(lambda self, event: None)
+    with pytest.raises(ValueError):
+        router.command('Status')(lambda self, event: None)
+
+
+def test_case_sensitive_router():
+    router = CommandRouter(case_sensitive=True)
+    router.command('Status')(lambda self, event: 'status')
+    assert router.match_text('Status') is not None
+    assert router.match_text('status') is None
+
+
+def test_routes_added_after_matching_are_compiled():
+    router = CommandRouter()
+    router.command('one')(lambda self, event: 1)
+    assert router.match_text('two') is None
+    router.command('two')(lambda self, event: 2)
+    assert router.match_text('two').dispatch(None, None) == 2
+
+
+def test_handler_without_router_uses_handle_message(mocker):
+    mocker.patch.object(HangoutsChatHandler, 'handle_message')
+    event = message_event('help')
+    HangoutsChatHandler().handle_chat_event(event)
+    HangoutsChatHandler.handle_message.assert_called_once_with(event['message'], event=event)
+
+
+def test_patterns_with_global_flags_and_numbered_references():
+    router = CommandRouter(case_sensitive=True)
+    router.pattern(r'echo (\w+)')(lambda self, event, word: ('echo', word))
+    router.pattern(r'(?i)status')(lambda self, event: 'status')
+    router.pattern(r'say (\w+) (\w+) \1')(lambda self, event, first, second: (first, second))
+    router.pattern(r'ping (\w+)')(lambda self, event, host: ('ping', host))
+    router.pattern(r'pong (\w+)')(lambda self, event, host: ('pong', host))
+    assert router.match_text('STATUS').dispatch(None, None) == 'status'
+    assert router.match_text('say hi there hi').dispatch(None, None) == ('hi', 'there')
+    assert router.match_text('say hi there there') is None
+    assert router.match_text('echo a').dispatch(None, None) == ('echo', 'a')
+    assert router.match_text('pong b').dispatch(None, None) == ('pong', 'b')
+    assert router.match_text('PING b') is None
+
+
+def test_patterns_are_tried_in_registration_order():
+    router = CommandRouter()
+    router.pattern(r'(\w+) now')(lambda self, event, word: 'first')
+    router.pattern(r'(?s)deploy now')(lambda self, event: 'second')
+    router.pattern(r'deploy (\w+)')(lambda self, event, when: 'third')
+    assert router.match_text('deploy now').dispatch(None, None) == 'first'
+    assert router.match_text('deploy later').dispatch(None, None) == 'third'
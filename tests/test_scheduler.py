@@ -0,0 +1,158 @@
+import threading
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from hangouts_helper.scheduler import OutboundScheduler, TokenBucket
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+
+class FakeAPI:
+    """ Records calls, failing with the queued errors first. """
+
+    def __init__(self, errors=(), delay=0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, method, *args):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append((method,) + args)
+            if self.errors:
+                raise self.errors.pop(0)
+        return {'method': method, 'args': args}
+
+    def create_message(self, message, space_name, thread_id=None, thread_key=None):
+        return self._call('create_message', message['text'], space_name)
+
+    def update_message(self, name, message):
+        return self._call('update_message', name, message['text'])
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def _make_scheduler(api, **kwargs):
+        kwargs.setdefault('space_rate', 1000)
+        kwargs.setdefault('global_rate', 1000)
+        kwargs.setdefault('backoff_base', 0.01)
+        scheduler = OutboundScheduler(api, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+    yield _make_scheduler
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def test_token_bucket_wait_time():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, timer=lambda: now[0])
+    bucket.consume()
+    bucket.consume()
+    assert bucket.wait_time() == pytest.approx(0.5)
+    now[0] = 0.5
+    assert bucket.wait_time() == 0
+
+
+def test_retries_throttled_and_server_errors(make_scheduler):
+    api = FakeAPI(errors=[http_error(429), http_error(503)])
+    scheduler = make_scheduler(api)
+    future = scheduler.create_message({'text': 'hi'}, 'spaces/AAA')
+    assert future.result(timeout=5) == {'method': 'create_message', 'args': ('hi', 'spaces/AAA')}
+    assert len(api.calls) == 3
+    assert scheduler.metrics()['retried'] == 2
+
+
+def test_client_errors_are_not_retried(make_scheduler):
+    api = FakeAPI(errors=[http_error(400)])
+    scheduler = make_scheduler(api)
+    future = scheduler.create_message({'text': 'hi'}, 'spaces/AAA')
+    with pytest.raises(HttpError):
+        future.result(timeout=5)
+    assert len(api.calls) == 1
+    assert scheduler.metrics()['failed'] == 1
+
+
+def test_gives_up_after_max_retries(make_scheduler):
+    api = FakeAPI(errors=[http_error(429)] * 3)
+    scheduler = make_scheduler(api, max_retries=2)
+    with pytest.raises(HttpError):
+        scheduler.create_message({'text': 'hi'}, 'spaces/AAA').result(timeout=5)
+    assert len(api.calls) == 3
+
+
+def test_queued_updates_to_same_message_are_coalesced(make_scheduler):
+    api = FakeAPI()
+    scheduler = make_scheduler(api, space_rate=1, space_burst=1)
+    # The first call uses the only token for the space, so the updates queue up
+    scheduler.create_message({'text': 'first'}, 'spaces/AAA').result(timeout=5)
+    futures = [scheduler.update_message('spaces/AAA/messages/1', {'text': str(i)})
+               for i in range(5)]
+    assert len(set(futures)) == 1
+    assert futures[0].result(timeout=5)['args'] == ('spaces/AAA/messages/1', '4')
+    assert [c[0] for c in api.calls] == ['create_message', 'update_message']
+    assert scheduler.metrics()['coalesced'] == 4
+
+
+def test_update_during_retry_is_sent_instead_of_the_stale_one(make_scheduler, monkeypatch):
+    monkeypatch.setattr('hangouts_helper.scheduler.random.uniform', lambda low, high: high)
+    api = FakeAPI(errors=[http_error(429)])
+    scheduler = make_scheduler(api, backoff_base=0.2)
+    first = scheduler.update_message('spaces/AAA/messages/1', {'text': 'v1'})
+    while not api.calls:
+        time.sleep(0.001)
+    time.sleep(0.01)  # v1 got a 429 and waits to be retried
+    second = scheduler.update_message('spaces/AAA/messages/1', {'text': 'v2'})
+    assert first.result(timeout=5) == second.result(timeout=5)
+    assert [c[2] for c in api.calls] == ['v1', 'v2']
+
+
+def test_updates_made_while_sending_are_sent_afterwards(make_scheduler):
+    api = FakeAPI(errors=[http_error(503)], delay=0.05)
+    scheduler = make_scheduler(api)
+    first = scheduler.update_message('spaces/AAA/messages/1', {'text': 'v1'})
+    time.sleep(0.02)  # v1 is being sent, and fails with a 503
+    second = scheduler.update_message('spaces/AAA/messages/1', {'text': 'v2'})
+    assert first.result(timeout=5)['args'] == ('spaces/AAA/messages/1', 'v2')
+    assert second.result(timeout=5)['args'] == ('spaces/AAA/messages/1', 'v2')
+    # v4 is merged into v3 if v3 is still queued, or sent after it otherwise
+    scheduler.update_message('spaces/AAA/messages/1', {'text': 'v3'})
+    fourth = scheduler.update_message('spaces/AAA/messages/1', {'text': 'v4'})
+    assert fourth.result(timeout=5)['args'][1] == 'v4'
+    assert [c[2] for c in api.calls][-1] == 'v4'
+    assert scheduler.queue_depth == 0
+
+
+def test_space_rate_limit(make_scheduler):
+    api = FakeAPI()
+    scheduler = make_scheduler(api, space_rate=20, space_burst=1)
+    start = time.monotonic()
+    futures = [scheduler.create_message({'text': str(i)}, 'spaces/AAA') for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+    # One burst token, then four more at 20 per second
+    assert time.monotonic() - start >= 0.19
+
+
+def test_shutdown_drains_queue_and_reports_metrics():
+    api = FakeAPI(delay=0.01)
+    scheduler = OutboundScheduler(api, workers=2, space_rate=1000, global_rate=1000)
+    futures = [scheduler.create_message({'text': str(i)}, 'spaces/{}'.format(i))
+               for i in range(20)]
+    assert scheduler.queue_depth > 0
+    scheduler.shutdown()
+    assert all(f.done() for f in futures)
+    metrics = scheduler.metrics()
+    assert metrics['sent'] == 20
+    assert metrics['queue_depth'] == 0
+    assert metrics['latency']['max'] >= metrics['latency']['p50'] > 0
+    with pytest.raises(RuntimeError):
+        scheduler.create_message({'text': 'late'}, 'spaces/AAA')
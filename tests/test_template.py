@@ -0,0 +1,60 @@
+from enum import Enum
+
+from hangouts_helper.message import (Message, Card, CardHeader, Section,
+    Image, KeyValue, ButtonList, TextButton)
+from hangouts_helper.template import Placeholder, compile_template
+
+
+class ActionMethod(Enum):
+    OPEN = 'OPEN'
+
+
+def pizza_message(order, status, url):
+    return Message(
+        Card(
+            CardHeader(
+                title='Pizza Bot Customer Support',
+                subtitle='pizzabot@example.com',
+                image_url='https://goo.gl/aeDtrS'),
+            Section(
+                KeyValue(top_label='Order No.', content=order),
+                KeyValue(top_label='Status', content=status)),
+            Section(
+                'Location',
+                Image(image_url='https://maps.googleapis.com/...')),
+            Section(
+                ButtonList(
+                    TextButton(text='OPEN ORDER').add_link(url=url),
+                    TextButton(text='TRACK').add_action(
+                        ActionMethod.OPEN, {'order': order})))))
+
+
+def test_render_matches_output():
+    template = pizza_message(
+        Placeholder('order'), Placeholder('status'), Placeholder('url')).compile()
+    assert template.placeholders == {'order', 'status', 'url'}
+    rendered = template.render(order='12345', status='In Delivery', url='https://example.com/1')
+    assert rendered == pizza_message('12345', 'In Delivery', 'https://example.com/1').output()
+
+
+def test_multiline_content_is_decided_when_rendering():
+    template = compile_template(KeyValue(content=Placeholder('content', default='a\nb')))
+    assert template.render(content='one line') == {'keyValue': {'content': 'one line'}}
+    assert template.render(content='two\nlines') == {
+        'keyValue': {'content': 'two\nlines', 'contentMultiline': True}}
+
+
+def test_renders_do_not_share_state():
+    template = compile_template(Section(TextButton(Placeholder('text'))))
+    first = template.render(text='a')
+    first['widgets'].append('changed')
+    assert template.render(text='b') == {'widgets': [{'textButton': {'text': 'b'}}]}
+
+
+def test_non_finite_floats_are_rendered():
+    class Component:
+        def output(self):
+            return {'values': [float('inf'), float('-inf'), 1.5], 'text': Placeholder('text')}
+
+    rendered = compile_template(Component()).render(text='a')
+    assert rendered == {'values': [float('inf'), float('-inf'), 1.5], 'text': 'a'}
@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+from hangouts_helper.fake_server import FakeChatServer
+from hangouts_helper.tokens import TokenFileCache, TokenManager, cache_key
+
+
+@pytest.fixture
+def server():
+    with FakeChatServer(spaces=3) as server:
+        yield server
+
+
+def test_threads_share_one_refresh(server):
+    manager = TokenManager(server.oauth_credentials())
+    barrier = threading.Barrier(8)
+
+    def refresh():
+        barrier.wait()
+        manager.refresh()
+
+    threads = [threading.Thread(target=refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.token_requests == 1
+    assert manager.credentials.token == 'fake-token-1'
+    assert manager.credentials.valid
+
+
+def test_api_uses_shared_token(server):
+    with TokenManager(server.oauth_credentials()) as manager:
+        first = server.client(credentials=manager.credentials)
+        second = server.client(credentials=manager.credentials)
+        first.list_spaces()
+        second.list_spaces()
+    assert server.authorization == 'Bearer fake-token-1'
+    assert server.token_requests == 1
+
+
+def _refresh_in_process(token_uri, cache_dir, start, results):
+    credentials = Credentials(None, refresh_token='r', token_uri=token_uri, client_id='c',
+                              client_secret='s')
+    manager = TokenManager(credentials, cache_dir=cache_dir)
+    start.wait()
+    manager.refresh()
+    results.put(manager.credentials.token)
+
+
+def test_processes_share_token_through_file_cache(server, tmp_path):
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_refresh_in_process,
+                        args=(server.token_uri, str(tmp_path), start, results))
+        for _ in range(4)]
+    for process in processes:
+        process.start()
+    start.set()
+    tokens = {results.get(timeout=10) for _ in processes}
+    for process in processes:
+        process.join()
+    assert tokens == {'fake-token-1'}
+    assert server.token_requests == 1
+    path = os.path.join(str(tmp_path), 'token-{}.json'.format(
+        cache_key(Credentials(None, client_id='c'))))
+    assert os.stat(path).st_mode & 0o077 == 0
+
+
+def test_expired_cached_token_is_refreshed(server, tmp_path):
+    source = server.oauth_credentials()
+    cache = TokenFileCache(os.path.join(str(tmp_path), 'token-{}.json'.format(cache_key(source))))
+    cache.write('stale-token', time.time() + 60)  # Within the refresh margin
+    manager = TokenManager(source, cache_dir=str(tmp_path))
+    manager.refresh()
+    assert manager.credentials.token == 'fake-token-1'
+    assert cache.read()[0] == 'fake-token-1'
+
+
+def test_background_refresh_before_expiry():
+    with FakeChatServer(spaces=1, token_lifetime=2) as server:
+        with TokenManager(server.oauth_credentials()) as manager:
+            assert manager.credentials.token == 'fake-token-1'
+            deadline = time.monotonic() + 5
+            while server.token_requests < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+        assert manager.credentials.token == 'fake-token-2'
+
+
+def test_failed_refresh_can_be_retried(server):
+    server.fail_next(400)
+    manager = TokenManager(server.oauth_credentials())
+    with pytest.raises(RefreshError):
+        manager.refresh()
+    manager.refresh()
+    assert manager.credentials.token == 'fake-token-1'
+
+
+def test_file_lock_is_closed_when_locking_fails(tmp_path, mocker):
+    fcntl = pytest.importorskip('fcntl')
+    closed = []
+    close = os.close
+    mocker.patch('os.close', side_effect=lambda fd: closed.append(fd) or close(fd))
+    mocker.patch.object(fcntl, 'flock', side_effect=InterruptedError)
+    lock = TokenFileCache(str(tmp_path / 'token.json')).lock()
+    with pytest.raises(InterruptedError):
+        with lock:
+            pass
+    assert len(closed) == 1 and lock.fd is None
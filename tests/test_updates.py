@@ -0,0 +1,121 @@
+from concurrent.futures import Future
+
+from hangouts_helper.fake_server import FakeChatServer
+from hangouts_helper.message import Card, KeyValue, Message, Section
+from hangouts_helper.scheduler import _merge_updates
+from hangouts_helper.updates import MessageUpdater, message_diff
+
+
+class FakeAPI:
+    def __init__(self):
+        self.calls = []
+
+    def create_message(self, message, space_name, thread_id=None, thread_key=None):
+        self.calls.append(('create', message))
+        return dict(message, name=space_name + '/messages/1')
+
+    def update_message(self, name, message, update_mask='text,cards'):
+        self.calls.append(('update', message, update_mask))
+        return dict(message, name=name)
+
+
+class FutureAPI(FakeAPI):
+    """ Returns futures, like `OutboundScheduler`, and keeps them to be completed later. """
+
+    def __init__(self):
+        super().__init__()
+        self.futures = []
+
+    def update_message(self, name, message, update_mask='text,cards'):
+        self.calls.append(('update', message, update_mask))
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+def progress_card(percent, text='Deploying'):
+    section = Section(KeyValue(top_label='Progress', content='{}%'.format(percent)))
+    return Message(Card(section), text=text)
+
+
+def test_message_diff():
+    before = progress_card(10).output()
+    assert message_diff(before, progress_card(10).output()) is None
+    body, mask = message_diff(before, progress_card(20).output())
+    assert mask == 'cards' and list(body) == ['cards']
+    body, mask = message_diff(before, {'text': 'Done'})
+    assert mask == 'text,cards' and body == {'text': 'Done'}  # The cards are cleared
+    assert message_diff(None, {'text': 'Done'}) == ({'text': 'Done'}, 'text,cards')
+
+
+def test_updater_skips_unchanged_updates():
+    api = FakeAPI()
+    updater = MessageUpdater(api)
+    name = updater.create_message(progress_card(0), 'spaces/A')['name']
+    for percent in (0, 0, 50, 50, 100):
+        updater.update_message(name, progress_card(percent))
+    updater.update_message(name, progress_card(100, text='Done'))
+    masks = [call[2] for call in api.calls if call[0] == 'update']
+    assert masks == ['cards', 'cards', 'text']
+    assert api.calls[-1][1] == {'text': 'Done'}
+    stats = updater.stats()
+    assert stats['sent'] == 3 and stats['skipped'] == 3 and stats['tracked'] == 1
+
+
+def test_unknown_message_gets_full_update():
+    api = FakeAPI()
+    updater = MessageUpdater(api)
+    updater.update_message('spaces/A/messages/9', {'text': 'hi'})
+    assert api.calls == [('update', {'text': 'hi'}, 'text,cards')]
+    updater.forget('spaces/A/messages/9')
+    updater.update_message('spaces/A/messages/9', {'text': 'hi'})
+    assert len(api.calls) == 2
+
+
+def test_failed_delivery_is_not_remembered():
+    api = FutureAPI()
+    updater = MessageUpdater(api)
+    name = updater.create_message(progress_card(0), 'spaces/A')['name']
+    updater.update_message(name, progress_card(50))
+    api.futures[0].set_exception(ConnectionError('Connection reset'))
+    # The failed update was not delivered, so the same update is sent again
+    assert updater.update_message(name, progress_card(50)) is not None
+    api.futures[1].set_result({'name': name})
+    assert updater.update_message(name, progress_card(50)) is None
+    masks = [call[2] for call in api.calls if call[0] == 'update']
+    assert masks == ['cards', 'cards']
+
+
+def test_updates_in_flight_send_every_field():
+    api = FutureAPI()
+    updater = MessageUpdater(api)
+    name = updater.create_message(progress_card(0), 'spaces/A')['name']
+    updater.update_message(name, progress_card(50))
+    updater.update_message(name, progress_card(0))  # Back to the state of the last delivery
+    api.futures[1].set_result({'name': name})
+    api.futures[0].set_result({'name': name})  # Completing late doesn't replace the newer state
+    assert updater.update_message(name, progress_card(0)) is None
+    masks = [call[2] for call in api.calls if call[0] == 'update']
+    assert masks == ['cards', 'text,cards']
+
+
+def test_updater_with_fake_server():
+    with FakeChatServer(spaces=1) as server:
+        api = server.client()
+        updater = MessageUpdater(api)
+        space = next(iter(server.state.spaces))
+        name = updater.create_message(progress_card(0), space)['name']
+        updater.update_message(name, progress_card(0))
+        updater.update_message(name, progress_card(40))
+        stored = api.get_message(name)
+        assert stored['text'] == 'Deploying'
+        assert stored['cards'] == progress_card(40).output()['cards']
+        assert server.request_counts == {'POST': 1, 'PUT': 1, 'GET': 1}
+
+
+def test_scheduler_merges_partial_updates():
+    assert _merge_updates(('m', {'text': 'a'}), ('m', {'text': 'b'})) == ('m', {'text': 'b'})
+    merged = _merge_updates(('m', {'text': 'a', 'cards': [1]}), ('m', {'cards': [2]}, 'cards'))
+    assert merged == ('m', {'text': 'a', 'cards': [2]}, 'cards,text')
+    merged = _merge_updates(('m', {'text': 'a'}, 'text'), ('m', {}, 'cards'))
+    assert merged == ('m', {'text': 'a'}, 'cards,text')